@@ -7,17 +7,365 @@ from tkinter import *
 from tkinter import ttk
 from tkinter import messagebox, simpledialog, filedialog
 import csv
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import stock_data
-from stock_class import Stock, DailyData
+import stock_db
+import stock_cache
+from stock_class import Stock, DailyData, Portfolio
+from stock_valuation import PortfolioSnapshot, cached_valuation, value_snapshot
 from utilities import clear_screen, display_stock_chart, sortStocks, sortDailyData
 
+HISTORY_PAGE_ROWS = 15 # rows of history shown (and formatted) at a time
+BACKGROUND_WORKERS = 2 # threads for long operations (load, save, web, import)
+POLL_MS = 50           # how often the UI thread checks for worker messages
+
+
+# Raised inside a background operation when the user presses Cancel
+class OperationCancelled(Exception):
+    pass
+
+
+# Runs long operations on a worker pool so the window keeps responding. Only
+# one operation runs at a time; starting another while one is busy is refused.
+# Workers never touch widgets: they put messages on a thread-safe queue, which
+# the UI thread drains every POLL_MS milliseconds to move the progress bar and,
+# when the operation ends, to call its on_done callback with the result.
+class BackgroundTasks:
+    def __init__(self, root, parent):
+        self.root = root
+        self.executor = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix="StockApp")
+        self.messages = queue.Queue()
+        self.cancel_requested = threading.Event()
+        self.name = None # title of the running operation
+        self.on_done = None
+        self.on_error = None
+
+        self.frame = ttk.Frame(parent)
+        self.statusLabel = ttk.Label(self.frame, text="Ready", width=40)
+        self.statusLabel.pack(side="left")
+        self.progressBar = ttk.Progressbar(self.frame, mode="determinate", length=200)
+        self.progressBar.pack(side="left", fill="x", expand=True, padx=10)
+        self.cancelButton = ttk.Button(self.frame, text="Cancel", command=self.cancel, state="disabled")
+        self.cancelButton.pack(side="right")
+
+    @property
+    def busy(self):
+        return self.name is not None
+
+    # True if no operation is running; otherwise tell the user and return False
+    def check_idle(self, title):
+        if self.busy:
+            messagebox.showwarning(title, f"Please wait for \"{self.name}\" to finish or cancel it.")
+            return False
+        return True
+
+    # Run work(progress) on a worker thread. work calls progress(text, done, total)
+    # to report how far it got (and to give Cancel a chance to stop it).
+    # on_done(result) and on_error(exception) are called on the UI thread.
+    def start(self, title, work, on_done, on_error=None):
+        if not self.check_idle(title):
+            return False
+        self.name = title
+        self.on_done = on_done
+        self.on_error = on_error
+        self.cancel_requested.clear()
+        self.statusLabel["text"] = title + "..."
+        self.progressBar.config(mode="indeterminate", value=0)
+        self.progressBar.start(10)
+        self.cancelButton.config(state="normal")
+        self.executor.submit(self._run, work)
+        self.root.after(POLL_MS, self._poll)
+        return True
+
+    def cancel(self):
+        if self.busy:
+            self.cancel_requested.set()
+            self.statusLabel["text"] = "Cancelling " + self.name + "..."
+
+    # Stop taking new work; a running operation is asked to cancel
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    # Called from the worker thread
+    def _progress(self, text, done=None, total=None):
+        if self.cancel_requested.is_set():
+            raise OperationCancelled()
+        self.messages.put(("progress", text, done, total))
+
+    def _run(self, work):
+        try:
+            result = work(self._progress)
+            if self.cancel_requested.is_set():
+                raise OperationCancelled()
+        except OperationCancelled:
+            self.messages.put(("cancelled", None))
+        except Exception as e:
+            self.messages.put(("error", e))
+        else:
+            self.messages.put(("done", result))
+
+    # UI thread: apply the worker's messages
+    def _poll(self):
+        while True:
+            try:
+                message = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            kind = message[0]
+            if kind == "progress":
+                _, text, done, total = message
+                if not self.cancel_requested.is_set():
+                    self.statusLabel["text"] = text
+                if total:
+                    if str(self.progressBar["mode"]) != "determinate":
+                        self.progressBar.stop()
+                        self.progressBar.config(mode="determinate")
+                    self.progressBar.config(maximum=total, value=done)
+            else:
+                self._finish(kind, message[1])
+                return
+        self.root.after(POLL_MS, self._poll)
+
+    def _finish(self, kind, result):
+        title = self.name
+        on_done = self.on_done
+        on_error = self.on_error
+        self.name = None
+        self.on_done = None
+        self.on_error = None
+        self.progressBar.stop()
+        self.progressBar.config(mode="determinate", value=0)
+        self.cancelButton.config(state="disabled")
+        self.statusLabel["text"] = "Ready"
+        if kind == "done":
+            on_done(result)
+        elif kind == "cancelled":
+            self.statusLabel["text"] = title + " cancelled"
+            if on_error is not None:
+                on_error(None)
+        elif on_error is not None:
+            on_error(result)
+        else:
+            messagebox.showerror(title, str(result))
+
+
+# Row order and paging for a price history shown a page at a time. Only the
+# rows on the current page are ever formatted, so the cost of showing a page
+# does not depend on the length of the history. Sorting by price or volume
+# keeps an index order; sorting by date just reads the columns forwards or
+# backwards.
+class HistoryPager:
+    COLUMNS = ("date", "close", "volume")
+
+    def __init__(self, page_rows=HISTORY_PAGE_ROWS):
+        self.page_rows = page_rows
+        self.history = None
+        self.version = None
+        self.sort_column = "date"
+        self.descending = False
+        self.offset = 0 # position of the first row on the page
+        self._order = None # row indices for price/volume sorts
+
+    def __len__(self):
+        return len(self.history) if self.history is not None else 0
+
+    # Show another history from the top, keeping the sort
+    def set_history(self, history):
+        self.history = history
+        self.offset = 0
+        self._resort()
+
+    # Re-read the columns if the history changed since it was set
+    def check_changed(self):
+        if self.history is not None and self.version != self.history.version:
+            self._resort()
+            self.scroll_to(self.offset)
+            return True
+        return False
+
+    # Sort by a column; choosing the current column again reverses the order
+    def sort_by(self, column):
+        if column == self.sort_column:
+            self.descending = not self.descending
+        else:
+            self.sort_column = column
+            self.descending = column != "date" # largest prices/volumes first
+        self.offset = 0
+        self._resort()
+
+    def _resort(self):
+        self._order = None
+        if self.history is None:
+            return
+        self.version = self.history.version
+        if self.sort_column == "date":
+            return
+        column = self.history.closes if self.sort_column == "close" else self.history.volumes
+        values = np.array(column) # a copy, so the history can still grow
+        self._order = np.argsort(-values if self.descending else values, kind="stable")
+
+    def last_offset(self):
+        return max(len(self) - self.page_rows, 0)
+
+    def scroll_to(self, offset):
+        self.offset = min(max(int(offset), 0), self.last_offset())
+
+    def scroll_by(self, rows):
+        self.scroll_to(self.offset + rows)
+
+    # History row index shown at position i of the sorted view
+    def _row(self, i):
+        if self._order is not None:
+            return self._order[i]
+        if self.descending:
+            return len(self.history) - 1 - i
+        return i
+
+    # Formatted (date, price, volume) strings for the rows on the current page
+    def page(self):
+        if self.history is None:
+            return []
+        dates = self.history.dates
+        closes = self.history.closes
+        volumes = self.history.volumes
+        rows = []
+        for i in range(self.offset, min(self.offset + self.page_rows, len(self))):
+            row = self._row(i)
+            rows.append((
+                datetime.fromordinal(dates[row]).strftime("%m/%d/%y"),
+                "${:0,.2f}".format(closes[row]),
+                "{:,.0f}".format(volumes[row]),
+            ))
+        return rows
+
+    # (first, last) fractions of the history on the page, for a scrollbar
+    def fractions(self):
+        total = len(self)
+        if not total:
+            return 0.0, 1.0
+        return self.offset / total, min(self.offset + self.page_rows, total) / total
+
+
+# Price history table: a Treeview with one page of rows that are refilled as
+# the user scrolls, pages or sorts (click a column heading to sort by it).
+class HistoryTable(ttk.Frame):
+    HEADINGS = {"date": "Date", "close": "Price", "volume": "Volume"}
+
+    def __init__(self, parent, page_rows=HISTORY_PAGE_ROWS):
+        super().__init__(parent)
+        self.pager = HistoryPager(page_rows)
+        self.frozen = False
+
+        table_frame = ttk.Frame(self)
+        table_frame.pack(side="top", fill="both", expand=True)
+        self.tree = ttk.Treeview(
+            table_frame, columns=HistoryPager.COLUMNS, show="headings", height=page_rows, selectmode="none"
+        )
+        for column in HistoryPager.COLUMNS:
+            self.tree.heading(column, command=lambda column=column: self.sort_by(column))
+            self.tree.column(column, anchor="e", width=110)
+        self.tree.pack(side="left", fill="both", expand=True)
+        # the page's items are created once and only their values change
+        self.items = [self.tree.insert("", END, values=("", "", "")) for _ in range(page_rows)]
+
+        self.scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=self._on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+
+        paging_frame = ttk.Frame(self)
+        paging_frame.pack(side="bottom", fill="x", pady=(5, 0))
+        ttk.Button(paging_frame, text="<< First", command=lambda: self.scroll_to(0)).pack(side="left")
+        ttk.Button(paging_frame, text="< Prev", command=lambda: self.scroll_by(-page_rows)).pack(side="left")
+        ttk.Button(paging_frame, text="Next >", command=lambda: self.scroll_by(page_rows)).pack(side="left")
+        ttk.Button(paging_frame, text="Last >>", command=lambda: self.scroll_to(self.pager.last_offset())).pack(side="left")
+        self.positionLabel = ttk.Label(paging_frame, text="")
+        self.positionLabel.pack(side="right")
+
+        for widget in (self.tree, self.scrollbar):
+            widget.bind("<MouseWheel>", self._on_mousewheel)
+            widget.bind("<Button-4>", lambda evt: self.scroll_by(-3))
+            widget.bind("<Button-5>", lambda evt: self.scroll_by(3))
+        self.tree.bind("<Prior>", lambda evt: self.scroll_by(-page_rows))
+        self.tree.bind("<Next>", lambda evt: self.scroll_by(page_rows))
+        self._render()
+
+    # Show a history (None to clear the table)
+    def show(self, history):
+        self.pager.set_history(history)
+        self._render()
+
+    # Ignore scrolling and sorting while a background operation may be
+    # changing the history; thaw() lets them through again.
+    def freeze(self):
+        self.frozen = True
+
+    def thaw(self):
+        self.frozen = False
+
+    def clear(self):
+        self.show(None)
+
+    def sort_by(self, column):
+        if self.frozen:
+            return
+        self.pager.sort_by(column)
+        self._render()
+
+    def scroll_to(self, offset):
+        if self.frozen:
+            return
+        self.pager.check_changed()
+        self.pager.scroll_to(offset)
+        self._render()
+
+    def scroll_by(self, rows):
+        if self.frozen:
+            return
+        self.pager.check_changed()
+        self.pager.scroll_by(rows)
+        self._render()
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(float(amount) * len(self.pager))
+        elif unit == "pages":
+            self.scroll_by(int(amount) * self.pager.page_rows)
+        else:
+            self.scroll_by(int(amount))
+
+    def _on_mousewheel(self, evt):
+        self.scroll_by(-3 if evt.delta > 0 else 3)
+
+    # Fill the page's items with the visible rows
+    def _render(self):
+        rows = self.pager.page()
+        for i, item in enumerate(self.items):
+            self.tree.item(item, values=rows[i] if i < len(rows) else ("", "", ""))
+        for column, text in self.HEADINGS.items():
+            if column == self.pager.sort_column:
+                text += " \u25bc" if self.pager.descending else " \u25b2"
+            self.tree.heading(column, text=text)
+        self.scrollbar.set(*self.pager.fractions())
+        total = len(self.pager)
+        if total:
+            first = self.pager.offset + 1
+            last = min(self.pager.offset + self.pager.page_rows, total)
+            self.positionLabel["text"] = f"Rows {first:,}-{last:,} of {total:,}"
+        else:
+            self.positionLabel["text"] = "No history"
+
 
 class StockApp:
     def __init__(self):
-        self.stock_list = []
+        self.stock_list = Portfolio()
         # check for database, create if not exists
-        if path.exists("stocks.db") is False:
+        if path.exists(stock_db.get_database_path()) is False:
             stock_data.create_database()
+        else:
+            stock_data.migrate_database()
 
         # ----- Window -----
         self.root = Tk()
@@ -31,7 +379,7 @@ class StockApp:
         filemenu.add_command(label="Load Data", command=self.load)
         filemenu.add_command(label="Save Data", command=self.save)
         filemenu.add_separator()
-        filemenu.add_command(label="Exit", command=self.root.quit)
+        filemenu.add_command(label="Exit", command=self.exit)
         self.menubar.add_cascade(label="File", menu=filemenu)
 
         # Web Menu
@@ -44,6 +392,10 @@ class StockApp:
             label="Import CSV from Yahoo! Finance...",
             command=self.importCSV_web_data,
         )
+        webmenu.add_command(
+            label="Import Folder of CSV Files...",
+            command=self.importCSV_folder,
+        )
         self.menubar.add_cascade(label="Web", menu=webmenu)
 
         # Chart Menu
@@ -55,6 +407,12 @@ class StockApp:
         self.menubar.add_cascade(label="Chart", menu=chartmenu)
 
         self.root.config(menu=self.menubar)
+        self.root.protocol("WM_DELETE_WINDOW", self.exit)
+
+        # ----- Status bar (progress and cancel for background operations) -----
+        self.tasks = BackgroundTasks(self.root, self.root)
+        self.valuation_future = None # portfolio valuation running on the pool
+        self.tasks.frame.pack(side="bottom", fill="x", padx=10, pady=(0, 10))
 
         # ----- Heading -----
         heading_frame = ttk.Frame(self.root)
@@ -102,6 +460,7 @@ class StockApp:
         self.tabs.add(self.main_tab, text="Main")
         self.tabs.add(self.history_tab, text="History")
         self.tabs.add(self.report_tab, text="Report")
+        self.tabs.bind("<<NotebookTabChanged>>", self.update_data)
 
         # ----- Main Tab: Add / Update / Delete -----
         add_frame = ttk.LabelFrame(self.main_tab, text="Add Stock")
@@ -151,15 +510,10 @@ class StockApp:
         history_frame = ttk.Frame(self.history_tab)
         history_frame.pack(fill="both", expand=True, padx=10, pady=10)
 
-        self.dailyDataList = Text(history_frame, width=60, height=15)
+        # only the visible page of rows is formatted (see HistoryTable)
+        self.dailyDataList = HistoryTable(history_frame)
         self.dailyDataList.pack(side="left", fill="both", expand=True)
 
-        history_scroll = ttk.Scrollbar(
-            history_frame, orient="vertical", command=self.dailyDataList.yview
-        )
-        history_scroll.pack(side="right", fill="y")
-        self.dailyDataList.config(yscrollcommand=history_scroll.set)
-
         # ----- Report Tab -----
         report_frame = ttk.Frame(self.report_tab)
         report_frame.pack(fill="both", expand=True, padx=10, pady=10)
@@ -178,23 +532,71 @@ class StockApp:
 
     # ----- Functionality -----
 
-    # Load stocks and history from database.
-    def load(self):
+    # Cancel any background operation and close the window.
+    def exit(self):
+        self.tasks.shutdown()
+        self.root.quit()
+
+    # Start a background operation that reads or changes the stocks' data. The
+    # history table is frozen meanwhile, since the worker may be changing it.
+    def run_task(self, title, work, on_done, on_error=None):
+        def finish(result):
+            self.dailyDataList.thaw()
+            on_done(result)
+
+        def fail(error):
+            self.dailyDataList.thaw()
+            self.display_stock_data()
+            if on_error is not None:
+                on_error(error)
+            elif error is not None:
+                messagebox.showerror(title, str(error))
+
+        if self.tasks.start(title, work, finish, fail):
+            self.dailyDataList.freeze()
+
+    # Refill the stock listbox from the portfolio.
+    def refresh_stock_list(self):
         self.stockList.delete(0, END)
-        self.stock_list.clear()
-        stock_data.load_stock_data(self.stock_list)
-        sortStocks(self.stock_list)
         for stock in self.stock_list:
             self.stockList.insert(END, stock.symbol)
-        messagebox.showinfo("Load Data", "Data Loaded")
 
-    # Save stocks and history to database.
+    # Load stocks and history from database (in the background, into a new
+    # portfolio that replaces the current one when the load completes).
+    def load(self):
+        def work(progress):
+            stock_list = Portfolio()
+            stock_data.load_stock_data(
+                stock_list,
+                progress=lambda symbol, done, total, error: progress("Loading " + symbol, done, total),
+            )
+            sortStocks(stock_list)
+            return stock_list
+
+        def done(stock_list):
+            self.stock_list = stock_list
+            self.refresh_stock_list()
+            self.headingLabel["text"] = "No stock selected"
+            self.dailyDataList.clear()
+            self.stockReport.delete("1.0", END)
+            messagebox.showinfo("Load Data", "Data Loaded")
+
+        self.run_task("Load Data", work, done)
+
+    # Save stocks and history to database (cancelling rolls the save back).
     def save(self):
-        stock_data.save_stock_data(self.stock_list)
-        messagebox.showinfo("Save Data", "Data Saved")
+        def work(progress):
+            stock_data.save_stock_data(
+                self.stock_list,
+                progress=lambda symbol, done, total, error: progress("Saving " + symbol, done, total),
+            )
+
+        self.run_task("Save Data", work, lambda result: messagebox.showinfo("Save Data", "Data Saved"))
 
     # Refresh history and report tabs when selection changes
     def update_data(self, evt):
+        if self.tasks.busy:
+            return # shown when the operation finishes
         self.display_stock_data()
 
     # Display stock price and volume history + report.
@@ -204,44 +606,69 @@ class StockApp:
             return
 
         symbol = self.stockList.get(selection[0])
-        for stock in self.stock_list:
-            if stock.symbol == symbol:
-                self.headingLabel["text"] = f"{stock.name} - {stock.shares} Shares"
-                self.dailyDataList.delete("1.0", END)
-                self.stockReport.delete("1.0", END)
+        stock = self.stock_list.get(symbol)
+        if stock is None:
+            return
 
-                self.dailyDataList.insert(
-                    END, "- Date -   - Price -   - Volume -\n"
-                )
-                self.dailyDataList.insert(END, "=================================\n")
-                for daily_data in stock.DataList:
-                    row = (
-                        daily_data.date.strftime("%m/%d/%y")
-                        + "   "
-                        + "${:0,.2f}".format(daily_data.close)
-                        + "   "
-                        + str(daily_data.volume)
-                        + "\n"
-                    )
-                    self.dailyDataList.insert(END, row)
-
-                # report summary
-                if stock.DataList:
-                    latest = stock.DataList[-1]
-                    total_value = stock.shares * latest.close
-                    self.stockReport.insert(
-                        END,
-                        f"Symbol: {stock.symbol}\n"
-                        f"Name: {stock.name}\n"
-                        f"Shares: {stock.shares}\n"
-                        f"Last Price: ${latest.close:0.2f}\n"
-                        f"Total Value: ${total_value:0.2f}\n",
-                    )
+        self.headingLabel["text"] = f"{stock.name} - {stock.shares} Shares"
+        self.stockReport.delete("1.0", END)
 
-                break
+        self.dailyDataList.show(stock.DataList)
+
+        # report summary
+        if stock.DataList:
+            latest = stock.DataList[-1]
+            total_value = stock.shares * latest.close
+            self.stockReport.insert(
+                END,
+                f"Symbol: {stock.symbol}\n"
+                f"Name: {stock.name}\n"
+                f"Shares: {stock.shares}\n"
+                f"Last Price: ${latest.close:0.2f}\n"
+                f"Total Value: ${total_value:0.2f}\n",
+            )
+
+        self.show_portfolio_value()
+
+    # Portfolio value on the last trading day and a month and a year before it,
+    # at the end of the Report tab. Valuing a large portfolio takes a second or
+    # more, so it is only done while the Report tab is shown, on the background
+    # pool, and then reused until a stock's shares or history change. The worker
+    # values a copy of the histories taken here, while no operation is running,
+    # so a later Scrape or Import can change them freely.
+    def show_portfolio_value(self):
+        if self.tabs.select() != str(self.report_tab):
+            return
+        valuation = cached_valuation(self.stock_list)
+        if valuation is None:
+            self.stockReport.insert(END, "\nPortfolio Value\nCalculating...\n")
+            if self.valuation_future is None and not self.tasks.busy:
+                self.valuation_future = self.tasks.executor.submit(value_snapshot, PortfolioSnapshot(self.stock_list))
+                self.root.after(POLL_MS, self.poll_valuation)
+            return
+        last = valuation.latest()
+        if last is not None:
+            self.stockReport.insert(END, "\nPortfolio Value\n")
+            for label, days_back in (("Latest", 0), ("1 Month Ago", 30), ("1 Year Ago", 365)):
+                found = valuation.as_of(last[0] - days_back)
+                if found is not None:
+                    day = datetime.fromordinal(found[0]).strftime("%m/%d/%y")
+                    self.stockReport.insert(END, f"{label} ({day}): ${found[1]:0,.2f}\n")
+
+    # UI thread: redraw the report once the background valuation is done
+    def poll_valuation(self):
+        if not self.valuation_future.done():
+            self.root.after(POLL_MS, self.poll_valuation)
+            return
+        future = self.valuation_future
+        self.valuation_future = None
+        if future.exception() is None and not self.tasks.busy:
+            self.display_stock_data()
 
     # Add new stock to track.
     def add_stock(self):
+        if not self.tasks.check_idle("Add Stock"):
+            return
         symbol = self.addSymbolEntry.get().strip().upper()
         name = self.addNameEntry.get().strip()
         shares_text = self.addSharesEntry.get().strip()
@@ -259,7 +686,11 @@ class StockApp:
             return
 
         new_stock = Stock(symbol, name, shares)
-        self.stock_list.append(new_stock)
+        try:
+            self.stock_list.append(new_stock)
+        except ValueError as e:
+            messagebox.showerror("Add Stock", str(e))
+            return
         self.stockList.insert(END, symbol)
 
         self.addSymbolEntry.delete(0, END)
@@ -268,6 +699,8 @@ class StockApp:
 
     # Buy shares of stock.
     def buy_shares(self):
+        if not self.tasks.check_idle("Buy Shares"):
+            return
         selection = self.stockList.curselection()
         if not selection:
             messagebox.showwarning("Buy Shares", "Please select a stock first.")
@@ -285,10 +718,9 @@ class StockApp:
             return
 
         symbol = self.stockList.get(selection[0])
-        for stock in self.stock_list:
-            if stock.symbol == symbol:
-                stock.buy(amount)
-                break
+        stock = self.stock_list.get(symbol)
+        if stock is not None:
+            stock.buy(amount)
 
         self.display_stock_data()
         messagebox.showinfo("Buy Shares", "Shares purchased.")
@@ -296,6 +728,8 @@ class StockApp:
 
     # Sell shares of stock.
     def sell_shares(self):
+        if not self.tasks.check_idle("Sell Shares"):
+            return
         selection = self.stockList.curselection()
         if not selection:
             messagebox.showwarning("Sell Shares", "Please select a stock first.")
@@ -313,13 +747,12 @@ class StockApp:
             return
 
         symbol = self.stockList.get(selection[0])
-        for stock in self.stock_list:
-            if stock.symbol == symbol:
-                try:
-                    stock.sell(amount)
-                except Exception as e:
-                    messagebox.showerror("Sell Shares", str(e))
-                break
+        stock = self.stock_list.get(symbol)
+        if stock is not None:
+            try:
+                stock.sell(amount)
+            except Exception as e:
+                messagebox.showerror("Sell Shares", str(e))
 
         self.display_stock_data()
         messagebox.showinfo("Sell Shares", "Shares sold.")
@@ -327,6 +760,8 @@ class StockApp:
 
     # Remove stock and all history from being tracked.
     def delete_stock(self):
+        if not self.tasks.check_idle("Delete Stock"):
+            return
         selection = self.stockList.curselection()
         if not selection:
             messagebox.showwarning(
@@ -340,22 +775,20 @@ class StockApp:
         if not messagebox.askyesno("Delete Stock", f"Delete {symbol}?"):
             return
 
-        to_remove = None
-        for stock in self.stock_list:
-            if stock.symbol == symbol:
-                to_remove = stock
-                break
+        to_remove = self.stock_list.get(symbol)
         if to_remove:
             self.stock_list.remove(to_remove)
 
         self.stockList.delete(index)
 
         self.headingLabel["text"] = "No stock selected"
-        self.dailyDataList.delete("1.0", END)
+        self.dailyDataList.clear()
         self.stockReport.delete("1.0", END)
 
     # Get data from web scraping.
     def scrape_web_data(self):
+        if not self.tasks.check_idle("Get Data From Web"):
+            return
         if not self.stock_list:
             messagebox.showwarning(
                 "Get Data From Web", "Add or load stocks before retrieving data."
@@ -374,19 +807,40 @@ class StockApp:
         if dateTo is None:
             return
 
-        try:
-            stock_data.retrieve_stock_web(dateFrom, dateTo, self.stock_list)
-        except Exception:
-            messagebox.showerror(
-                "Cannot Get Data from Web", "Check Path for Chrome Driver"
+        incremental = messagebox.askyesno(
+            "Get Data From Web", "Only retrieve dates that are missing?"
+        )
+
+        def work(progress):
+            return stock_data.retrieve_stock_web(
+                dateFrom,
+                dateTo,
+                self.stock_list,
+                incremental=incremental,
+                cache=stock_cache.default_cache(),
+                progress=lambda symbol, done, total, error: progress("Retrieved " + symbol, done, total),
             )
-            return
 
-        self.display_stock_data()
-        messagebox.showinfo("Get Data From Web", "Data Retrieved")
+        def done(report):
+            self.display_stock_data()
+            if report.failures:
+                messagebox.showwarning("Get Data From Web", report.summary())
+            else:
+                messagebox.showinfo("Get Data From Web", report.summary())
+
+        def failed(error):
+            if error is not None:
+                messagebox.showerror(
+                    "Cannot Get Data from Web", "Check Path for Chrome Driver"
+                )
 
-    # Import CSV stock history file.
+        self.run_task("Get Data From Web", work, done, failed)
+
+    # Import CSV stock history file. The file is read in the background and
+    # the rows are added on the UI thread once it has been read.
     def importCSV_web_data(self):
+        if not self.tasks.check_idle("Import CSV"):
+            return
         selection = self.stockList.curselection()
         if not selection:
             messagebox.showwarning(
@@ -400,12 +854,64 @@ class StockApp:
             filetypes=[("Yahoo Finance! CSV", "*.csv")],
         )
         if filename != "":
-            stock_data.import_stock_web_csv(self.stock_list, symbol, filename)
+            def work(progress):
+                progress("Reading " + filename)
+                return stock_data.read_stock_web_csv(filename)
+
+            def done(columns):
+                stock = self.stock_list.get(symbol)
+                if stock is not None:
+                    stock.DataList.extend_rows(*columns)
+                self.display_stock_data()
+                messagebox.showinfo("Import Complete", symbol + " Import Complete")
+
+            self.run_task("Import CSV", work, done)
+
+    # Import a folder of CSV files, one per symbol, and save them to the database.
+    # The files are parsed in the background; the portfolio is only changed here
+    # on the UI thread once every file is read, so Cancel leaves it untouched.
+    def importCSV_folder(self):
+        if not self.tasks.check_idle("Import Folder"):
+            return
+        directory = filedialog.askdirectory(title="Select Folder of CSV Files")
+        if not directory:
+            return
+
+        def work(progress):
+            return stock_data.read_stock_csv_dir(
+                directory,
+                progress=lambda name, done, total, error: progress("Read " + name, done, total),
+            )
+
+        def done(result):
+            report, parsed = result
+            changed = stock_data.merge_stock_csv_dir(self.stock_list, parsed, report)
+            self.refresh_stock_list()
             self.display_stock_data()
-            messagebox.showinfo("Import Complete", symbol + " Import Complete")
+            if changed:
+                self.run_task("Save Data", lambda progress: save_changed(changed, progress),
+                              lambda result: show_report(report))
+            else:
+                show_report(report)
+
+        def save_changed(changed, progress):
+            stock_data.save_stock_data(
+                changed,
+                progress=lambda symbol, done, total, error: progress("Saving " + symbol, done, total),
+            )
+
+        def show_report(report):
+            if report.failures:
+                messagebox.showwarning("Import Folder", report.summary())
+            else:
+                messagebox.showinfo("Import Folder", report.summary())
+
+        self.run_task("Import Folder", work, done)
 
     # Display stock price chart.
     def display_chart(self):
+        if not self.tasks.check_idle("Display Chart"):
+            return
         selection = self.stockList.curselection()
         if not selection:
             messagebox.showwarning(
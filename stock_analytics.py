@@ -0,0 +1,240 @@
+# Summary: This module computes technical indicators over the stocks' price histories.
+# Every indicator is worked out with whole-array numpy operations. For a portfolio, the
+# closes of up to BLOCK_SYMBOLS stocks are laid side by side as the columns of one
+# matrix, so each rolling window is a pair of running sums over the whole matrix and
+# each exponential average takes one vector step per day for all of those stocks.
+#
+# Results are cached per stock. Each entry records the history's version, so when
+# add_data() (or a load or import) changes the history, the next request recomputes it.
+
+import math
+import weakref
+import numpy as np
+
+TRADING_DAYS = 252       # used to annualize volatility
+SMA_WINDOWS = (20, 50, 200)
+EMA_SPANS = (12, 26)
+RSI_WINDOW = 14
+MACD_SPANS = (12, 26, 9) # fast, slow, signal
+BOLLINGER_WINDOW = 20
+BOLLINGER_WIDTH = 2.0    # band distance in standard deviations
+VOLATILITY_WINDOW = 20
+BLOCK_SYMBOLS = 1024     # stocks computed together in one matrix
+
+# Indicator names, in the order their rows are stored in Indicators
+INDICATORS = (
+    tuple(f"sma_{window}" for window in SMA_WINDOWS)
+    + tuple(f"ema_{span}" for span in EMA_SPANS)
+    + (f"rsi_{RSI_WINDOW}", "macd", "macd_signal", "macd_hist",
+       "bb_mid", "bb_upper", "bb_lower", "log_return", f"volatility_{VOLATILITY_WINDOW}")
+)
+_ROW = {name: i for i, name in enumerate(INDICATORS)}
+
+# stock -> (history, history version, Indicators)
+_cache = weakref.WeakKeyDictionary()
+
+
+# Indicator values for one stock, one row per indicator and one column per day of
+# history. Values are NaN until an indicator's window has filled.
+class Indicators:
+    __slots__ = ("_dates", "_values")
+
+    def __init__(self, dates, values):
+        self._dates = dates
+        self._values = values
+
+    # Date ordinals the columns belong to
+    @property
+    def dates(self):
+        return self._dates
+
+    # All values as an (indicator, day) array
+    @property
+    def values(self):
+        return self._values
+
+    @property
+    def names(self):
+        return INDICATORS
+
+    # Values of one indicator for every day, e.g. indicators["rsi_14"]
+    def __getitem__(self, name):
+        return self._values[_ROW[name]]
+
+    # Indicator values on the last day of history
+    def latest(self):
+        if not len(self._dates):
+            return {}
+        return dict(zip(INDICATORS, self._values[:, -1].tolist()))
+
+    def __len__(self):
+        return len(self._dates)
+
+    def __repr__(self):
+        return f"Indicators({len(self)} days x {len(INDICATORS)} indicators)"
+
+
+# Running sum down the rows of a (day, stock) matrix. One vector add per day is
+# faster than np.cumsum(axis=0), which walks each column with a large stride.
+def _running_sum(data):
+    out = np.empty_like(data)
+    if len(data):
+        out[0] = data[0]
+    for i in range(1, len(data)):
+        np.add(out[i - 1], data[i], out=out[i])
+    return out
+
+
+# Rolling mean over the rows from `start` on, from running column sums. Rows
+# before the first full window are NaN.
+def _rolling_mean(values, window, start=0):
+    out = np.full_like(values, np.nan)
+    data = values[start:]
+    if len(data) < window:
+        return out
+    offset = data[0]
+    sums = _running_sum(data - offset)
+    mean = out[start + window - 1:]
+    mean[0] = sums[window - 1]
+    np.subtract(sums[window:], sums[:-window], out=mean[1:])
+    mean /= window
+    mean += offset
+    return out
+
+
+# Rolling standard deviation over the rows from `start` on, from running sums
+# of the values and their squares. The values are shifted by the first row
+# first, which keeps the sums small and the subtraction accurate.
+def _rolling_std(values, window, ddof=0, start=0):
+    out = np.full_like(values, np.nan)
+    data = values[start:]
+    if len(data) < window:
+        return out
+    data = data - data[0]
+    sums = _running_sum(data)
+    squares = _running_sum(data * data)
+    total = np.concatenate((sums[window - 1:window], sums[window:] - sums[:-window]))
+    total_sq = np.concatenate((squares[window - 1:window], squares[window:] - squares[:-window]))
+    variance = (total_sq - total * total / window) / (window - ddof)
+    np.sqrt(np.maximum(variance, 0.0), out=out[start + window - 1:])
+    return out
+
+
+# Exponentially weighted mean, seeded with the row at `start` (pandas'
+# ewm(adjust=False)). The recursion runs down the rows, each step updating
+# every stock in the block at once. Rows before start + min_periods - 1 are NaN.
+def _ewm(values, alpha, start=0, min_periods=1):
+    out = np.full_like(values, np.nan)
+    if len(values) <= start:
+        return out
+    scaled = values * alpha
+    beta = 1.0 - alpha
+    out[start] = values[start]
+    for i in range(start + 1, len(values)):
+        row = out[i]
+        np.multiply(out[i - 1], beta, out=row)
+        row += scaled[i]
+    out[start:start + min_periods - 1] = np.nan
+    return out
+
+
+def _ema(values, span, start=0):
+    return _ewm(values, 2.0 / (span + 1.0), start)
+
+
+# Compute every indicator for a (day, stock) matrix of closes. Shorter histories are
+# padded with NaN at the end. Returns one matrix per indicator, in INDICATORS order.
+def _compute_block(closes):
+    results = {}
+    sma = {window: _rolling_mean(closes, window) for window in set(SMA_WINDOWS) | {BOLLINGER_WINDOW}}
+    for window in SMA_WINDOWS:
+        results[f"sma_{window}"] = sma[window]
+    ema = {span: _ema(closes, span) for span in set(EMA_SPANS) | set(MACD_SPANS[:2])}
+    for span in EMA_SPANS:
+        results[f"ema_{span}"] = ema[span]
+
+    # RSI with Wilder's smoothing (an EMA with alpha = 1/window)
+    delta = np.full_like(closes, np.nan)
+    np.subtract(closes[1:], closes[:-1], out=delta[1:])
+    gain = _ewm(np.maximum(delta, 0.0), 1.0 / RSI_WINDOW, 1, RSI_WINDOW)
+    loss = _ewm(np.maximum(-delta, 0.0), 1.0 / RSI_WINDOW, 1, RSI_WINDOW)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        results[f"rsi_{RSI_WINDOW}"] = 100.0 - 100.0 / (1.0 + gain / loss)
+
+    fast, slow, signal_span = MACD_SPANS
+    macd = ema[fast] - ema[slow]
+    signal = _ema(macd, signal_span)
+    results["macd"] = macd
+    results["macd_signal"] = signal
+    results["macd_hist"] = macd - signal
+
+    mid = sma[BOLLINGER_WINDOW]
+    width = BOLLINGER_WIDTH * _rolling_std(closes, BOLLINGER_WINDOW)
+    results["bb_mid"] = mid
+    results["bb_upper"] = mid + width
+    results["bb_lower"] = mid - width
+
+    log_return = np.full_like(closes, np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        np.subtract(np.log(closes[1:]), np.log(closes[:-1]), out=log_return[1:])
+    results["log_return"] = log_return
+    volatility = _rolling_std(log_return, VOLATILITY_WINDOW, ddof=1, start=1)
+    results[f"volatility_{VOLATILITY_WINDOW}"] = volatility * math.sqrt(TRADING_DAYS)
+    return [results[name] for name in INDICATORS]
+
+
+# Compute and cache the indicators for a list of stocks, BLOCK_SYMBOLS at a time.
+# Stocks of similar length are grouped together to keep the NaN padding small.
+def _compute(stocks):
+    stocks = sorted(stocks, key=lambda stock: len(stock.DataList), reverse=True)
+    for first in range(0, len(stocks), BLOCK_SYMBOLS):
+        block = stocks[first:first + BLOCK_SYMBOLS]
+        lengths = [len(stock.DataList) for stock in block]
+        columns = np.full((len(block), max(lengths)), np.nan)
+        for j, stock in enumerate(block):
+            columns[j, :lengths[j]] = stock.DataList.closes
+        closes = np.ascontiguousarray(columns.T)
+        values = [np.empty((len(INDICATORS), length)) for length in lengths]
+        if len(closes):
+            for i, result in enumerate(_compute_block(closes)):
+                # transpose first so each stock's days are contiguous to copy
+                result = result.T.copy()
+                for j, length in enumerate(lengths):
+                    values[j][i] = result[j, :length]
+        for j, stock in enumerate(block):
+            history = stock.DataList
+            # copy the dates: a live view would stop the array from growing
+            dates = np.array(history.dates, dtype=np.int32)
+            _cache[stock] = (history, history.version, Indicators(dates, values[j]))
+
+
+def _cached(stock):
+    entry = _cache.get(stock)
+    if entry is None:
+        return None
+    history, version, result = entry
+    if history is not stock.DataList or version != stock.DataList.version:
+        return None
+    return result
+
+
+# Indicators for one stock, from the cache when its history has not changed
+def indicators(stock):
+    result = _cached(stock)
+    if result is None:
+        _compute([stock])
+        result = _cached(stock)
+    return result
+
+
+# Indicators for every stock in the portfolio, as {symbol: Indicators}. Only
+# stocks whose history changed since the last call are recomputed.
+def portfolio_indicators(stock_list):
+    stale = [stock for stock in stock_list if _cached(stock) is None]
+    if stale:
+        _compute(stale)
+    return {stock.symbol: _cached(stock) for stock in stock_list}
+
+
+def clear_cache():
+    _cache.clear()
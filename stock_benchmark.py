@@ -0,0 +1,1002 @@
+# Summary: This module contains timing and memory benchmarks for the stock analysis program.
+# Run it directly to print the results: python stock_benchmark.py
+# For regression checks across commits:
+#   python stock_benchmark.py suite --symbols 100 --days 2520 -o before.json
+#   python stock_benchmark.py suite --symbols 100 --days 2520 -o after.json --baseline before.json
+#   python stock_benchmark.py compare before.json after.json
+
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from stock_class import PriceHistory, Stock, DailyData
+import stock_db
+
+
+# The original DailyData class (plain object with properties, no __slots__),
+# kept here so the list-of-objects layout can still be measured.
+class _LegacyDailyData:
+    def __init__(self, date, close, volume):
+        self._date = date
+        self._close = close
+        self._volume = volume
+
+    @property
+    def date(self):
+        return self._date
+
+    @property
+    def close(self):
+        return self._close
+
+    @property
+    def volume(self):
+        return self._volume
+
+
+# Generate n days of synthetic (date ordinal, close, volume) rows
+def synthetic_rows(n, start=datetime(1990, 1, 1)):
+    rows = []
+    first = start.toordinal()
+    close = 100.0
+    for i in range(n):
+        close = close * (1.0 + ((i * 7919) % 201 - 100) / 10000.0)
+        rows.append((first + i, round(close, 2), float(1000000 + (i * 104729) % 500000)))
+    return rows
+
+
+# Run build() under tracemalloc and return (result, bytes still held)
+def _measure_memory(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def _best_time(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+# Compare memory and iteration speed of a list of objects against PriceHistory
+def bench_history(n=1000000):
+    rows = synthetic_rows(n)
+
+    def build_list():
+        fromordinal = datetime.fromordinal
+        return [_LegacyDailyData(fromordinal(date), close, volume) for date, close, volume in rows]
+
+    def build_history():
+        history = PriceHistory()
+        for date, close, volume in rows:
+            history.append_row(date, close, volume)
+        return history
+
+    legacy, legacy_bytes = _measure_memory(build_list)
+    history, history_bytes = _measure_memory(build_history)
+
+    def sum_list():
+        total = 0.0
+        for daily in legacy:
+            total += daily.close
+        return total
+
+    def sum_history_views():
+        total = 0.0
+        for daily in history:
+            total += daily.close
+        return total
+
+    def sum_history_column():
+        return sum(history.closes)
+
+    results = {
+        "rows": n,
+        "list_bytes": legacy_bytes,
+        "history_bytes": history_bytes,
+        "list_iter_s": _best_time(sum_list),
+        "history_view_iter_s": _best_time(sum_history_views),
+        "history_column_iter_s": _best_time(sum_history_column),
+    }
+    return results
+
+
+# Fill the current database with symbols x days of synthetic data
+def build_database(symbols, days):
+    import stock_data
+    stock_data.create_database()
+    rows = synthetic_rows(days)
+    conn = stock_db.get_connection()
+    with conn:
+        for s in range(symbols):
+            symbol = f"S{s:05d}"
+            conn.execute("INSERT INTO stocks (symbol, name, shares) VALUES (?, ?, ?);", (symbol, symbol + " Inc", 100.0))
+            conn.executemany("INSERT INTO dailyData (symbol, date, price, volume) VALUES (?, ?, ?, ?);",
+                             [(symbol, date, close, int(volume)) for date, close, volume in rows])
+
+
+# The original loader: one SELECT per symbol and a DailyData object per row.
+# (The bubble sort that followed it is left out; it would dominate the timing.)
+def _legacy_load_stock_data(stock_list):
+    stock_list.clear()
+    conn = sqlite3.connect(stock_db.get_database_path())
+    stockCur = conn.cursor()
+    stockCur.execute("SELECT symbol, name, shares FROM stocks;")
+    for row in stockCur.fetchall():
+        new_stock = Stock(row[0],row[1],row[2])
+        dailyDataCur = conn.cursor()
+        dailyDataCur.execute("SELECT date, price, volume FROM dailyData WHERE symbol=?;", (new_stock.symbol,))
+        for dailyRow in dailyDataCur.fetchall():
+            new_stock.add_data(DailyData(datetime.fromordinal(dailyRow[0]),float(dailyRow[1]),float(dailyRow[2])))
+        stock_list.append(new_stock)
+    conn.close()
+
+
+# Time load_stock_data against the original per-symbol loader
+def bench_load(symbols=500, days=2500):
+    import stock_data
+    old_path = stock_db.get_database_path()
+    with tempfile.TemporaryDirectory() as directory:
+        stock_db.set_database_path(os.path.join(directory, "stocks.db"))
+        try:
+            build_database(symbols, days)
+            stock_list = []
+            results = {
+                "symbols": symbols,
+                "days": days,
+                "legacy_load_s": _best_time(lambda: _legacy_load_stock_data(stock_list), repeat=1),
+                "load_s": _best_time(lambda: stock_data.load_stock_data(stock_list), repeat=1),
+            }
+        finally:
+            stock_db.set_database_path(old_path)
+    return results
+
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+# Answers every request with the saved history page, gzipped when the client
+# accepts it and alternating between Content-Length and chunked bodies. The
+# symbol SLOW gets no answer for STUB_SLOW_S seconds (a timeout) and ERROR
+# gets an HTTP 500, for testing how the fetchers recover.
+STUB_SLOW_S = 1.0
+
+class _StubHistoryHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        if "/SLOW/" in self.path:
+            time.sleep(STUB_SLOW_S)
+            self.close_connection = True
+            return
+        if "/ERROR/" in self.path:
+            self.send_response(500)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        with self.server.lock:
+            self.server.requests += 1
+            chunked = self.server.requests % 2 == 0
+        body = self.server.page
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+            with self.server.lock:
+                self.server.gzipped += 1
+        if chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i in range(0, len(body), 4096):
+                chunk = body[i:i + 4096]
+                self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Run a local server that serves a recorded Yahoo! Finance history page for
+# every symbol, with stock_web pointed at it for the duration of the block
+@contextmanager
+def stub_history_server(fixture="yahoo_history_AAPL.html"):
+    import stock_web
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHistoryHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.requests = 0
+    server.gzipped = 0
+    with open(os.path.join(FIXTURE_DIR, fixture), "rb") as page:
+        server.page = page.read()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    old_url = stock_web.HISTORY_URL
+    stock_web.HISTORY_URL = "http://127.0.0.1:" + str(server.server_address[1]) + "/quote/{symbol}/history?period1={period1}&period2={period2}"
+    try:
+        yield server
+    finally:
+        stock_web.HISTORY_URL = old_url
+        server.shutdown()
+        server.server_close()
+
+
+# Time retrieve_stock_web with the HTTP fetchers against the local stub server
+def bench_fetch(symbols=200, workers=16):
+    import stock_data
+    from stock_web import parse_history_page
+    with open(os.path.join(FIXTURE_DIR, "yahoo_history_AAPL.html")) as page:
+        expected_rows = len(parse_history_page(page.read()))
+    results = {"symbols": symbols, "workers": workers}
+    for fetcher in ("http", "async"):
+        with stub_history_server() as server:
+            stock_list = [Stock(f"S{s:05d}", "", 0) for s in range(symbols)]
+            start = time.perf_counter()
+            report = stock_data.retrieve_stock_web("1/1/24", "3/31/24", stock_list, workers=workers, fetcher=fetcher)
+            elapsed = time.perf_counter() - start
+            if report.failures or report.record_count != symbols * expected_rows:
+                raise RuntimeError(fetcher + " fetcher: " + report.summary())
+            results[fetcher + "_s"] = elapsed
+            results[fetcher + "_connections"] = server.connections
+    return results
+
+
+# Write a Yahoo! Finance style CSV with one row per day
+def write_stock_csv(filename, rows, start=datetime(1700, 1, 1)):
+    first = start.toordinal()
+    with open(filename, "w") as out:
+        out.write("Date,Open,High,Low,Close,Adj Close,Volume\n")
+        close = 100.0
+        lines = []
+        for i in range(rows):
+            close = round(close * (1.0 + ((i * 7919) % 201 - 100) / 10000.0), 4)
+            day = datetime.fromordinal(first + i).strftime("%Y-%m-%d")
+            lines.append(f"{day},{close},{close},{close},{close},{close},{1000000 + (i * 104729) % 500000}\n")
+            if len(lines) == 100000:
+                out.writelines(lines)
+                lines = []
+        out.writelines(lines)
+
+
+# The original CSV import: csv.reader, strptime and float() on every row
+def _legacy_import_stock_web_csv(stock, filename):
+    import csv
+    with open(filename, newline='') as stockdata:
+        datareader = csv.reader(stockdata,delimiter=',')
+        next(datareader)
+        for row in datareader:
+            stock.add_data(DailyData(datetime.strptime(row[0],"%Y-%m-%d"),float(row[4]),float(row[6])))
+
+
+# Time import_stock_web_csv against the original row-by-row import
+def bench_csv_import(rows=1000000):
+    import stock_data
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "TEST.csv")
+        write_stock_csv(filename, rows)
+        legacy_stock = Stock("TEST", "", 0)
+        stock = Stock("TEST", "", 0)
+        results = {
+            "rows": rows,
+            "legacy_import_s": _best_time(lambda: _legacy_import_stock_web_csv(legacy_stock, filename), repeat=1),
+            "import_s": _best_time(lambda: stock_data.import_stock_web_csv([stock], "TEST", filename), repeat=1),
+        }
+        if len(stock.DataList) != rows:
+            raise RuntimeError("import_stock_web_csv imported " + str(len(stock.DataList)) + " rows")
+    return results
+
+
+# Time portfolio_indicators over a synthetic portfolio: a cold run, a fully
+# cached run, and a run after one new day was added to every stock
+def bench_analytics(symbols=5000, days=2520):
+    import stock_analytics
+    from array import array
+    dates, closes, volumes = (array(typecode, column) for typecode, column in zip("idd", zip(*synthetic_rows(days))))
+    stock_list = []
+    for s in range(symbols):
+        stock = Stock(f"S{s:05d}", "", 0)
+        stock.DataList.extend_rows(dates, closes, volumes)
+        stock_list.append(stock)
+    stock_analytics.clear_cache()
+    start = time.perf_counter()
+    stock_analytics.portfolio_indicators(stock_list)
+    cold = time.perf_counter() - start
+    cached = _best_time(lambda: stock_analytics.portfolio_indicators(stock_list))
+    next_day = dates[-1] + 1
+    for stock in stock_list:
+        stock.DataList.append_row(next_day, closes[-1], volumes[-1])
+    start = time.perf_counter()
+    stock_analytics.portfolio_indicators(stock_list)
+    updated = time.perf_counter() - start
+    stock_analytics.clear_cache()
+    return {"symbols": symbols, "days": days, "cold_s": cold, "cached_s": cached, "updated_s": updated}
+
+
+# Time one new day arriving through add_data on every stock, with rolling
+# mean/variance/min-max/VWAP accumulators attached, against rescanning the
+# full histories with stock_analytics
+def bench_rolling(symbols=5000, days=2520, window=20):
+    import stock_analytics
+    from array import array
+    from stock_rolling import RollingMean, RollingVariance, RollingMinMax, RollingVWAP
+    dates, closes, volumes = (array(typecode, column) for typecode, column in zip("idd", zip(*synthetic_rows(days))))
+    stock_list = []
+    for s in range(symbols):
+        stock = Stock(f"S{s:05d}", "", 0)
+        stock.DataList.extend_rows(dates, closes, volumes)
+        for accumulator in (RollingMean, RollingVariance, RollingMinMax, RollingVWAP):
+            stock.add_accumulator(accumulator(window))
+        stock_list.append(stock)
+    next_day = datetime.fromordinal(dates[-1] + 1)
+    new_data = DailyData(next_day, closes[-1] * 1.01, volumes[-1])
+    start = time.perf_counter()
+    for stock in stock_list:
+        stock.add_data(new_data)
+    streaming = time.perf_counter() - start
+    stock_analytics.clear_cache()
+    start = time.perf_counter()
+    stock_analytics.portfolio_indicators(stock_list)
+    rescan = time.perf_counter() - start
+    stock_analytics.clear_cache()
+    return {"symbols": symbols, "days": days, "window": window, "streaming_s": streaming, "rescan_s": rescan}
+
+
+# Time valuing a portfolio whose histories start on different days, then
+# as-of lookups against the result
+def bench_valuation(symbols=10000, days=2520, queries=10000):
+    from array import array
+    from stock_valuation import PortfolioValuation
+    dates, closes, volumes = (array(typecode, column) for typecode, column in zip("idd", zip(*synthetic_rows(days))))
+    stock_list = []
+    for s in range(symbols):
+        stock = Stock(f"S{s:05d}", "", 10)
+        offset = s % 250 # stagger the first trading day
+        stock.DataList.extend_rows(dates[offset:], closes[offset:], volumes[offset:])
+        stock_list.append(stock)
+    start = time.perf_counter()
+    valuation = PortfolioValuation(stock_list)
+    build = time.perf_counter() - start
+    first = dates[0]
+    start = time.perf_counter()
+    for i in range(queries):
+        valuation.value_as_of(first + (i * 7919) % days)
+    as_of = (time.perf_counter() - start) / queries
+    return {"symbols": symbols, "days": days, "build_s": build, "as_of_s": as_of}
+
+
+# Time drawing a long history the original way (every point, with markers)
+# against stock_chart's downsampled view, on an off-screen Agg canvas
+def bench_chart(points=100000):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    import stock_chart
+    stock = Stock("TEST", "", 0)
+    rows = synthetic_rows(points, start=datetime(1700, 1, 1))
+    stock.DataList.extend_rows(*zip(*rows))
+
+    def new_figure():
+        fig = Figure(figsize=(10, 5))
+        FigureCanvasAgg(fig)
+        return fig
+
+    def draw_legacy():
+        dates = []
+        closes = []
+        for daily in stock.DataList:
+            dates.append(daily.date)
+            closes.append(daily.close)
+        fig = new_figure()
+        ax = fig.add_subplot()
+        ax.plot(dates, closes, marker="o")
+        fig.canvas.draw()
+
+    view = stock_chart.ChartView(new_figure())
+
+    def draw_first():
+        first = stock_chart.ChartView(new_figure())
+        first.set_stock(stock)
+        first.fig.canvas.draw()
+
+    def draw_downsampled():
+        view.set_stock(stock)
+        view.fig.canvas.draw()
+
+    def zoom():
+        x = view._x
+        view.ax.set_xlim(x[points // 2], x[points // 2 + points // 20])
+        view.fig.canvas.draw()
+
+    results = {
+        "points": points,
+        "legacy_s": _best_time(draw_legacy, repeat=1),
+        "first_s": _best_time(draw_first, repeat=1),
+        "redraw_s": _best_time(draw_downsampled),
+        "zoom_s": _best_time(zoom),
+        "drawn_points": len(view.line.get_xdata()),
+    }
+    return results
+
+
+# Time what selecting a stock costs in the GUI's History tab: the original
+# one-formatted-row-per-day text against HistoryPager's first page
+def bench_history_view(rows=1000000):
+    from stock_GUI import HistoryPager
+    history = PriceHistory()
+    history.extend_rows(*zip(*synthetic_rows(rows)))
+
+    def format_all():
+        text = []
+        for daily_data in history:
+            text.append(daily_data.date.strftime("%m/%d/%y") + "   " + "${:0,.2f}".format(daily_data.close)
+                        + "   " + str(daily_data.volume) + "\n")
+        return text
+
+    pager = HistoryPager()
+
+    def show_page():
+        pager.set_history(history)
+        return pager.page()
+
+    def sort_by_price():
+        pager.sort_column = "date"
+        pager.sort_by("close")
+        return pager.page()
+
+    return {
+        "rows": rows,
+        "format_all_s": _best_time(format_all, repeat=1),
+        "page_s": _best_time(show_page),
+        "sort_s": _best_time(sort_by_price),
+    }
+
+
+# Time a full load from SQLite against a full and a filtered Parquet import
+def bench_parquet(symbols=500, days=2500, subset=10, window_days=60):
+    import stock_data
+    from stock_class import Portfolio
+    old_path = stock_db.get_database_path()
+    with tempfile.TemporaryDirectory() as directory:
+        stock_db.set_database_path(os.path.join(directory, "stocks.db"))
+        try:
+            build_database(symbols, days)
+            stock_list = Portfolio()
+            load_s = _best_time(lambda: stock_data.load_stock_data(stock_list), repeat=1)
+            export_dir = os.path.join(directory, "parquet")
+            export_s = _best_time(lambda: stock_data.export_stock_parquet(stock_list, export_dir), repeat=1)
+            chosen = [stock.symbol for stock in list(stock_list)[:subset]]
+            last = max(stock.DataList.dates[-1] for stock in stock_list)
+            results = {
+                "symbols": symbols,
+                "days": days,
+                "subset": subset,
+                "window_days": window_days,
+                "load_s": load_s,
+                "export_s": export_s,
+                "import_s": _best_time(lambda: stock_data.import_stock_parquet(Portfolio(), export_dir)),
+                "filtered_s": _best_time(lambda: stock_data.import_stock_parquet(
+                    Portfolio(), export_dir, symbols=chosen, start=last - window_days + 1, end=last)),
+            }
+        finally:
+            stock_db.set_database_path(old_path)
+    return results
+
+
+# Open a memory-mapped universe and read from it, against loading the same
+# portfolio from SQLite
+def bench_mmap(symbols=1000, days=2520):
+    import stock_data
+    import stock_mmap
+    from stock_class import Portfolio
+    from stock_valuation import PortfolioValuation
+    old_path = stock_db.get_database_path()
+    with tempfile.TemporaryDirectory() as directory:
+        stock_db.set_database_path(os.path.join(directory, "stocks.db"))
+        try:
+            build_database(symbols, days)
+            stock_list = Portfolio()
+            load_s = _best_time(lambda: stock_data.load_stock_data(stock_list), repeat=1)
+            universe_dir = os.path.join(directory, "universe")
+            save_s = _best_time(lambda: stock_mmap.save_universe(stock_list, universe_dir, only_changed=False), repeat=1)
+            symbol = stock_list[len(stock_list) // 2].symbol
+
+            def open_one():
+                universe = stock_mmap.open_universe(universe_dir)
+                return float(universe.history(symbol).closes[-1])
+
+            results = {
+                "symbols": symbols,
+                "days": days,
+                "load_s": load_s,
+                "save_s": save_s,
+                "open_one_s": _best_time(open_one),
+                "load_value_s": load_s + _best_time(lambda: PortfolioValuation(stock_list), repeat=1),
+                "mapped_value_s": _best_time(lambda: PortfolioValuation(stock_mmap.open_universe(universe_dir)), repeat=1),
+            }
+        finally:
+            stock_db.set_database_path(old_path)
+    return results
+
+
+# Wall time of a fresh interpreter running `args` (best of `repeat`)
+def _process_time(args, repeat=5, cwd=None):
+    return _best_time(lambda: subprocess.run([sys.executable] + args, cwd=cwd, check=True,
+                                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL), repeat)
+
+
+def bench_cli_startup(symbols=50, days=2500):
+    here = os.path.dirname(os.path.abspath(__file__))
+    cli = os.path.join(here, "stock_cli.py")
+    old_path = stock_db.get_database_path()
+    with tempfile.TemporaryDirectory() as directory:
+        db = os.path.join(directory, "stocks.db")
+        stock_db.set_database_path(db)
+        try:
+            build_database(symbols, days)
+        finally:
+            stock_db.close_all()
+            stock_db.set_database_path(old_path)
+        return {
+            "symbols": symbols,
+            "days": days,
+            "python_s": _process_time(["-c", "pass"]),
+            # what every start used to import before the first prompt
+            "eager_imports_s": _process_time(["-c", "import pandas, bs4, matplotlib.pyplot, stock_console, stock_GUI"], cwd=here),
+            "help_s": _process_time([cli, "--help"]),
+            "load_s": _process_time([cli, "--db", db, "load"]),
+            "report_s": _process_time([cli, "--db", db, "report"]),
+        }
+
+
+# Correctness checks for behavior the benchmarks rely on. Raises RuntimeError
+# on the first failure; returns the number of checks run.
+def run_checks():
+    return check_missing_ranges() + check_fetchers()
+
+
+# missing_ranges on weekends, holidays and holes
+def check_missing_ranges():
+    day = lambda year, month, date: datetime(year, month, date).toordinal()
+    history = PriceHistory()
+    # Tue 2 Jan 2024 .. Fri 9 Feb 2024, weekdays only
+    dates = [d for d in range(day(2024, 1, 2), day(2024, 2, 10)) if datetime.fromordinal(d).weekday() < 5]
+    history.extend_rows(dates, [100.0] * len(dates), [1000.0] * len(dates))
+    # the same from Fri 5 Jan, and without Mon 15 Jan or Mon 5 and Tue 6 Feb
+    late_start = PriceHistory()
+    kept = [d for d in dates if d >= day(2024, 1, 5)]
+    late_start.extend_rows(kept, [100.0] * len(kept), [1000.0] * len(kept))
+    holes = PriceHistory()
+    kept = [d for d in dates if d not in (day(2024, 1, 15), day(2024, 2, 5), day(2024, 2, 6))]
+    holes.extend_rows(kept, [100.0] * len(kept), [1000.0] * len(kept))
+    checks = [
+        ("window ending on a Saturday", history.missing_ranges(day(2024, 2, 5), day(2024, 2, 10)), []),
+        ("window ending on a Sunday", history.missing_ranges(day(2024, 2, 5), day(2024, 2, 11)), []),
+        ("window starting on the 1 Jan holiday", history.missing_ranges(day(2024, 1, 1), day(2024, 1, 5)), []),
+        ("window ending on a Monday", history.missing_ranges(day(2024, 2, 5), day(2024, 2, 12)),
+         [(day(2024, 2, 10), day(2024, 2, 12))]),
+        ("window starting a month early", history.missing_ranges(day(2023, 12, 1), day(2024, 1, 5)),
+         [(day(2023, 12, 1), day(2024, 1, 1))]),
+        ("history starting on a Friday", late_start.missing_ranges(day(2024, 1, 1), day(2024, 1, 12)),
+         [(day(2024, 1, 1), day(2024, 1, 4))]),
+        ("Friday to Wednesday hole", holes.missing_ranges(day(2024, 2, 1), day(2024, 2, 9)),
+         [(day(2024, 2, 3), day(2024, 2, 6))]),
+        ("Friday to Tuesday hole (a Monday holiday)", holes.missing_ranges(day(2024, 1, 8), day(2024, 1, 19)), []),
+    ]
+    for name, result, expected in checks:
+        if result != expected:
+            raise RuntimeError(f"missing_ranges, {name}: {result} (expected {expected})")
+    return len(checks)
+
+
+# The http and async fetchers against the stub server: gzip and chunked bodies
+# parse to the fixture's rows, and a request that times out or fails does not
+# break the requests after it (the connection it used is replaced)
+def check_fetchers(timeout=0.3):
+    import stock_web
+    with open(os.path.join(FIXTURE_DIR, "yahoo_history_AAPL.html")) as page:
+        expected_rows = len(stock_web.parse_history_page(page.read()))
+    symbols = ["S1", "S2", "SLOW", "S3", "ERROR", "S4"]
+    checks = 0
+    old_timeout = stock_web.REQUEST_TIMEOUT
+    stock_web.REQUEST_TIMEOUT = timeout
+    try:
+        for name in ("http", "async"):
+            with stub_history_server() as server:
+                urls = [stock_web.history_url(symbol, 0, 86400) for symbol in symbols]
+                results = {}
+                # one worker, so every request goes through the same connection
+                with stock_web.open_fetcher(name, workers=1) as fetcher:
+                    if name == "http":
+                        for url in urls:
+                            try:
+                                results[url] = (fetcher.fetch(url), None)
+                            except Exception as e:
+                                results[url] = (None, e)
+                    else:
+                        for url, html, error in fetcher.fetch_all(urls):
+                            results[url] = (html, error)
+                for symbol, url in zip(symbols, urls):
+                    html, error = results[url]
+                    if symbol in ("SLOW", "ERROR"):
+                        if error is None:
+                            raise RuntimeError(f"{name} fetcher, {symbol}: no error")
+                    elif error is not None:
+                        raise RuntimeError(f"{name} fetcher, {symbol} after a failed request: {error!r}")
+                    elif len(stock_web.parse_history_page(html)) != expected_rows:
+                        raise RuntimeError(f"{name} fetcher, {symbol}: {len(stock_web.parse_history_page(html))} rows "
+                                           f"(expected {expected_rows})")
+                    checks += 1
+                if server.gzipped != server.requests or server.requests < 2:
+                    raise RuntimeError(f"{name} fetcher: {server.gzipped} of {server.requests} pages gzipped")
+                checks += 1
+    finally:
+        stock_web.REQUEST_TIMEOUT = old_timeout
+    return checks
+
+
+# --- Regression suite ------------------------------------------------------
+# `python stock_benchmark.py suite` times the main operations on a synthetic
+# portfolio of a given size and writes the results as JSON; `compare` checks a
+# run against an earlier one. The data only depends on the size and the seed,
+# so runs on different commits time exactly the same work.
+
+SUITE_FORMAT = 1
+SUITE_SYMBOLS = 100
+SUITE_DAYS = 2520
+SUITE_REPEAT = 5
+SUITE_SEED = 1
+REGRESSION_THRESHOLD = 0.10 # 10% slower than the baseline
+REGRESSION_MIN_S = 0.001    # ignore differences smaller than this
+
+
+# Synthetic portfolio: `symbols` stocks in shuffled symbol order, each with
+# `days` rows of a seeded random walk (starting on a different day per stock)
+def synthetic_portfolio(symbols, days, seed=SUITE_SEED):
+    import random
+    from array import array
+    rng = random.Random(seed)
+    names = [f"S{s:05d}" for s in range(symbols)]
+    rng.shuffle(names)
+    first = datetime(2000, 1, 3).toordinal()
+    stocks = []
+    for symbol in names:
+        start = first + rng.randrange(30)
+        close = rng.uniform(10.0, 500.0)
+        closes = array("d")
+        for _ in range(days):
+            close = max(round(close * (1.0 + rng.gauss(0.0, 0.02)), 2), 0.01)
+            closes.append(close)
+        stock = Stock(symbol, symbol + " Inc", float(rng.randrange(1, 1000)))
+        stock.DataList.extend_rows(array("i", range(start, start + days)), closes,
+                                   array("d", (float(rng.randrange(1000, 5000000)) for _ in range(days))))
+        stocks.append(stock)
+    return stocks
+
+
+# Time func(setup()) `repeat` times; only func is timed
+def _time_runs(func, setup=None, repeat=SUITE_REPEAT):
+    runs = []
+    for _ in range(repeat):
+        argument = setup() if setup is not None else None
+        start = time.perf_counter()
+        func(argument)
+        runs.append(time.perf_counter() - start)
+    return runs
+
+
+def _git_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+# Time each operation on a synthetic portfolio and return the results as a
+# dict ready for json.dump: metadata plus {operation: {"best_s", "mean_s", "runs"}}
+def run_suite(symbols=SUITE_SYMBOLS, days=SUITE_DAYS, repeat=SUITE_REPEAT, seed=SUITE_SEED):
+    import platform
+    import random
+    import stock_data
+    import stock_valuation
+    from stock_class import Portfolio
+    from stock_web import parse_history_page
+    from utilities import sortDailyData, sortStocks
+
+    stocks = synthetic_portfolio(symbols, days, seed)
+    timings = {}
+    old_path = stock_db.get_database_path()
+    with tempfile.TemporaryDirectory() as directory:
+        databases = iter(range(10 ** 9))
+
+        def new_database():
+            stock_db.set_database_path(os.path.join(directory, f"stocks{next(databases)}.db"))
+
+        def new_portfolio():
+            # fresh copies, so every stock and row is unsaved again
+            portfolio = Portfolio()
+            for stock in stocks:
+                copy = Stock(stock.symbol, stock.name, stock.shares)
+                copy.DataList.extend_rows(stock.DataList.dates, stock.DataList.closes, stock.DataList.volumes)
+                portfolio.append(copy)
+            return portfolio
+
+        def empty_database_and_portfolio():
+            new_database()
+            stock_data.create_database()
+            return new_portfolio()
+
+        try:
+            timings["create_database"] = _time_runs(lambda _: stock_data.create_database(),
+                                                    setup=new_database, repeat=repeat)
+            timings["save_stock_data"] = _time_runs(stock_data.save_stock_data,
+                                                    setup=empty_database_and_portfolio, repeat=repeat)
+            # the last save left a full database behind
+            timings["load_stock_data"] = _time_runs(stock_data.load_stock_data, setup=Portfolio, repeat=repeat)
+
+            csv_dir = os.path.join(directory, "csv")
+            os.mkdir(csv_dir)
+            for stock in stocks:
+                start = datetime.fromordinal(stock.DataList.dates[0])
+                write_stock_csv(os.path.join(csv_dir, stock.symbol + ".csv"), days, start)
+
+            def import_all(portfolio):
+                for stock in portfolio:
+                    stock_data.import_stock_web_csv(portfolio, stock.symbol, os.path.join(csv_dir, stock.symbol + ".csv"))
+
+            timings["import_stock_web_csv"] = _time_runs(
+                import_all, setup=lambda: Portfolio(Stock(stock.symbol, stock.name, 0) for stock in stocks), repeat=repeat)
+        finally:
+            stock_db.set_database_path(old_path)
+
+    rng = random.Random(seed)
+
+    def shuffled_histories():
+        # rows appended in random order, so every history has a sort pending
+        portfolio = []
+        for stock in stocks:
+            rows = list(stock.DataList.rows())
+            rng.shuffle(rows)
+            copy = Stock(stock.symbol, stock.name, stock.shares)
+            copy.DataList.extend_rows(*zip(*rows))
+            portfolio.append(copy)
+        return portfolio
+
+    timings["sortStocks"] = _time_runs(sortStocks, setup=lambda: Portfolio(stocks), repeat=repeat)
+    timings["sortDailyData"] = _time_runs(sortDailyData, setup=shuffled_histories, repeat=repeat)
+
+    def cold_report(portfolio):
+        stock_valuation._last_valuation = None # time the valuation too, not the cached copy
+        stock_valuation.valuation_report(portfolio)
+
+    timings["valuation_report"] = _time_runs(cold_report, setup=lambda: stocks, repeat=repeat)
+
+    with open(os.path.join(FIXTURE_DIR, "yahoo_history_AAPL.html")) as page:
+        html = page.read()
+    timings["parse_history_page"] = _time_runs(lambda _: parse_history_page(html), repeat=repeat)
+
+    return {
+        "format": SUITE_FORMAT,
+        "commit": _git_commit(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {"symbols": symbols, "days": days, "repeat": repeat, "seed": seed},
+        "results": {name: {"best_s": min(runs), "mean_s": sum(runs) / len(runs), "runs": runs}
+                    for name, runs in timings.items()},
+    }
+
+
+# Compare two suite results operation by operation (best times). Returns a
+# list of (operation, baseline s, current s, ratio, regressed) tuples.
+def compare_suites(baseline, current, threshold=REGRESSION_THRESHOLD, min_seconds=REGRESSION_MIN_S):
+    if baseline.get("parameters") != current.get("parameters"):
+        raise ValueError(f"Runs used different parameters: {baseline.get('parameters')} vs {current.get('parameters')}")
+    rows = []
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        old, new = before["best_s"], result["best_s"]
+        ratio = new / old if old else float("inf")
+        regressed = ratio > 1.0 + threshold and new - old > min_seconds
+        rows.append((name, old, new, ratio, regressed))
+    return rows
+
+
+def print_suite(results):
+    parameters = results["parameters"]
+    print(f"Suite: {parameters['symbols']:,} symbols x {parameters['days']:,} days, "
+          f"best of {parameters['repeat']} (commit {results['commit'] or 'unknown'})")
+    for name, result in results["results"].items():
+        print(f"{name + ':':24s}{result['best_s'] * 1000:10.2f} ms  (mean {result['mean_s'] * 1000:.2f} ms)")
+
+
+def print_comparison(rows, baseline, current):
+    print(f"Baseline {baseline['commit'] or 'unknown'} ({baseline['created']}) -> "
+          f"current {current['commit'] or 'unknown'} ({current['created']})")
+    for name, old, new, ratio, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name + ':':24s}{old * 1000:10.2f} ms -> {new * 1000:10.2f} ms  x{ratio:5.2f}{flag}")
+
+
+# Every benchmark above, old implementation against new, printed as a report
+def print_all():
+    print("Price history benchmark ---")
+    results = bench_history()
+    print(f"Rows: {results['rows']:,}")
+    print(f"List of DailyData objects:  {results['list_bytes'] / 1e6:8.1f} MB")
+    print(f"PriceHistory columns:       {results['history_bytes'] / 1e6:8.1f} MB")
+    print(f"Iterate list (close):       {results['list_iter_s'] * 1000:8.1f} ms")
+    print(f"Iterate history views:      {results['history_view_iter_s'] * 1000:8.1f} ms")
+    print(f"Sum history close column:   {results['history_column_iter_s'] * 1000:8.1f} ms")
+
+    print()
+    print("Database load benchmark ---")
+    results = bench_load()
+    print(f"Symbols x days: {results['symbols']:,} x {results['days']:,}")
+    print(f"Per-symbol queries (old):   {results['legacy_load_s']:8.2f} s")
+    print(f"load_stock_data:            {results['load_s']:8.2f} s")
+
+    print()
+    print("CSV import benchmark ---")
+    results = bench_csv_import()
+    print(f"Rows: {results['rows']:,}")
+    print(f"csv.reader row by row (old): {results['legacy_import_s']:7.2f} s")
+    print(f"import_stock_web_csv:        {results['import_s']:7.2f} s")
+
+    print()
+    print("Parquet benchmark ---")
+    results = bench_parquet()
+    print(f"Symbols x days: {results['symbols']:,} x {results['days']:,}")
+    print(f"load_stock_data (SQLite):   {results['load_s']:8.2f} s")
+    print(f"export_stock_parquet:       {results['export_s']:8.2f} s")
+    print(f"import_stock_parquet, all:  {results['import_s']:8.2f} s")
+    print(f"{results['subset']} symbols x last {results['window_days']} days: {results['filtered_s'] * 1000:6.1f} ms")
+
+    print()
+    print("Memory-mapped history benchmark ---")
+    results = bench_mmap()
+    print(f"Symbols x days: {results['symbols']:,} x {results['days']:,}")
+    print(f"load_stock_data (SQLite):   {results['load_s']:8.2f} s")
+    print(f"save_universe:              {results['save_s']:8.2f} s")
+    print(f"Open + one symbol's close:  {results['open_one_s'] * 1000:8.2f} ms")
+    print(f"Value portfolio, SQLite:    {results['load_value_s']:8.2f} s (load included)")
+    print(f"Value portfolio, mapped:    {results['mapped_value_s']:8.2f} s")
+
+    print()
+    print("Technical indicator benchmark ---")
+    results = bench_analytics()
+    print(f"Symbols x days: {results['symbols']:,} x {results['days']:,}")
+    print(f"All indicators, cold:       {results['cold_s']:8.2f} s")
+    print(f"All indicators, cached:     {results['cached_s'] * 1000:8.1f} ms")
+    print(f"After adding one day:       {results['updated_s']:8.2f} s")
+
+    print()
+    print("Rolling statistics benchmark (one new day per stock) ---")
+    results = bench_rolling()
+    print(f"Symbols x days: {results['symbols']:,} x {results['days']:,}, window {results['window']}")
+    print(f"Accumulators via add_data:  {results['streaming_s'] * 1000:8.1f} ms "
+          f"({results['streaming_s'] / results['symbols'] * 1e6:.1f} us per stock)")
+    print(f"Full rescan (analytics):    {results['rescan_s']:8.2f} s")
+
+    print()
+    print("Portfolio valuation benchmark ---")
+    results = bench_valuation()
+    print(f"Symbols x days: {results['symbols']:,} x {results['days']:,}")
+    print(f"Daily values, all dates:    {results['build_s']:8.2f} s")
+    print(f"Value as of a date:         {results['as_of_s'] * 1e6:8.1f} us")
+
+    print()
+    print("History tab benchmark (selecting a stock) ---")
+    results = bench_history_view()
+    print(f"Rows: {results['rows']:,}")
+    print(f"Format every row (old):     {results['format_all_s'] * 1000:8.1f} ms (before any Text inserts)")
+    print(f"First page (HistoryPager):  {results['page_s'] * 1000:8.2f} ms")
+    print(f"Sort by price:              {results['sort_s'] * 1000:8.1f} ms")
+
+    print()
+    print("Chart benchmark ---")
+    results = bench_chart()
+    print(f"Points: {results['points']:,} (drawn after zoom: {results['drawn_points']:,})")
+    print(f"Every point with markers (old): {results['legacy_s']:6.2f} s")
+    print(f"Downsampled, first chart:       {results['first_s']:6.2f} s")
+    print(f"Downsampled, redraw:            {results['redraw_s']:6.2f} s")
+    print(f"Zoom to 5% of the range:        {results['zoom_s']:6.2f} s")
+
+    print()
+    print("Command line cold start benchmark ---")
+    results = bench_cli_startup()
+    print(f"Symbols x days: {results['symbols']:,} x {results['days']:,}")
+    print(f"python -c pass:             {results['python_s'] * 1000:8.0f} ms")
+    print(f"Eager imports (old):        {results['eager_imports_s'] * 1000:8.0f} ms")
+    print(f"stock_cli --help:           {results['help_s'] * 1000:8.0f} ms")
+    print(f"stock_cli load:             {results['load_s'] * 1000:8.0f} ms")
+    print(f"stock_cli report:           {results['report_s'] * 1000:8.0f} ms")
+
+    print()
+    print("Web retrieval benchmark (local stub server) ---")
+    results = bench_fetch()
+    print(f"Symbols: {results['symbols']:,}, workers: {results['workers']}")
+    print(f"http fetcher:               {results['http_s']:8.2f} s ({results['http_connections']} connections)")
+    print(f"async fetcher:              {results['async_s']:8.2f} s ({results['async_connections']} connections)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the stock analysis program. "
+                                     "With no command, runs every benchmark and prints a report.")
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    suite = commands.add_parser("suite", help="time the main operations on a synthetic portfolio")
+    suite.add_argument("--symbols", type=int, default=SUITE_SYMBOLS)
+    suite.add_argument("--days", type=int, default=SUITE_DAYS)
+    suite.add_argument("--repeat", type=int, default=SUITE_REPEAT)
+    suite.add_argument("--seed", type=int, default=SUITE_SEED)
+    suite.add_argument("-o", "--output", help="write the results to this JSON file")
+    suite.add_argument("--baseline", help="compare against this earlier JSON result")
+    commands.add_parser("check", help="run the correctness checks")
+    compare = commands.add_parser("compare", help="compare two JSON results")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    for command in (suite, compare):
+        command.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                             help="slowdown that counts as a regression (default: 0.10 = 10%%)")
+    args = parser.parse_args(argv)
+
+    if args.command is None:
+        print_all()
+        return 0
+    if args.command == "check":
+        print(f"{run_checks()} checks passed.")
+        return 0
+    if args.command == "suite":
+        current = run_suite(args.symbols, args.days, args.repeat, args.seed)
+        print_suite(current)
+        if args.output:
+            with open(args.output, "w") as out:
+                json.dump(current, out, indent=2)
+        if not args.baseline:
+            return 0
+        baseline_file = args.baseline
+    else:
+        with open(args.current) as current_file:
+            current = json.load(current_file)
+        baseline_file = args.baseline
+    with open(baseline_file) as baseline_input:
+        baseline = json.load(baseline_input)
+    rows = compare_suites(baseline, current, args.threshold)
+    print()
+    print_comparison(rows, baseline, current)
+    # exit status 1 when anything got slower, for use in scripts
+    return 1 if any(row[4] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+# Summary: This module contains an on-disk cache for scraped price history pages.
+# Each entry is stored under a hash of (symbol, period1, period2, interval) as two files:
+# the raw page (<key>.html.gz) and the rows parsed from it (<key>.json). A hit returns the
+# parsed rows, so neither the download nor the HTML parse has to be repeated.
+#
+# Entries expire after `ttl` seconds when the requested period reaches into the last day
+# (the page can still change) and after `closed_ttl` seconds otherwise. The cache is kept
+# under `max_bytes` by deleting the least recently used entries first.
+
+import gzip
+import hashlib
+import json
+import os
+import time
+
+DEFAULT_CACHE_DIR = os.environ.get("STOCK_CACHE_DIR", ".stock_cache")
+DEFAULT_TTL = 6 * 60 * 60                # 6 hours for periods that are still open
+DEFAULT_CLOSED_TTL = 30 * 24 * 60 * 60   # 30 days for periods entirely in the past
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+_default_cache = None
+
+
+# Shared cache in DEFAULT_CACHE_DIR, created on first use
+def default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResponseCache()
+    return _default_cache
+
+
+class ResponseCache:
+    def __init__(self, directory=DEFAULT_CACHE_DIR, ttl=DEFAULT_TTL, closed_ttl=DEFAULT_CLOSED_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.closed_ttl = closed_ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._sizes = {} # key -> bytes on disk
+        for entry in os.scandir(directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                key = entry.name.split(".", 1)[0]
+                self._sizes[key] = self._sizes.get(key, 0) + entry.stat().st_size
+        self._bytes = sum(self._sizes.values())
+
+    @staticmethod
+    def key(symbol, period1, period2, interval="1d"):
+        text = "|".join((symbol, str(period1), str(period2), interval))
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @property
+    def size(self):
+        return self._bytes
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, key + suffix)
+
+    # Parsed rows for a cached page, or None on a miss or an expired entry
+    def get_rows(self, key):
+        path = self._path(key, ".json")
+        try:
+            with open(path, encoding="utf-8") as entry_file:
+                entry = json.load(entry_file)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        ttl = self.ttl if entry["open"] else self.closed_ttl
+        if time.time() - entry["created"] > ttl:
+            self._remove(key)
+            self.misses += 1
+            return None
+        os.utime(path) # mark as recently used
+        self.hits += 1
+        return [tuple(row) for row in entry["rows"]]
+
+    # Raw HTML of a cached page, or None
+    def get_html(self, key):
+        try:
+            with gzip.open(self._path(key, ".html.gz"), "rt", encoding="utf-8") as html_file:
+                return html_file.read()
+        except OSError:
+            return None
+
+    # Store a page and its parsed rows. period2 is the end of the requested
+    # period in epoch seconds; it decides which TTL applies. A page without rows
+    # (a consent or error page, or a period with no trading yet) is not stored,
+    # so the next retrieve asks the site again.
+    def put(self, key, html, rows, period2):
+        if not rows:
+            return
+        now = time.time()
+        entry = {
+            "created": now,
+            "open": float(period2) > now - 24 * 60 * 60,
+            "rows": rows,
+        }
+        size = self._write(key, ".html.gz", gzip.compress(html.encode("utf-8")))
+        size += self._write(key, ".json", json.dumps(entry).encode("utf-8"))
+        self._bytes += size - self._sizes.get(key, 0)
+        self._sizes[key] = size
+        if self._bytes > self.max_bytes:
+            self._evict()
+
+    def _write(self, key, suffix, data):
+        path = self._path(key, suffix)
+        with open(path + ".tmp", "wb") as out:
+            out.write(data)
+        os.replace(path + ".tmp", path)
+        return len(data)
+
+    def _remove(self, key):
+        for suffix in (".json", ".html.gz"):
+            try:
+                os.remove(self._path(key, suffix))
+            except OSError:
+                pass
+        self._bytes -= self._sizes.pop(key, 0)
+
+    # Drop least recently used entries until the cache is back under 90% of max_bytes
+    def _evict(self):
+        def last_used(key):
+            try:
+                return os.stat(self._path(key, ".json")).st_mtime
+            except OSError:
+                return 0
+        target = self.max_bytes * 0.9
+        for key in sorted(self._sizes, key=last_used):
+            if self._bytes <= target:
+                break
+            self._remove(key)
+            self.evictions += 1
+
+    def clear(self):
+        for key in list(self._sizes):
+            self._remove(key)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "entries": len(self._sizes), "bytes": self.size}
@@ -0,0 +1,337 @@
+# Summary: This module draws the closing price charts. Long histories are downsampled to
+# about one point per pixel of the plot with the Largest-Triangle-Three-Buckets (LTTB)
+# algorithm, which keeps the peaks and troughs that make the line's shape. When the user
+# zooms or pans, only the visible range is downsampled again, so detail comes back as
+# the range narrows.
+#
+# The chart window is reused between calls. Charting another stock swaps the line's data
+# instead of building a new figure. The full-range series of each stock is cached until
+# its history changes.
+#
+# render_charts() writes a PNG for each stock of the portfolio (or a subset) without a
+# window, in worker processes, and skips the charts whose data has not changed since
+# they were last rendered.
+
+import fnmatch
+import hashlib
+import json
+import os
+import sys
+import time
+import weakref
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+import numpy as np
+import matplotlib.pyplot as plt
+import matplotlib.dates as mdates
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from stock_class import Stock
+
+CHART_WINDOW = "Stock Chart"  # figure label, so the same window is reused
+POINTS_PER_PIXEL = 1.0
+MIN_POINTS = 100              # never downsample below this many points
+MARKER_LIMIT = 100            # show point markers only when this few points are visible
+
+# Batch rendering (render_charts)
+RENDER_SIZE = (10, 5)         # inches
+RENDER_DPI = 100
+RENDER_BATCH = 16             # charts sent to a worker process at a time
+MANIFEST_FILE = "charts.json" # symbol -> fingerprint of the data each PNG was drawn from
+
+_EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
+
+# stock -> (history, history version, x, y): chart coordinates of the full history
+_series = weakref.WeakKeyDictionary()
+# stock -> (history, history version, points, x, y): the full range downsampled
+_downsampled = weakref.WeakKeyDictionary()
+
+_views = {} # figure label -> ChartView
+
+
+# Indices of `threshold` points of (x, y) chosen with Largest-Triangle-Three-Buckets.
+# The first and last points are always kept. The points in between are split into
+# threshold - 2 buckets, and each bucket keeps the point that forms the largest
+# triangle with the point kept from the bucket before and the average of the bucket
+# after. x must be increasing.
+def lttb(x, y, threshold):
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    every = (n - 2) / (threshold - 2)
+    edges = (np.arange(threshold - 1) * every).astype(np.intp) + 1
+    edges[-1] = n - 1
+
+    # average point of every bucket, from running sums
+    x_sums = np.concatenate(([0.0], np.cumsum(x)))
+    y_sums = np.concatenate(([0.0], np.cumsum(y)))
+    counts = np.diff(edges)
+    x_avg = (x_sums[edges[1:]] - x_sums[edges[:-1]]) / counts
+    y_avg = (y_sums[edges[1:]] - y_sums[edges[:-1]]) / counts
+    # the bucket after the last one is the last point
+    next_x = np.append(x_avg[1:], x[-1]).tolist()
+    next_y = np.append(y_avg[1:], y[-1]).tolist()
+
+    selected = np.empty(threshold, dtype=np.intp)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    bounds = edges.tolist()
+    for i in range(threshold - 2):
+        lo = bounds[i]
+        hi = bounds[i + 1]
+        ax = x[a]
+        ay = y[a]
+        # twice the triangle area, without the constant terms
+        area = np.abs((ax - next_x[i]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (next_y[i] - ay))
+        a = lo + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+# (x, y) downsampled to `threshold` points with LTTB
+def downsample(x, y, threshold):
+    keep = lttb(x, y, threshold)
+    return x[keep], y[keep]
+
+
+# Chart coordinates for a stock's whole history: matplotlib date numbers and closes
+def chart_series(stock):
+    history = stock.DataList
+    entry = _series.get(stock)
+    if entry is not None and entry[0] is history and entry[1] == history.version:
+        return entry[2], entry[3]
+    days = np.asarray(history.dates, dtype=np.int64) - _EPOCH_ORDINAL
+    x = mdates.date2num(days.astype("datetime64[D]"))
+    y = np.array(history.closes, dtype=np.float64)
+    _series[stock] = (history, history.version, x, y)
+    _downsampled.pop(stock, None)
+    return x, y
+
+
+# The whole history downsampled to `points`, cached while the history is unchanged
+def _full_range(stock, points):
+    x, y = chart_series(stock)
+    history = stock.DataList
+    entry = _downsampled.get(stock)
+    if entry is not None and entry[0] is history and entry[1] == history.version and entry[2] == points:
+        return entry[3], entry[4]
+    x_points, y_points = downsample(x, y, points)
+    _downsampled[stock] = (history, history.version, points, x_points, y_points)
+    return x_points, y_points
+
+
+# One chart: a figure with a single price line that follows zooming and panning
+class ChartView:
+    def __init__(self, fig=None):
+        if fig is None:
+            fig = plt.figure(num=CHART_WINDOW, figsize=(10, 5))
+        self.fig = fig
+        self.ax = fig.add_subplot()
+        (self.line,) = self.ax.plot([], [])
+        self.ax.set_xlabel("Date")
+        self.ax.set_ylabel("Closing Price")
+        self.ax.grid(True)
+        self.ax.xaxis_date()
+        self.stock = None
+        self._x = None
+        self._y = None
+        self._updating = False
+        self.ax.callbacks.connect("xlim_changed", self._on_xlim_changed)
+
+    # Points to draw across the plot: about one per pixel of its width
+    def points(self):
+        width = self.ax.get_window_extent().width
+        return max(int(width * POINTS_PER_PIXEL), MIN_POINTS)
+
+    # Show a stock's full history
+    def set_stock(self, stock):
+        self.stock = stock
+        self._x, self._y = chart_series(stock)
+        x, y = _full_range(stock, self.points())
+        self._show(x, y)
+        self.ax.set_title(stock.symbol + " Closing Price History")
+        self._updating = True
+        try:
+            self.ax.relim()
+            self.ax.autoscale()
+        finally:
+            self._updating = False
+        self.fig.tight_layout()
+
+    def _show(self, x, y):
+        self.line.set_data(x, y)
+        self.line.set_marker("o" if len(x) <= MARKER_LIMIT else "")
+
+    # Redraw the visible range at full screen resolution after a zoom or pan
+    def _on_xlim_changed(self, ax):
+        if self._updating or self._x is None or not len(self._x):
+            return
+        x_all = self._x
+        left, right = ax.get_xlim()
+        # keep one point beyond each edge so the line runs off the plot
+        lo = max(int(np.searchsorted(x_all, left, side="left")) - 1, 0)
+        hi = min(int(np.searchsorted(x_all, right, side="right")) + 1, len(x_all))
+        points = self.points()
+        if lo == 0 and hi == len(x_all):
+            x, y = _full_range(self.stock, points)
+        else:
+            x, y = downsample(x_all[lo:hi], self._y[lo:hi], points)
+        self._show(x, y)
+        self.fig.canvas.draw_idle()
+
+
+# Chart a stock in the shared chart window, reusing the window if it is still open
+def show_stock_chart(stock, block=None):
+    view = _views.get(CHART_WINDOW)
+    if view is None or not plt.fignum_exists(view.fig.number):
+        view = ChartView()
+        _views[CHART_WINDOW] = view
+    view.set_stock(stock)
+    view.fig.canvas.draw_idle()
+    plt.show(block=block)
+    return view
+
+
+# Outcome of a batch render: counts, timing and the charts that failed
+class RenderReport:
+    def __init__(self, total):
+        self.total = total
+        self.rendered = []
+        self.skipped = []
+        self.failures = {} # symbol -> error message
+        self.elapsed = 0.0
+
+    def summary(self):
+        text = (f"{len(self.rendered)} of {self.total} charts rendered, {len(self.skipped)} unchanged "
+                f"in {self.elapsed:0.2f} s.")
+        if self.failures:
+            text += f"\n{len(self.failures)} charts failed:"
+            for symbol, message in self.failures.items():
+                text += f"\n  {symbol}: {message}"
+        return text
+
+
+# Fingerprint of what a chart shows: the symbol, its dates and closes, and the
+# render settings. A chart whose fingerprint matches the manifest is up to date.
+def chart_fingerprint(stock):
+    history = stock.DataList
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{stock.symbol}|{RENDER_SIZE}|{RENDER_DPI}|{MIN_POINTS}|{MARKER_LIMIT}".encode("utf-8"))
+    digest.update(history.dates.tobytes())
+    digest.update(history.closes.tobytes())
+    return digest.hexdigest()
+
+
+def chart_filename(directory, symbol):
+    return os.path.join(directory, symbol + ".png")
+
+
+def _read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE), encoding="utf-8") as manifest:
+            return json.load(manifest)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(directory, manifest):
+    path = os.path.join(directory, MANIFEST_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as out:
+        json.dump(manifest, out, indent=0, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+_render_view = None # each worker process draws every chart on one reused figure
+
+
+# Worker: draw a batch of charts off-screen on the Agg canvas (no window, no
+# pyplot). Returns (symbol, error or None) for each chart.
+def _render_batch(directory, batch):
+    global _render_view
+    if _render_view is None:
+        fig = Figure(figsize=RENDER_SIZE, dpi=RENDER_DPI)
+        FigureCanvasAgg(fig)
+        _render_view = ChartView(fig)
+    results = []
+    for symbol, dates, closes in batch:
+        try:
+            stock = Stock(symbol, "", 0)
+            stock.DataList.extend_rows(dates, closes, array("d", bytes(8 * len(dates))))
+            _render_view.set_stock(stock)
+            filename = chart_filename(directory, symbol)
+            _render_view.fig.savefig(filename + ".tmp", format="png")
+            os.replace(filename + ".tmp", filename)
+            results.append((symbol, None))
+        except Exception as e:
+            results.append((symbol, str(e) or type(e).__name__))
+    return results
+
+
+# Render a PNG chart for each stock into `directory` in a pool of `workers`
+# processes (default: one per CPU). `symbols` limits the batch to the stocks
+# matching any of the given symbols or wildcard patterns (e.g. "A*"). Charts
+# whose data has not changed since the last render are skipped unless
+# force=True. progress(symbol, done, total, error) is called as charts finish.
+# Returns a RenderReport.
+def render_charts(stock_list, directory, symbols=None, workers=None, force=False, progress=None):
+    start = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    stocks = [stock for stock in stock_list if len(stock.DataList)]
+    if symbols is not None:
+        patterns = [symbol.upper() for symbol in symbols]
+        stocks = [stock for stock in stocks
+                  if any(fnmatch.fnmatchcase(stock.symbol.upper(), pattern) for pattern in patterns)]
+    report = RenderReport(len(stocks))
+    manifest = _read_manifest(directory)
+    fingerprints = {}
+    todo = []
+    for stock in stocks:
+        fingerprint = chart_fingerprint(stock)
+        if (not force and manifest.get(stock.symbol) == fingerprint
+                and os.path.exists(chart_filename(directory, stock.symbol))):
+            report.skipped.append(stock.symbol)
+            continue
+        fingerprints[stock.symbol] = fingerprint
+        todo.append((stock.symbol, stock.DataList.dates, stock.DataList.closes))
+    if todo:
+        done = len(report.skipped)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_render_batch, directory, todo[i:i + RENDER_BATCH])
+                       for i in range(0, len(todo), RENDER_BATCH)]
+            for future in as_completed(futures):
+                for symbol, error in future.result():
+                    if error is None:
+                        report.rendered.append(symbol)
+                        manifest[symbol] = fingerprints[symbol]
+                    else:
+                        report.failures[symbol] = error
+                        manifest.pop(symbol, None)
+                    done += 1
+                    if progress is not None:
+                        progress(symbol, done, report.total, error)
+        _write_manifest(directory, manifest)
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+# Render charts for the stocks in the database from the command line:
+# python stock_chart.py OUTPUT_DIR [SYMBOL or PATTERN ...]
+def main():
+    import stock_data
+    from stock_class import Portfolio
+    if len(sys.argv) < 2:
+        print("Usage: python stock_chart.py OUTPUT_DIR [SYMBOL ...]")
+        return
+    stock_list = Portfolio()
+    stock_data.load_stock_data(stock_list)
+    report = render_charts(stock_list, sys.argv[1], sys.argv[2:] or None)
+    print(report.summary())
+
+
+if __name__ == "__main__":
+    # execute only if run as a stand-alone script
+    main()
@@ -1,6 +1,11 @@
 # Summary: This module contains the class definitions that will be used in the stock analysis program
 
+from array import array
 from datetime import datetime
+from bisect import bisect_left, bisect_right
+from collections.abc import MutableSequence
+from itertools import islice
+from operator import lt
 
 
 class Stock:
@@ -8,7 +13,10 @@ class Stock:
         self._symbol = symbol
         self._name = name
         self._shares = shares
-        self.DataList = [] # list of daily stock data
+        self._dirty = True # symbol/name/shares changed since last load or save
+        self.DataList = PriceHistory() # daily stock data, stored by column
+        self._accumulators = {} # name -> rolling statistic fed by add_data (see stock_rolling)
+        self._accumulated = None # (history, version) the accumulators are up to date with
 
     @property
     def symbol(self):
@@ -23,6 +31,7 @@ class Stock:
     @name.setter
     def name(self,name):
         self._name = name
+        self._dirty = True
     
     @property
     def shares(self):
@@ -33,16 +42,201 @@ class Stock:
 
     def buy(self, shares):
         self._shares = self._shares + shares
+        self._dirty = True
 
     def sell(self, shares):
        self._shares = self._shares - shares
+       self._dirty = True
        
     # Add daily stock data
     def add_data(self, stock_data):
-        self.DataList.append(stock_data)
+        history = self.DataList
+        if not self._accumulators:
+            history.append(stock_data)
+            return
+        in_step = self._accumulated == (history, history.version)
+        last = history.date_range() if in_step else None
+        history.append(stock_data)
+        date_ordinal = history.dates[-1] if history.is_sorted else None
+        if in_step and (last is None or date_ordinal is not None and date_ordinal > last[1]):
+            # the common case: one new day after the last one, an O(1) update
+            close, volume = history.closes[-1], history.volumes[-1]
+            for accumulator in self._accumulators.values():
+                accumulator.update(date_ordinal, close, volume)
+            self._accumulated = (history, history.version)
+        else:
+            self._rebuild_accumulators()
+
+    # Attach a rolling statistic (stock_rolling) and fill it from the current history
+    def add_accumulator(self, accumulator):
+        self._sync_accumulators()
+        accumulator.rebuild(self.DataList)
+        self._accumulators[accumulator.name] = accumulator
+        return accumulator
+
+    def remove_accumulator(self, name):
+        del self._accumulators[name]
+
+    # Attached accumulator by name (e.g. "mean_20"), brought up to date with the history
+    def accumulator(self, name):
+        self._sync_accumulators()
+        return self._accumulators[name]
+
+    @property
+    def accumulators(self):
+        self._sync_accumulators()
+        return list(self._accumulators.values())
+
+    # Rebuild the accumulators if the history changed without going through add_data
+    # (a load, an import or a replaced DataList)
+    def _sync_accumulators(self):
+        history = self.DataList
+        if self._accumulated != (history, history.version):
+            self._rebuild_accumulators()
+
+    def _rebuild_accumulators(self):
+        history = self.DataList
+        for accumulator in self._accumulators.values():
+            accumulator.rebuild(history)
+        self._accumulated = (history, history.version)
+
+    # True if the stock or any of its daily data changed since the last load or save
+    @property
+    def is_dirty(self):
+        return self._dirty or self.DataList.is_dirty
+
+    # Called after the stock has been loaded from or saved to the database
+    def mark_clean(self):
+        self._dirty = False
+        self.DataList.mark_clean()
     
 
+# Ordered collection of stocks with a hash index by symbol. It keeps the order
+# stocks were added in and behaves like the list it replaces (append, remove,
+# pop, indexing, iteration, sort), but get(symbol) and `symbol in portfolio`
+# are O(1) and adding a second stock with the same symbol raises ValueError.
+class Portfolio(MutableSequence):
+    def __init__(self, stocks=()):
+        self._stocks = []
+        self._index = {}
+        self._by_symbol = None # cached sorted view
+        self.extend(stocks)
+
+    # Stock with this symbol, or default
+    def get(self, symbol, default=None):
+        return self._index.get(symbol, default)
+
+    def symbols(self):
+        return list(self._index)
+
+    # Stocks in symbol order. The list is cached until the portfolio changes,
+    # so treat it as read only.
+    def sorted_by_symbol(self):
+        if self._by_symbol is None:
+            self._by_symbol = sorted(self._stocks, key=_symbol_key)
+        return self._by_symbol
+
+    def _check_new(self, stock):
+        if stock.symbol in self._index:
+            raise ValueError("Stock " + stock.symbol + " is already in the portfolio")
+
+    def insert(self, index, stock):
+        self._check_new(stock)
+        self._stocks.insert(index, stock)
+        self._index[stock.symbol] = stock
+        self._by_symbol = None
+
+    def append(self, stock):
+        self._check_new(stock)
+        self._stocks.append(stock)
+        self._index[stock.symbol] = stock
+        self._by_symbol = None
+
+    def __getitem__(self, index):
+        return self._stocks[index]
+
+    def __setitem__(self, index, stock):
+        if isinstance(index, slice):
+            stocks = list(self._stocks)
+            stocks[index] = stock
+            self._replace(stocks)
+            return
+        old = self._stocks[index]
+        if stock.symbol != old.symbol:
+            self._check_new(stock)
+        del self._index[old.symbol]
+        self._stocks[index] = stock
+        self._index[stock.symbol] = stock
+        self._by_symbol = None
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            for stock in self._stocks[index]:
+                del self._index[stock.symbol]
+        else:
+            del self._index[self._stocks[index].symbol]
+        del self._stocks[index]
+        self._by_symbol = None
+
+    def _replace(self, stocks):
+        index = {}
+        for stock in stocks:
+            if stock.symbol in index:
+                raise ValueError("Stock " + stock.symbol + " is already in the portfolio")
+            index[stock.symbol] = stock
+        self._stocks = stocks
+        self._index = index
+        self._by_symbol = None
+
+    def remove(self, stock):
+        if self._index.get(stock.symbol) is not stock:
+            raise ValueError("Stock " + stock.symbol + " is not in the portfolio")
+        self._stocks.remove(stock)
+        del self._index[stock.symbol]
+        self._by_symbol = None
+
+    def clear(self):
+        self._stocks = []
+        self._index = {}
+        self._by_symbol = None
+
+    def sort(self, key=None, reverse=False):
+        self._stocks.sort(key=key, reverse=reverse)
+
+    def __contains__(self, item):
+        if isinstance(item, str):
+            return item in self._index
+        return self._index.get(item.symbol) is item
+
+    def __len__(self):
+        return len(self._stocks)
+
+    def __iter__(self):
+        return iter(self._stocks)
+
+    def __repr__(self):
+        return f"Portfolio({len(self)} stocks)"
+
+
+def _symbol_key(stock):
+    return stock.symbol
+
+
+# Find a stock by symbol: a hash lookup in a Portfolio, a scan in a plain list
+def find_stock(stock_list, symbol):
+    if isinstance(stock_list, Portfolio):
+        return stock_list.get(symbol)
+    for stock in stock_list:
+        if stock.symbol == symbol:
+            return stock
+    return None
+
+
+# Single day of stock data. Rows read back out of a PriceHistory are DailyData
+# views rebuilt from the history's columns, so keep this class small.
 class DailyData:
+    __slots__ = ("_date", "_close", "_volume")
+
     def __init__(self, date, close, volume):
         self._date = date
         self._close = close
@@ -70,6 +264,249 @@ class DailyData:
         self._volume = volume
 
 
+# Most weekdays in a row a history may lack and still count as complete: one
+# market holiday. A longer run of missing weekdays is treated as missing data.
+MAX_HOLIDAYS = 1
+
+
+# Number of Monday-Friday day ordinals from first to last (inclusive)
+def _weekdays(first, last):
+    days = last - first + 1
+    if days <= 0:
+        return 0
+    count = days // 7 * 5
+    weekday = (first - 1) % 7 # ordinal 1 is a Monday
+    for i in range(days % 7):
+        if (weekday + i) % 7 < 5:
+            count += 1
+    return count
+
+
+# Columnar store for a stock's daily history. Dates are kept as day ordinals
+# (datetime.toordinal) and closes/volumes as doubles in contiguous arrays, so a
+# history costs about 20 bytes per day instead of a DailyData object per day.
+# It behaves like the list of DailyData it replaces: append(), len(), iteration
+# and indexing (DataList[-1]) all work and hand back DailyData views.
+#
+# The history is always read back in date order with one row per date. Rows
+# that arrive in order are simply appended; a row older than (or on the same
+# date as) the last one only sets a dirty flag, and the columns are re-sorted
+# once, on the next read. When a date was added more than once the row added
+# last wins.
+#
+# It also remembers which dates were added since the last load or save, so
+# saving only has to write those rows. A history that has never been marked
+# clean counts every row as changed. `version` goes up on every change to the
+# rows, so results computed from a history can tell when they are stale.
+class PriceHistory:
+    __slots__ = ("_dates", "_closes", "_volumes", "_sorted", "_all_dirty", "_dirty_dates", "_version")
+
+    def __init__(self, data=None):
+        self._dates = array("i")
+        self._closes = array("d")
+        self._volumes = array("d")
+        self._sorted = True
+        self._all_dirty = True
+        self._dirty_dates = set()
+        self._version = 0
+        if data is not None:
+            for daily_data in data:
+                self.append(daily_data)
+
+    # Column arrays (date ordinals, closes, volumes). Treat these as read only.
+    @property
+    def dates(self):
+        self._ensure_sorted()
+        return self._dates
+
+    @property
+    def closes(self):
+        self._ensure_sorted()
+        return self._closes
+
+    @property
+    def volumes(self):
+        self._ensure_sorted()
+        return self._volumes
+
+    # Bytes used by the column buffers
+    @property
+    def nbytes(self):
+        return (self._dates.itemsize * len(self._dates)
+                + self._closes.itemsize * len(self._closes)
+                + self._volumes.itemsize * len(self._volumes))
+
+    # Change counter, bumped whenever rows are added, replaced or cleared
+    @property
+    def version(self):
+        return self._version
+
+    # True when no re-sort is pending
+    @property
+    def is_sorted(self):
+        return self._sorted
+
+    # True if rows were added since the last load or save
+    @property
+    def is_dirty(self):
+        if self._all_dirty:
+            return len(self._dates) > 0
+        return len(self._dirty_dates) > 0
+
+    # Forget about pending changes (the rows now match the database)
+    def mark_clean(self):
+        self._all_dirty = False
+        self._dirty_dates.clear()
+
+    # (date ordinal, close, volume) tuples for the rows added since the last load or save
+    def dirty_rows(self):
+        if self._all_dirty:
+            return self.rows()
+        dirty_dates = self._dirty_dates
+        return (row for row in self.rows() if row[0] in dirty_dates)
+
+    # Add a DailyData object to the history
+    def append(self, daily_data):
+        self.append_row(daily_data.date.toordinal(), daily_data.close, daily_data.volume)
+
+    # Add a row that is already split into columns (no DailyData needed)
+    def append_row(self, date_ordinal, close, volume):
+        dates = self._dates
+        if self._sorted and dates and date_ordinal <= dates[-1]:
+            self._sorted = False
+        if not self._all_dirty:
+            self._dirty_dates.add(date_ordinal)
+        self._version += 1
+        dates.append(date_ordinal)
+        self._closes.append(close)
+        self._volumes.append(volume)
+
+    # Add a batch of rows given as three equal-length column sequences. A batch
+    # that is already in order and starts after the current last date is just
+    # appended; anything else is merged on the next read.
+    def extend_rows(self, dates, closes, volumes):
+        if not len(dates):
+            return
+        current = self._dates
+        if self._sorted:
+            if current and dates[0] <= current[-1]:
+                self._sorted = False
+            elif not all(map(lt, dates, islice(dates, 1, None))):
+                self._sorted = False
+        if not self._all_dirty:
+            self._dirty_dates.update(dates)
+        self._version += 1
+        current.extend(dates)
+        self._closes.extend(closes)
+        self._volumes.extend(volumes)
+
+    # Sort by date now if any out-of-order rows are pending (otherwise a no-op)
+    def sort(self):
+        self._ensure_sorted()
+
+    def _ensure_sorted(self):
+        if self._sorted:
+            return
+        dates = self._dates
+        # sorted() is stable and finds the runs that are already in order, so
+        # merging a sorted batch onto a sorted history stays close to linear.
+        # Stability also puts the latest row for a repeated date last.
+        order = sorted(range(len(dates)), key=dates.__getitem__)
+        order = [i for i, j in zip(order, islice(order, 1, None)) if dates[i] != dates[j]] + order[-1:]
+        closes = self._closes
+        volumes = self._volumes
+        self._dates = array("i", [dates[i] for i in order])
+        self._closes = array("d", [closes[i] for i in order])
+        self._volumes = array("d", [volumes[i] for i in order])
+        self._sorted = True
+
+    def clear(self):
+        del self._dates[:]
+        del self._closes[:]
+        del self._volumes[:]
+        self._sorted = True
+        self._dirty_dates.clear()
+        self._version += 1
+
+    # First and last date ordinal held, or None when the history is empty
+    def date_range(self):
+        dates = self.dates
+        if not dates:
+            return None
+        return dates[0], dates[-1]
+
+    # Date ranges (inclusive ordinal pairs) within start..end that the history
+    # does not cover: the stretch before the first row, the stretch after the
+    # last row, and any hole between rows. Weekends never count, and before the
+    # first row and between rows up to max_holidays missing weekdays are taken
+    # as market holidays (a window starting on 1 January, a Thursday off for
+    # Thanksgiving). After the last row, where new days arrive, any weekday is
+    # missing.
+    def missing_ranges(self, start, end, max_holidays=MAX_HOLIDAYS):
+        if start > end:
+            return []
+        dates = self.dates
+        if not dates:
+            return [(start, end)]
+        missing = []
+        if start < dates[0] and _weekdays(start, dates[0] - 1) > max_holidays:
+            missing.append((start, min(end, dates[0] - 1)))
+        # only the rows around start..end need to be looked at
+        lo = max(bisect_left(dates, start) - 1, 0)
+        hi = min(bisect_right(dates, end) + 1, len(dates))
+        for i in range(lo, hi - 1):
+            if dates[i + 1] - dates[i] > max_holidays + 1 and _weekdays(dates[i] + 1, dates[i + 1] - 1) > max_holidays:
+                gap_start = max(dates[i] + 1, start)
+                gap_end = min(dates[i + 1] - 1, end)
+                if gap_start <= gap_end:
+                    missing.append((gap_start, gap_end))
+        if end > dates[-1]:
+            tail_start = max(start, dates[-1] + 1)
+            if _weekdays(tail_start, end):
+                missing.append((tail_start, end))
+        return missing
+
+    # Iterate over raw (date ordinal, close, volume) tuples without building views
+    def rows(self):
+        self._ensure_sorted()
+        return zip(self._dates, self._closes, self._volumes)
+
+    def _view(self, i):
+        return DailyData(datetime.fromordinal(self._dates[i]), self._closes[i], self._volumes[i])
+
+    def __len__(self):
+        self._ensure_sorted()
+        return len(self._dates)
+
+    def __iter__(self):
+        self._ensure_sorted()
+        fromordinal = datetime.fromordinal
+        for date_ordinal, close, volume in zip(self._dates, self._closes, self._volumes):
+            yield DailyData(fromordinal(date_ordinal), close, volume)
+
+    def __getitem__(self, index):
+        self._ensure_sorted()
+        if isinstance(index, slice):
+            return [self._view(i) for i in range(*index.indices(len(self._dates)))]
+        return self._view(index)
+
+    def __setitem__(self, index, daily_data):
+        self._ensure_sorted()
+        dates = self._dates
+        date_ordinal = daily_data.date.toordinal()
+        dates[index] = date_ordinal
+        if not self._all_dirty:
+            self._dirty_dates.add(date_ordinal)
+        self._closes[index] = daily_data.close
+        self._volumes[index] = daily_data.volume
+        self._version += 1
+        i = index % len(dates)
+        if (i > 0 and dates[i - 1] >= date_ordinal) or (i + 1 < len(dates) and dates[i + 1] <= date_ordinal):
+            self._sorted = False
+
+    def __repr__(self):
+        return f"PriceHistory({len(self)} rows)"
+
 # Unit Test - Do Not Change Code Below This Line *** *** *** *** *** *** *** *** ***
 # main() is used for unit testing only. It will run when stock_class.py is run.
 # Run this to test your class code. Once you have eliminated all errors, you are
@@ -0,0 +1,356 @@
+# Summary: This module is the non-interactive command line for the stock analysis program,
+# for cron jobs and pipelines. Every command works on the database (stocks.db, or --db /
+# STOCKS_DB) and exits with status 0 on success, 1 when some of the work failed and 2 on
+# bad arguments.
+#
+#   python stock_cli.py load                           summary of what is in the database
+#   python stock_cli.py import FILE_OR_FOLDER          import Yahoo! Finance CSV files, a Parquet export
+#                                                      or a memory-mapped universe
+#   python stock_cli.py refresh [--start D] [--end D]  fetch missing days from the web
+#   python stock_cli.py report [--as-of D]             portfolio value (text, csv or json), from the
+#                                                      database or a universe (--universe DIR)
+#   python stock_cli.py export [OUTPUT]                price history as CSV (or --format parquet / mmap)
+#   python stock_cli.py charts OUTPUT_DIR              render PNG charts
+#
+# --metrics FILE writes the time, rows and errors of each phase of the command (see
+# stock_metrics) as JSON, or as Prometheus text when FILE ends in .prom. --profile FILE
+# saves a cProfile capture of the command and prints the most expensive calls.
+#
+# Only argparse and the standard library are imported up front. Each command imports
+# the modules it needs when it runs, so `report` never loads pandas or matplotlib and
+# `--help` loads almost nothing.
+
+import argparse
+import fnmatch
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+DATE_FORMATS = ("%m/%d/%y", "%Y-%m-%d")
+
+
+def parse_date(text):
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format)
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(f"invalid date: {text} (use m/d/yy or YYYY-MM-DD)")
+
+
+# Create the database, or bring an existing one up to the current schema
+def open_database(path=None):
+    import stock_db
+    import stock_data
+    if path is not None:
+        stock_db.set_database_path(path)
+    if os.path.exists(stock_db.get_database_path()):
+        stock_data.migrate_database()
+    else:
+        stock_data.create_database()
+
+
+def load_portfolio():
+    import stock_data
+    from stock_class import Portfolio
+    stock_list = Portfolio()
+    stock_data.load_stock_data(stock_list)
+    return stock_list
+
+
+# Stocks matching any of the symbols or wildcard patterns (all stocks when there are none)
+def select_stocks(stock_list, symbols):
+    if not symbols:
+        return list(stock_list)
+    patterns = [symbol.upper() for symbol in symbols]
+    return [stock for stock in stock_list
+            if any(fnmatch.fnmatchcase(stock.symbol.upper(), pattern) for pattern in patterns)]
+
+
+def _print_progress(args, text):
+    if not args.quiet:
+        print(text, file=sys.stderr)
+
+
+def cmd_load(args):
+    stock_list = load_portfolio()
+    rows = sum(len(stock.DataList) for stock in stock_list)
+    ranges = [stock.DataList.date_range() for stock in stock_list if len(stock.DataList)]
+    summary = {
+        "database": os.path.abspath(_database_path()),
+        "stocks": len(stock_list),
+        "rows": rows,
+        "first_date": datetime.fromordinal(min(r[0] for r in ranges)).date().isoformat() if ranges else None,
+        "last_date": datetime.fromordinal(max(r[1] for r in ranges)).date().isoformat() if ranges else None,
+    }
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(f"{summary['stocks']} stocks, {summary['rows']:,} daily rows in {summary['database']}")
+        if ranges:
+            print(f"History from {summary['first_date']} to {summary['last_date']}")
+    return 0
+
+
+def _database_path():
+    import stock_db
+    return stock_db.get_database_path()
+
+
+def cmd_import(args):
+    import stock_data
+    from stock_class import Stock
+    stock_list = load_portfolio()
+    if os.path.isfile(os.path.join(args.path, stock_data.PARQUET_STOCKS_FILE)):
+        report = stock_data.import_stock_parquet(stock_list, args.path, symbols=args.symbols,
+                                                 start=args.start, end=args.end)
+        stock_data.save_stock_data(stock_list)
+        print(report.summary())
+        return 0
+    if os.path.isfile(os.path.join(args.path, "stocks.json")):
+        import stock_mmap
+        symbols = [symbol.upper() for symbol in args.symbols] if args.symbols else None
+        imported = stock_mmap.load_universe([], args.path, symbols, args.start, args.end)
+        for stock in imported:
+            existing = stock_list.get(stock.symbol)
+            if existing is None:
+                stock_list.append(stock)
+            else:
+                existing.DataList.extend_rows(stock.DataList.dates, stock.DataList.closes, stock.DataList.volumes)
+        stock_data.save_stock_data(stock_list)
+        print(f"{sum(len(stock.DataList) for stock in imported):,} rows from {len(imported)} stocks imported.")
+        return 0
+    if args.symbols or args.start or args.end:
+        print("--symbols, --start and --end only apply to Parquet exports and universes.", file=sys.stderr)
+        return 2
+    if os.path.isdir(args.path):
+        def progress(name, done, total, error):
+            _print_progress(args, f"[{done}/{total}] {name}" + (f": {error}" if error else ""))
+        report = stock_data.import_stock_csv_dir(stock_list, args.path, workers=args.workers, progress=progress)
+        print(report.summary())
+        return 1 if report.failures else 0
+    symbol = (args.symbol or stock_data.csv_symbol(args.path)).upper()
+    # read the file before touching the portfolio, so a bad file adds nothing
+    try:
+        dates, closes, volumes = stock_data.read_stock_web_csv(args.path)
+    except (OSError, ValueError) as e:
+        print(f"Error: cannot import {args.path}: {e}", file=sys.stderr)
+        return 1
+    stock = stock_list.get(symbol)
+    if stock is None:
+        stock = Stock(symbol, symbol, 0)
+        stock_list.append(stock)
+    stock.DataList.extend_rows(dates, closes, volumes)
+    stock_data.save_stock_data([stock])
+    print(f"{len(dates):,} rows imported for {symbol}.")
+    return 0
+
+
+def cmd_refresh(args):
+    import stock_data
+    stock_list = load_portfolio()
+    stocks = select_stocks(stock_list, args.symbols)
+    if not stocks:
+        print("No stocks to refresh.")
+        return 0
+    end = args.end or datetime.now()
+    start = args.start or end - timedelta(days=365)
+    cache = None
+    if not args.no_cache:
+        import stock_cache
+        cache = stock_cache.default_cache()
+
+    def progress(symbol, done, total, error):
+        _print_progress(args, f"[{done}/{total}] {symbol}" + (f": {error}" if error else ""))
+
+    report = stock_data.retrieve_stock_web(
+        start.strftime("%m/%d/%y"), end.strftime("%m/%d/%y"), stocks,
+        workers=args.workers, progress=progress, fetcher=args.fetcher,
+        incremental=not args.full, cache=cache)
+    stock_data.save_stock_data(stocks)
+    print(report.summary())
+    return 1 if report.failures else 0
+
+
+def cmd_report(args):
+    from stock_valuation import portfolio_valuation, price_as_of, valuation_report
+    if args.universe:
+        import stock_mmap
+        stock_list = stock_mmap.open_universe(args.universe)
+    else:
+        stock_list = load_portfolio()
+    if args.format == "text":
+        for line in valuation_report(stock_list, args.as_of):
+            print(line)
+        return 0
+    valuation = portfolio_valuation(stock_list)
+    found = valuation.latest() if args.as_of is None else valuation.as_of(args.as_of)
+    if found is None:
+        print("No price history on or before that date.", file=sys.stderr)
+        return 1
+    as_of, total = found
+    holdings = []
+    for stock in stock_list:
+        price = price_as_of(stock.DataList, as_of) if len(stock.DataList) else None
+        holdings.append({
+            "symbol": stock.symbol,
+            "name": stock.name,
+            "shares": stock.shares,
+            "price": price[1] if price else None,
+            "value": stock.shares * price[1] if price else None,
+        })
+    as_of_text = datetime.fromordinal(as_of).date().isoformat()
+    if args.format == "json":
+        print(json.dumps({"as_of": as_of_text, "total": total, "holdings": holdings}, indent=2))
+    else:
+        import csv
+        writer = csv.writer(sys.stdout, lineterminator="\n")
+        writer.writerow(["date", "symbol", "name", "shares", "price", "value"])
+        for holding in holdings:
+            writer.writerow([as_of_text, holding["symbol"], holding["name"], holding["shares"],
+                             holding["price"], holding["value"]])
+        writer.writerow([as_of_text, "TOTAL", "", "", "", total])
+    return 0
+
+
+# One row per stock per day: symbol,date,close,volume (or a Parquet export, see
+# stock_data.export_stock_parquet)
+def cmd_export(args):
+    import csv
+    stock_list = load_portfolio()
+    if args.format == "parquet":
+        import stock_data
+        if args.output == "-" or args.start or args.end:
+            print("Parquet export needs an output folder and always includes every day.", file=sys.stderr)
+            return 2
+        rows = stock_data.export_stock_parquet(select_stocks(stock_list, args.symbols), args.output)
+        print(f"{rows:,} rows written to {args.output}.")
+        return 0
+    if args.format == "mmap":
+        import stock_mmap
+        if args.output == "-" or args.start or args.end:
+            print("A universe export needs an output folder and always includes every day.", file=sys.stderr)
+            return 2
+        stocks = select_stocks(stock_list, args.symbols)
+        stock_mmap.save_universe(stocks, args.output, only_changed=False)
+        print(f"{len(stocks)} history files written to {args.output}.")
+        return 0
+    start = args.start.toordinal() if args.start else None
+    end = args.end.toordinal() if args.end else None
+    out = sys.stdout if args.output == "-" else open(args.output, "w", newline="")
+    try:
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(["symbol", "date", "close", "volume"])
+        rows = 0
+        for stock in select_stocks(stock_list, args.symbols):
+            symbol = stock.symbol
+            fromordinal = datetime.fromordinal
+            for date_ordinal, close, volume in stock.DataList.rows():
+                if (start is not None and date_ordinal < start) or (end is not None and date_ordinal > end):
+                    continue
+                writer.writerow([symbol, fromordinal(date_ordinal).strftime("%Y-%m-%d"), close, int(volume)])
+                rows += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if out is not sys.stdout:
+        print(f"{rows:,} rows written to {args.output}.")
+    return 0
+
+
+def cmd_charts(args):
+    import stock_chart
+    stock_list = load_portfolio()
+
+    def progress(symbol, done, total, error):
+        _print_progress(args, f"[{done}/{total}] {symbol}" + (f": {error}" if error else ""))
+
+    report = stock_chart.render_charts(stock_list, args.directory, symbols=args.symbols or None,
+                                       workers=args.workers, force=args.force, progress=progress)
+    print(report.summary())
+    return 1 if report.failures else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="stock_cli", description="Stock portfolio batch commands.")
+    parser.add_argument("--db", help="database file (default: STOCKS_DB or stocks.db)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="no progress output")
+    parser.add_argument("--metrics", metavar="FILE", help="write phase timings as JSON (or Prometheus text for *.prom)")
+    parser.add_argument("--profile", metavar="FILE", help="save a cProfile capture of the command to FILE")
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND", required=True)
+
+    load = commands.add_parser("load", help="load the database and summarize it")
+    load.add_argument("--json", action="store_true", help="print the summary as JSON")
+    load.set_defaults(func=cmd_load)
+
+    imports = commands.add_parser("import", help="import a Yahoo! Finance CSV file, a folder of them, or a Parquet export")
+    imports.add_argument("path", help="CSV file, a folder with one CSV file per symbol, or a Parquet export folder")
+    imports.add_argument("--symbol", help="symbol for a single file (default: from the file name)")
+    imports.add_argument("--workers", type=int, help="processes for a folder (default: one per CPU)")
+    imports.add_argument("--symbols", nargs="+", help="Parquet or universe: only these symbols")
+    imports.add_argument("--start", type=parse_date, help="Parquet: first date to import")
+    imports.add_argument("--end", type=parse_date, help="Parquet: last date to import")
+    imports.set_defaults(func=cmd_import)
+
+    refresh = commands.add_parser("refresh", help="retrieve price history from the web and save it")
+    refresh.add_argument("symbols", nargs="*", help="symbols or patterns such as 'A*' (default: all)")
+    refresh.add_argument("--start", type=parse_date, help="first date (default: a year before --end)")
+    refresh.add_argument("--end", type=parse_date, help="last date (default: today)")
+    refresh.add_argument("--full", action="store_true", help="fetch the whole range, not only missing days")
+    refresh.add_argument("--fetcher", choices=("async", "http", "selenium"), help="page fetcher (default: async)")
+    refresh.add_argument("--workers", type=int, default=4, help="pages in flight at once")
+    refresh.add_argument("--no-cache", action="store_true", help="do not use the page cache")
+    refresh.set_defaults(func=cmd_refresh)
+
+    report = commands.add_parser("report", help="value of each holding and of the portfolio")
+    report.add_argument("--as-of", type=parse_date, help="value on the last trading day on or before this date")
+    report.add_argument("--format", choices=("text", "csv", "json"), default="text")
+    report.add_argument("--universe", metavar="DIR", help="value a memory-mapped universe instead of the database")
+    report.set_defaults(func=cmd_report)
+
+    export = commands.add_parser("export", help="write price history as CSV (symbol,date,close,volume) or Parquet")
+    export.add_argument("output", nargs="?", default="-", help="output file, or folder for Parquet (default: standard output)")
+    export.add_argument("--format", choices=("csv", "parquet", "mmap"), default="csv",
+                        help="mmap writes a memory-mapped universe (see stock_mmap)")
+    export.add_argument("--symbols", nargs="+", help="symbols or patterns (default: all)")
+    export.add_argument("--start", type=parse_date, help="first date to include")
+    export.add_argument("--end", type=parse_date, help="last date to include")
+    export.set_defaults(func=cmd_export)
+
+    charts = commands.add_parser("charts", help="render a PNG chart per stock, skipping unchanged ones")
+    charts.add_argument("directory", help="output folder")
+    charts.add_argument("symbols", nargs="*", help="symbols or patterns (default: all)")
+    charts.add_argument("--force", action="store_true", help="render even if the data has not changed")
+    charts.add_argument("--workers", type=int, help="processes (default: one per CPU)")
+    charts.set_defaults(func=cmd_charts)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    open_database(args.db)
+    try:
+        if args.profile:
+            import stock_metrics
+            with stock_metrics.profile(args.profile, stream=None if args.quiet else sys.stderr):
+                return args.func(args)
+        return args.func(args)
+    except RuntimeWarning as e:
+        # the program's own "cannot do that" errors (missing driver or package, ...)
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    except BrokenPipeError:
+        # the reader of a pipe (e.g. head) stopped early; point stdout at
+        # devnull so the interpreter's final flush does not fail again
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    finally:
+        if args.metrics:
+            import stock_metrics
+            stock_metrics.write_report(args.metrics)
+
+
+if __name__ == "__main__":
+    # execute only if run as a stand-alone script
+    sys.exit(main())
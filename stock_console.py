@@ -1,10 +1,13 @@
 # Summary: This module contains the user interface and logic for a console-based version of the stock manager program.
 
 from datetime import datetime
-from stock_class import Stock, DailyData
+from stock_class import Stock, DailyData, Portfolio, find_stock
+from stock_valuation import valuation_report
 from utilities import clear_screen, display_stock_chart
 from os import path
 import stock_data
+import stock_db
+import stock_cache
 
 
 # Main Menu
@@ -85,8 +88,11 @@ def add_stock(stock_list):
     name = input("Enter stock name: ")
     shares = float(input("Enter number of shares: "))
     new_stock = Stock(symbol, name, shares)
-    stock_list.append(new_stock)
-    print("Stock added!")
+    try:
+        stock_list.append(new_stock)
+        print("Stock added!")
+    except ValueError as e:
+        print(e)
     input("Press Enter to continue...")
 
         
@@ -138,15 +144,11 @@ def buy_stock(stock_list):
         input("Press Enter to continue...")
         return
 
-    found = False
-    for stock in stock_list:
-        if stock.symbol == symbol:
-            stock.buy(amount)
-            print(f"\nUpdated {symbol}: now has {stock.shares} shares.")
-            found = True
-            break
-
-    if not found:
+    stock = find_stock(stock_list, symbol)
+    if stock is not None:
+        stock.buy(amount)
+        print(f"\nUpdated {symbol}: now has {stock.shares} shares.")
+    else:
         print("\nStock symbol not found.")
 
     input("Press Enter to continue...")
@@ -176,19 +178,15 @@ def sell_stock(stock_list):
         input("Press Enter to continue...")
         return
 
-    found = False
-    for stock in stock_list:
-        if stock.symbol == symbol:
-            try:
-                stock.sell(amount)
-                print(f"\nUpdated {symbol}: now has {stock.shares} shares.")
-            except Exception as e:
-                # In case Stock.sell() has any checks
-                print("\nError while selling shares:", e)
-            found = True
-            break
-
-    if not found:
+    stock = find_stock(stock_list, symbol)
+    if stock is not None:
+        try:
+            stock.sell(amount)
+            print(f"\nUpdated {symbol}: now has {stock.shares} shares.")
+        except Exception as e:
+            # In case Stock.sell() has any checks
+            print("\nError while selling shares:", e)
+    else:
         print("\nStock symbol not found.")
 
     input("Press Enter to continue...")
@@ -210,19 +208,15 @@ def delete_stock(stock_list):
 
     symbol = input("\nEnter stock symbol to delete: ").upper()
 
-    index_to_remove = -1
-    for i, stock in enumerate(stock_list):
-        if stock.symbol == symbol:
-            index_to_remove = i
-            break
+    to_remove = find_stock(stock_list, symbol)
 
-    if index_to_remove == -1:
+    if to_remove is None:
         print("\nStock symbol not found.")
     else:
         confirm = input(f"Are you sure you want to delete {symbol}? (y/n): ").lower()
         if confirm == "y":
-            removed = stock_list.pop(index_to_remove)
-            print(f"\n{removed.symbol} removed from portfolio.")
+            stock_list.remove(to_remove)
+            print(f"\n{to_remove.symbol} removed from portfolio.")
         else:
             print("\nDelete cancelled.")
 
@@ -259,11 +253,7 @@ def add_stock_data(stock_list):
 
     symbol = input("\nEnter stock symbol to add data for: ").upper()
 
-    chosen_stock = None
-    for stock in stock_list:
-        if stock.symbol == symbol:
-            chosen_stock = stock
-            break
+    chosen_stock = find_stock(stock_list, symbol)
 
     if chosen_stock is None:
         print("\nStock symbol not found.")
@@ -301,20 +291,20 @@ def display_report(stock_list):
         input("\nPress Enter to continue...")
         return
 
-    for stock in stock_list:
-        # Basic info
-        line = f"{stock.symbol} - {stock.name} - {stock.shares} shares"
-
-        # Try to show latest price & value if we have history
-        last_price = None
-        if hasattr(stock, "DataList") and stock.DataList:
-            # assume DataList is in date order, take last
-            last_price = stock.DataList[-1].close
-
-        if last_price is not None:
-            value = stock.shares * last_price
-            line += f" | Last Price: ${last_price:0.2f} | Value: ${value:0.2f}"
+    date_str = input("Value as of date (m/d/yy, Enter for latest): ").strip()
+    as_of = None
+    if date_str:
+        try:
+            as_of = datetime.strptime(date_str, "%m/%d/%y")
+        except ValueError:
+            print("\nInvalid date.")
+            input("\nPress Enter to continue...")
+            return
+    print()
 
+    # one line per stock plus the portfolio total, valued on the last
+    # trading day on or before the date
+    for line in valuation_report(stock_list, as_of):
         print(line)
 
     input("\nPress Enter to continue...")
@@ -359,10 +349,11 @@ def manage_data(stock_list):
         print("2 - Load Data from Database")
         print("3 - Retrieve Data from Web")
         print("4 - Import from CSV File")
+        print("5 - Import Folder of CSV Files")
         print("0 - Exit Manage Data")
         option = input("Enter Menu Option: ")
 
-        while option not in ["1", "2", "3", "4", "0"]:
+        while option not in ["1", "2", "3", "4", "5", "0"]:
             clear_screen()
             print("*** Invalid Option - Try again ***")
             print("Manage Data ---")
@@ -370,6 +361,7 @@ def manage_data(stock_list):
             print("2 - Load Data from Database")
             print("3 - Retrieve Data from Web")
             print("4 - Import from CSV File")
+            print("5 - Import Folder of CSV Files")
             print("0 - Exit Manage Data")
             option = input("Enter Menu Option: ")
 
@@ -385,6 +377,8 @@ def manage_data(stock_list):
             retrieve_from_web(stock_list)
         elif option == "4":
             import_csv(stock_list)  # will implement this later in section 2 of the lab
+        elif option == "5":
+            import_csv_folder(stock_list)
         else:
             print("Returning to Main Menu...")
             input("Press Enter to continue...")
@@ -403,10 +397,18 @@ def retrieve_from_web(stock_list):
 
     dateStart = input("Enter starting date (m/d/yy): ")
     dateEnd = input("Enter ending date (m/d/yy): ")
+    incremental = input("Only retrieve dates that are missing? (y/n): ").lower() == "y"
+
+    def show_progress(symbol, done, total, error):
+        if error is None:
+            print(f"[{done}/{total}] {symbol} retrieved")
+        else:
+            print(f"[{done}/{total}] {symbol} failed: {error}")
 
     try:
-        recordCount = stock_data.retrieve_stock_web(dateStart, dateEnd, stock_list)
-        print(f"{recordCount} records retrieved.")
+        report = stock_data.retrieve_stock_web(dateStart, dateEnd, stock_list, progress=show_progress,
+                                               incremental=incremental, cache=stock_cache.default_cache())
+        print(report.summary())
     except RuntimeWarning as e:
         print("Error:", e)
         print("Check your ChromeDriver installation / PATH.")
@@ -440,12 +442,37 @@ def import_csv(stock_list):
     input("\nPress Enter to continue...")
 
 
+# Import a folder of Yahoo! Finance CSV files, one per symbol (e.g. AAPL.csv)
+def import_csv_folder(stock_list):
+    clear_screen()
+    print("Import Folder of CSV Files ---\n")
+    print("Each file is imported into the stock named by the file (AAPL.csv -> AAPL).")
+    print("Stocks that are not being tracked yet are added with 0 shares.\n")
+
+    directory = input("Enter full path to folder: ")
+    if not path.isdir(directory):
+        print("\nFolder not found. Check the path and try again.")
+        input("\nPress Enter to continue...")
+        return
+
+    try:
+        report = stock_data.import_stock_csv_dir(stock_list, directory)
+        print("\n" + report.summary())
+        print("Imported data saved to database.")
+    except Exception as e:
+        print("\nAn error occurred while importing data:", e)
+
+    input("\nPress Enter to continue...")
+
+
 # Begin program
 def main():
     #check for database, create if not exists
-    if path.exists("stocks.db") == False:
+    if path.exists(stock_db.get_database_path()) == False:
         stock_data.create_database()
-    stock_list = []
+    else:
+        stock_data.migrate_database()
+    stock_list = Portfolio()
     main_menu(stock_list)
 
 # Program Starts Here
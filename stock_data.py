@@ -1,138 +1,641 @@
 # Summary: This module contains the functions used by both console and GUI programs to manage stock data.
 
 
-import sqlite3
-from selenium import webdriver
-from selenium.webdriver.common.keys import Keys
-from bs4 import BeautifulSoup
 import re
-import pandas as pd
 import os
 import csv
 import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
-from utilities import clear_screen
-from utilities import sortDailyData
-from stock_class import Stock, DailyData
-
-# Create the SQLite database
-def create_database():
-    stockDB = "stocks.db"
-    conn = sqlite3.connect(stockDB)
-    cur = conn.cursor()
-    createStockTableCmd = """CREATE TABLE IF NOT EXISTS stocks (
-                            symbol TEXT NOT NULL PRIMARY KEY,
-                            name TEXT,
-                            shares REAL
-                        );"""
-    createDailyDataTableCmd = """CREATE TABLE IF NOT EXISTS dailyData (
-                                symbol TEXT NOT NULL,
-                                date TEXT NOT NULL,
-                                price REAL NOT NULL,
-                                volume REAL NOT NULL,
-                                PRIMARY KEY (symbol, date)
-                        );"""   
-    cur.execute(createStockTableCmd)
-    cur.execute(createDailyDataTableCmd)
+from itertools import groupby
+from operator import itemgetter
+import stock_db
+import stock_metrics
+from stock_class import Stock, DailyData, find_stock
+
+# Database schema version written by create_database() / migrate_database()
+# 1 - dailyData.date is "%m/%d/%y" text, volume is REAL
+# 2 - dailyData.date is a day ordinal (datetime.toordinal), volume is INTEGER,
+#     and the table is clustered on (symbol, date) with WITHOUT ROWID
+SCHEMA_VERSION = 2
+
+createStockTableCmd = """CREATE TABLE IF NOT EXISTS stocks (
+                        symbol TEXT NOT NULL PRIMARY KEY,
+                        name TEXT,
+                        shares REAL
+                    );"""
+createDailyDataTableCmd = """CREATE TABLE IF NOT EXISTS dailyData (
+                            symbol TEXT NOT NULL,
+                            date INTEGER NOT NULL,
+                            price REAL NOT NULL,
+                            volume INTEGER NOT NULL,
+                            PRIMARY KEY (symbol, date)
+                    ) WITHOUT ROWID;"""
+createSchemaVersionTableCmd = """CREATE TABLE IF NOT EXISTS schemaVersion (
+                                version INTEGER NOT NULL
+                    );"""
+
+# Create the SQLite database. An existing database from an older version of
+# the program is migrated first, so its rows are never stamped with the new
+# schema version unconverted.
+def create_database(stockDB=None):
+    conn = stock_db.get_connection(stockDB)
+    version = get_schema_version(conn)
+    if version > SCHEMA_VERSION:
+        raise RuntimeWarning("Database schema version " + str(version) + " is newer than this program supports")
+    if version == 1:
+        _migrate_v1_to_v2(conn)
+    with conn:
+        cur = conn.cursor()
+        cur.execute(createStockTableCmd)
+        cur.execute(createDailyDataTableCmd)
+        cur.execute(createSchemaVersionTableCmd)
+        if cur.execute("SELECT COUNT(*) FROM schemaVersion;").fetchone()[0] == 0:
+            cur.execute("INSERT INTO schemaVersion (version) VALUES (?);", (SCHEMA_VERSION,))
+
+# Return the schema version of an open database (0 if it has no tables yet)
+def get_schema_version(conn):
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table';")}
+    if "schemaVersion" in tables:
+        return conn.execute("SELECT MAX(version) FROM schemaVersion;").fetchone()[0]
+    if "dailyData" in tables:
+        return 1
+    return 0
+
+# Upgrade an existing database in place to the current schema version.
+# Returns the version the database was at before migrating.
+def migrate_database(stockDB=None):
+    conn = stock_db.get_connection(stockDB)
+    version = get_schema_version(conn)
+    if version == 0:
+        create_database(stockDB)
+    elif version > SCHEMA_VERSION:
+        raise RuntimeWarning("Database schema version " + str(version) + " is newer than this program supports")
+    elif version == 1:
+        _migrate_v1_to_v2(conn)
+    return version
+
+# v1 -> v2: convert "%m/%d/%y" text dates to day ordinals and volumes to
+# integers, copying into a clustered WITHOUT ROWID table
+def _migrate_v1_to_v2(conn):
+    insertDailyDataCmd = """INSERT OR REPLACE INTO dailyData
+                            (symbol, date, price, volume)
+                            VALUES
+                            (?, ?, ?, ?);"""
+    date_ordinals = {}
+    with conn:
+        conn.execute("BEGIN;")
+        conn.execute("ALTER TABLE dailyData RENAME TO dailyDataV1;")
+        conn.execute(createDailyDataTableCmd)
+        readCur = conn.execute("SELECT symbol, date, price, volume FROM dailyDataV1;")
+        writeCur = conn.cursor()
+        while True:
+            dailyRows = readCur.fetchmany(10000)
+            if not dailyRows:
+                break
+            insertValues = []
+            for symbol, date_text, price, volume in dailyRows:
+                date_ordinal = date_ordinals.get(date_text)
+                if date_ordinal is None:
+                    date_ordinal = datetime.strptime(date_text,"%m/%d/%y").toordinal()
+                    date_ordinals[date_text] = date_ordinal
+                insertValues.append((symbol, date_ordinal, price, int(volume)))
+            writeCur.executemany(insertDailyDataCmd, insertValues)
+        conn.execute("DROP TABLE dailyDataV1;")
+        conn.execute(createSchemaVersionTableCmd)
+        conn.execute("DELETE FROM schemaVersion;")
+        conn.execute("INSERT INTO schemaVersion (version) VALUES (2);")
 
 # Save stocks and daily data into database
-def save_stock_data(stock_list):
-    stockDB = "stocks.db"
-    conn = sqlite3.connect(stockDB)
+# Only stocks and daily rows changed since the last load or save are written.
+# Everything goes out in one transaction as upserts, so re-saving a loaded
+# portfolio is cheap and share changes from buy()/sell() overwrite the old row.
+# If given, progress(symbol, done, total, None) is called after each stock's rows
+# are written; an exception raised from it rolls the whole save back.
+def save_stock_data(stock_list,progress=None):
+    conn = stock_db.get_connection()
     cur = conn.cursor()
-    insertStockCmd = """INSERT INTO stocks
+    upsertStockCmd = """INSERT INTO stocks
                             (symbol, name, shares)
                             VALUES
-                            (?, ?, ?); """
-    insertDailyDataCmd = """INSERT INTO dailyData
+                            (?, ?, ?)
+                            ON CONFLICT (symbol) DO UPDATE SET
+                            name = excluded.name,
+                            shares = excluded.shares; """
+    upsertDailyDataCmd = """INSERT INTO dailyData
                                     (symbol, date, price, volume)
                                     VALUES
-                                    (?, ?, ?, ?);"""
-    for stock in stock_list:
-        insertValues = (stock.symbol, stock.name, stock.shares)
-        try:
-            cur.execute(insertStockCmd, insertValues)
-            cur.execute("COMMIT;")
-        except:
-            pass
-        for daily_data in stock.DataList: 
-            insertValues = (stock.symbol,daily_data.date.strftime("%m/%d/%y"),daily_data.close,daily_data.volume)
-            try:
-                cur.execute(insertDailyDataCmd, insertValues)
-                cur.execute("COMMIT;")
-            except:
-                pass
+                                    (?, ?, ?, ?)
+                                    ON CONFLICT (symbol, date) DO UPDATE SET
+                                    price = excluded.price,
+                                    volume = excluded.volume;"""
+    changed_stocks = [stock for stock in stock_list if stock.is_dirty]
+    prepare_time = write_time = 0.0
+    rows = 0
+    with stock_metrics.phase("save", "total") as total:
+        with conn:
+            cur.executemany(upsertStockCmd, [(stock.symbol, stock.name, stock.shares) for stock in changed_stocks])
+            for done, stock in enumerate(changed_stocks, 1):
+                symbol = stock.symbol
+                started = time.perf_counter()
+                insertValues = [(symbol, date_ordinal, close, int(volume))
+                                for date_ordinal, close, volume in stock.DataList.dirty_rows()]
+                written = time.perf_counter()
+                cur.executemany(upsertDailyDataCmd, insertValues)
+                prepare_time += written - started
+                write_time += time.perf_counter() - written
+                rows += len(insertValues)
+                if progress is not None:
+                    progress(symbol, done, len(changed_stocks), None)
+            commit_start = time.perf_counter() # the commit runs as the block exits
+        commit_time = time.perf_counter() - commit_start
+        for stock in changed_stocks:
+            stock.mark_clean()
+        total.rows = rows
+    stock_metrics.record("save", "prepare", prepare_time, rows)
+    stock_metrics.record("save", "write", write_time, rows)
+    stock_metrics.record("save", "commit", commit_time)
     
 # Load stocks and daily data from database
-def load_stock_data(stock_list):
+# All daily rows come back from a single query in (symbol, date) order, which
+# is the primary key order, and are grouped into each stock's history as they
+# stream in. Dates are stored as day ordinals, so no parsing is needed.
+# If given, progress(symbol, done, total, None) is called as each stock's history
+# is filled in.
+def load_stock_data(stock_list,progress=None):
     stock_list.clear()
-    stockDB = "stocks.db"
-    conn = sqlite3.connect(stockDB)
-    stockCur = conn.cursor()
+    conn = stock_db.get_connection()
     stockSelectCmd = """SELECT symbol, name, shares
-                    FROM stocks; """
-    stockCur.execute(stockSelectCmd)
-    stockRows = stockCur.fetchall()
-    for row in stockRows:
-        new_stock = Stock(row[0],row[1],row[2])
-        dailyDataCur = conn.cursor()
-        dailyDataCmd = """SELECT date, price, volume
+                    FROM stocks
+                    ORDER BY symbol; """
+    with stock_metrics.phase("load", "total") as total:
+        with stock_metrics.phase("load", "stocks") as stocks_phase:
+            stocks = {}
+            for row in conn.execute(stockSelectCmd):
+                new_stock = Stock(row[0],row[1],row[2])
+                stocks[new_stock.symbol] = new_stock
+                stock_list.append(new_stock)
+            stocks_phase.rows = len(stocks)
+        dailyDataCmd = """SELECT symbol, date, price, volume
                         FROM dailyData
-                        WHERE symbol=?; """
-        selectValue = (new_stock.symbol)
-        dailyDataCur.execute(dailyDataCmd,(selectValue,))
-        dailyDataRows = dailyDataCur.fetchall()
-        for dailyRow in dailyDataRows:
-            daily_data = DailyData(datetime.strptime(dailyRow[0],"%m/%d/%y"),float(dailyRow[1]),float(dailyRow[2]))
-            new_stock.add_data(daily_data)
-        stock_list.append(new_stock)
-    sortDailyData(stock_list)
+                        ORDER BY symbol, date; """
+        get_date, get_price, get_volume = itemgetter(1), itemgetter(2), itemgetter(3)
+        done = 0
+        rows = 0
+        build_time = 0.0
+        started = time.perf_counter()
+        for symbol, dailyRows in groupby(conn.execute(dailyDataCmd), key=itemgetter(0)):
+            stock = stocks.get(symbol)
+            if stock is None:
+                continue
+            dailyRows = list(dailyRows)
+            built = time.perf_counter()
+            stock.DataList.extend_rows(array("i", map(get_date, dailyRows)),
+                                       array("d", map(get_price, dailyRows)),
+                                       array("d", map(get_volume, dailyRows)))
+            build_time += time.perf_counter() - built
+            rows += len(dailyRows)
+            done += 1
+            if progress is not None:
+                progress(symbol, done, len(stocks), None)
+        # "query" is SQLite stepping through the rows, "build" is filling the histories
+        stock_metrics.record("load", "query", time.perf_counter() - started - build_time, rows)
+        stock_metrics.record("load", "build", build_time, rows)
+        for stock in stock_list:
+            stock.mark_clean()
+        total.rows = rows
 
 # Get stock price history from web using Web Scraping
-def retrieve_stock_web(dateStart,dateEnd,stock_list):
-    dateFrom = str(int(time.mktime(time.strptime(dateStart,"%m/%d/%y"))))
-    dateTo = str(int(time.mktime(time.strptime(dateEnd,"%m/%d/%y"))))
-    recordCount = 0
-    for stock in stock_list:
-        stockSymbol = stock.symbol
-        url = "https://finance.yahoo.com/quote/"+stockSymbol+"/history?period1="+dateFrom+"&period2="+dateTo+"&interval=1d&filter=history&frequency=1d"
-        # Note this code assumes the use of the Chrome browser.
-        # You will have to modify if you are using a different browser.
-        options = webdriver.ChromeOptions()
-        options.add_experimental_option('excludeSwitches',['enable-logging'])
-        options.add_experimental_option("prefs",{'profile.managed_default_content_settings.javascript': 2})
-        try:
-            driver = webdriver.Chrome(options=options)
-            driver.implicitly_wait(60)
-            driver.get(url)
-        except:
-            raise RuntimeWarning("Chrome Driver Not Found")
-
-        soup = BeautifulSoup(driver.page_source,"html.parser")
-        row = soup.find('table',class_="W(100%) M(0)")
-        dataRows = soup.find_all('tr')
-        for row in dataRows:
-            td = row.find_all('td')
-            rowList = [i.text for i in td]
-            columnCount = len(rowList)
-            if columnCount == 7: # This row is a standard data row (otherwise it's a special case such as dividend which will be ignored)
-                daily_data = DailyData(datetime.strptime(rowList[0],"%b %d, %Y"),float(rowList[5].replace(',','')),float(rowList[6].replace(',','')))
-                stock.add_data(daily_data)
-                recordCount += 1
-    return recordCount
+# Pages are downloaded by a fetcher from stock_web ("async" by default, "http",
+# "selenium", or any Fetcher object), with up to `workers` pages in flight at
+# once, and each page is parsed as soon as it arrives. If given,
+# progress(symbol, done, total, error) is called as each symbol finishes (error
+# is None on success). Returns a RetrievalReport with per-symbol row counts
+# and failures.
+# With incremental=True only the parts of dateStart..dateEnd that a stock's
+# history does not already cover are requested, and stocks that are already
+# complete are not fetched at all.
+# If a ResponseCache (see stock_cache) is passed, pages found in it are used
+# without downloading or parsing them again, and new pages are added to it.
+def retrieve_stock_web(dateStart,dateEnd,stock_list,workers=4,progress=None,fetcher=None,incremental=False,cache=None):
+    with stock_metrics.phase("retrieve", "total") as total:
+        report = _retrieve_stock_web(dateStart, dateEnd, stock_list, workers, progress, fetcher, incremental, cache)
+        total.rows = report.record_count
+        total.errors = len(report.failures)
+    return report
+
+def _retrieve_stock_web(dateStart,dateEnd,stock_list,workers,progress,fetcher,incremental,cache):
+    # imported here so loading and saving do not pay for the network stack
+    from stock_web import RetrievalReport, history_url, open_fetcher, parse_history_page
+    phase = stock_metrics.phase
+    start = datetime.strptime(dateStart,"%m/%d/%y").toordinal()
+    end = datetime.strptime(dateEnd,"%m/%d/%y").toordinal()
+    report = RetrievalReport(len(stock_list))
+    pending = {} # symbol -> pages still to arrive
+    requests = [] # (stock, period1, period2)
+    with phase("retrieve", "plan") as plan:
+        for stock in stock_list:
+            if incremental:
+                ranges = stock.DataList.missing_ranges(start, end)
+            else:
+                ranges = [(start, end)]
+            if not ranges:
+                report.up_to_date.append(stock.symbol)
+                continue
+            pending[stock.symbol] = len(ranges)
+            for range_start, range_end in ranges:
+                # period2 is exclusive: the start of the day after the range
+                requests.append((stock, _epoch(range_start), _epoch(range_end + 1)))
+        plan.rows = len(requests)
+
+    def finish_page(stock, rows, error):
+        symbol = stock.symbol
+        if error is None:
+            if rows:
+                with phase("retrieve", "merge") as merge:
+                    dates, closes, volumes = zip(*rows)
+                    stock.DataList.extend_rows(dates, closes, volumes)
+                    merge.rows = len(rows)
+            report.record_counts[symbol] = report.record_counts.get(symbol, 0) + len(rows)
+        else:
+            report.failures[symbol] = str(error) or type(error).__name__
+        pending[symbol] -= 1
+        if pending[symbol] == 0 and progress is not None:
+            progress(symbol, report.completed, report.total, report.failures.get(symbol))
+
+    to_fetch = {} # url -> (stock, cache key, period2)
+    for stock, period1, period2 in requests:
+        key = None
+        if cache is not None:
+            with phase("retrieve", "cache") as lookup:
+                key = cache.key(stock.symbol, period1, period2)
+                rows = cache.get_rows(key)
+                if rows is not None:
+                    lookup.rows = len(rows)
+            if rows is not None:
+                finish_page(stock, rows, None)
+                continue
+        to_fetch[history_url(stock.symbol, period1, period2)] = (stock, key, period2)
+    if not to_fetch:
+        return report
+    with open_fetcher(fetcher, min(workers, len(to_fetch))) as active_fetcher:
+        # "fetch" is the time spent waiting for the next page to arrive
+        waiting = time.perf_counter()
+        for url, html, error in active_fetcher.fetch_all(list(to_fetch)):
+            stock_metrics.record("retrieve", "fetch", time.perf_counter() - waiting, errors=int(error is not None))
+            if isinstance(error, RuntimeWarning):
+                raise error # no browser driver at all - nothing else can succeed either
+            stock, key, period2 = to_fetch[url]
+            rows = None
+            if error is None:
+                try:
+                    with phase("retrieve", "parse") as parse:
+                        rows = parse_history_page(html)
+                        parse.rows = len(rows)
+                except Exception as e:
+                    error = e
+                else:
+                    if key is not None:
+                        cache.put(key, html, rows, period2)
+            finish_page(stock, rows, error)
+            waiting = time.perf_counter()
+    return report
+
+# Seconds since the epoch (local time) at the start of a day ordinal, as Yahoo expects
+def _epoch(date_ordinal):
+    return str(int(time.mktime(datetime.fromordinal(date_ordinal).timetuple())))
+
+# Rows parsed per pandas chunk when reading CSV files
+CSV_CHUNK_ROWS = 500000
+
+# Day ordinal of 1970-01-01, the zero point of numpy datetime64[D]
+_EPOCH_ORDINAL = 719163
+
+# Read a Yahoo! Finance CSV (Date,Open,High,Low,Close,Adj Close,Volume) into
+# date-ordered (dates, closes, volumes) arrays ready for PriceHistory.extend_rows().
+# The file is parsed chunk_rows rows at a time, whole columns at once, so very
+# large files are read in bounded memory. Intraday exports (several rows per
+# date) are collapsed to one row per day: the day's last close and total volume.
+# Rows with a missing close ("null") are skipped.
+def read_stock_web_csv(filename, chunk_rows=CSV_CHUNK_ROWS):
+    # imported here so commands that never read a CSV file start without pandas
+    import numpy as np
+    import pandas as pd
+    days = []
+    date_time = 0.0
+    for chunk in pd.read_csv(filename, usecols=[0, 4, 6], chunksize=chunk_rows):
+        chunk.columns = ["date", "close", "volume"]
+        chunk["close"] = pd.to_numeric(chunk["close"], errors="coerce")
+        chunk = chunk.dropna(subset=["close"])
+        if chunk.empty:
+            continue
+        # the first 10 characters are the date, with or without a time after it
+        started = time.perf_counter()
+        day = pd.to_datetime(chunk["date"].astype(str).str.slice(0, 10), format="%Y-%m-%d")
+        date_time += time.perf_counter() - started
+        ordinals = day.to_numpy().astype("datetime64[D]").astype(np.int64) + _EPOCH_ORDINAL
+        volumes = pd.to_numeric(chunk["volume"], errors="coerce").fillna(0).to_numpy(dtype=np.float64)
+        frame = pd.DataFrame({"date": ordinals, "close": chunk["close"].to_numpy(dtype=np.float64), "volume": volumes})
+        if len(frame) > 1 and not (np.diff(ordinals) > 0).all():
+            frame = frame.groupby("date", sort=False, as_index=False).agg(close=("close", "last"), volume=("volume", "sum"))
+        days.append(frame)
+    stock_metrics.record("import", "parse_dates", date_time, sum(len(frame) for frame in days))
+    if not days:
+        return array("i"), array("d"), array("d")
+    daily = pd.concat(days, ignore_index=True)
+    if len(days) > 1 or not daily["date"].is_monotonic_increasing:
+        # a day split across two chunks, or a file that is not in date order
+        daily = daily.groupby("date", sort=True, as_index=False).agg(close=("close", "last"), volume=("volume", "sum"))
+    dates = array("i")
+    dates.frombytes(daily["date"].to_numpy(dtype=np.int32).tobytes())
+    closes = array("d")
+    closes.frombytes(daily["close"].to_numpy(dtype=np.float64).tobytes())
+    volumes = array("d")
+    volumes.frombytes(daily["volume"].to_numpy(dtype=np.float64).tobytes())
+    return dates, closes, volumes
 
 # Get price and volume history from Yahoo! Finance using CSV import.
+# Returns the number of daily rows imported.
 def import_stock_web_csv(stock_list,symbol,filename):
-    for stock in stock_list:
-            if stock.symbol == symbol:
-                with open(filename, newline='') as stockdata:
-                    datareader = csv.reader(stockdata,delimiter=',')
-                    next(datareader)
-                    for row in datareader:
-                        daily_data = DailyData(datetime.strptime(row[0],"%Y-%m-%d"),float(row[4]),float(row[6]))
-                        stock.add_data(daily_data)
+    stock = find_stock(stock_list, symbol)
+    if stock is None:
+        return 0
+    with stock_metrics.phase("import", "total") as total:
+        with stock_metrics.phase("import", "read_csv") as read:
+            dates, closes, volumes = read_stock_web_csv(filename)
+            read.rows = len(dates)
+        with stock_metrics.phase("import", "merge") as merge:
+            stock.DataList.extend_rows(dates, closes, volumes)
+            merge.rows = len(dates)
+        total.rows = len(dates)
+    return len(dates)
+
+# Symbol for a CSV file name: "AAPL.csv" and "aapl_history.csv" both give "AAPL"
+def csv_symbol(filename):
+    return os.path.splitext(os.path.basename(filename))[0].split("_")[0].upper()
+
+# Outcome of a bulk CSV import: counts, timing and the files that failed
+class ImportReport:
+    def __init__(self, total_files):
+        self.total_files = total_files
+        self.files = 0
+        self.rows = 0
+        self.new_symbols = []
+        self.failures = {} # file name -> error message
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def files_per_second(self):
+        return self.files / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        text = (f"{self.rows:,} rows from {self.files} of {self.total_files} files in {self.elapsed:0.2f} s "
+                f"({self.rows_per_second:,.0f} rows/sec, {self.files_per_second:,.1f} files/sec).")
+        if self.new_symbols:
+            text += f"\n{len(self.new_symbols)} new stocks added: " + ", ".join(self.new_symbols)
+        if self.failures:
+            text += f"\n{len(self.failures)} files failed:"
+            for name, message in self.failures.items():
+                text += f"\n  {name}: {message}"
+        return text
+
+# Parse every *.csv file in a directory, one Yahoo! Finance export per symbol,
+# in a pool of `workers` processes (default: one per CPU). The portfolio is not
+# touched, so the caller can merge the results (merge_stock_csv_dir) where and
+# when it likes. If progress raises (to cancel), the files not started yet are
+# dropped instead of parsed. Returns (report, parsed) with parsed mapping each
+# file name that was read to its (dates, closes, volumes).
+def read_stock_csv_dir(directory,workers=None,progress=None):
+    start = time.perf_counter()
+    names = sorted(name for name in os.listdir(directory) if name.lower().endswith(".csv"))
+    report = ImportReport(len(names))
+    parsed = {}
+    if names:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        try:
+            futures = {executor.submit(read_stock_web_csv, os.path.join(directory, name)): name for name in names}
+            for future in as_completed(futures):
+                name = futures[future]
+                error = None
+                try:
+                    parsed[name] = future.result()
+                except Exception as e:
+                    error = str(e) or type(e).__name__
+                    report.failures[name] = error
+                else:
+                    report.files += 1
+                    report.rows += len(parsed[name][0])
+                if progress is not None:
+                    progress(name, report.files + len(report.failures), report.total_files, error)
+        except BaseException:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown()
+    report.elapsed = time.perf_counter() - start
+    stock_metrics.record("import_dir", "read_csv", report.elapsed, report.rows, len(report.failures))
+    return report, parsed
+
+# Merge files parsed by read_stock_csv_dir() into stock_list (see csv_symbol()
+# for how file names map to symbols). Symbols that are not in stock_list yet are
+# added with 0 shares and listed in report.new_symbols. Returns the stocks that
+# changed; nothing is saved.
+def merge_stock_csv_dir(stock_list,parsed,report):
+    with stock_metrics.phase("import_dir", "merge") as merge:
+        start = time.perf_counter()
+        stocks = {stock.symbol: stock for stock in stock_list}
+        changed = {}
+        for name in sorted(parsed):
+            dates, closes, volumes = parsed[name]
+            symbol = csv_symbol(name)
+            stock = stocks.get(symbol)
+            if stock is None:
+                stock = Stock(symbol, symbol, 0)
+                stocks[symbol] = stock
+                stock_list.append(stock)
+                report.new_symbols.append(symbol)
+            stock.DataList.extend_rows(dates, closes, volumes)
+            changed[symbol] = stock
+            merge.rows += len(dates)
+        report.elapsed += time.perf_counter() - start
+    return list(changed.values())
+
+# Import every *.csv file in a directory: parse them in parallel
+# (read_stock_csv_dir), merge them into the portfolio and, with save=True,
+# write the changed stocks to the database in a single transaction.
+# Returns an ImportReport.
+def import_stock_csv_dir(stock_list,directory,workers=None,save=True,progress=None):
+    start = time.perf_counter()
+    report, parsed = read_stock_csv_dir(directory, workers, progress)
+    changed = merge_stock_csv_dir(stock_list, parsed, report)
+    if save and changed:
+        save_stock_data(changed)
+    report.elapsed = time.perf_counter() - start
+    stock_metrics.record("import_dir", "total", report.elapsed, report.rows, len(report.failures))
+    return report
+
+# Parquet export layout (a directory):
+#   stocks.parquet                       symbol, name, shares
+#   history/symbol=<SYMBOL>/*.parquet    date (date32), close, volume
+# History is partitioned by symbol and each file is split into row groups of
+# PARQUET_ROW_GROUP_ROWS days in date order, so a reader asking for some
+# symbols over a date window opens only those symbols' files and, thanks to
+# the per-row-group date statistics, reads only the row groups in the window.
+# Smaller groups would skip more, but every group has a fixed cost to read:
+# with one-year groups a full import was 2.5x slower.
+PARQUET_STOCKS_FILE = "stocks.parquet"
+PARQUET_HISTORY_DIR = "history"
+PARQUET_ROW_GROUP_ROWS = 1260 # about five trading years
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeWarning("Parquet files need the pyarrow package (pip install pyarrow)") from None
+    return pyarrow, pyarrow.dataset, pyarrow.parquet
+
+def _parquet_partitioning(pa, ds):
+    # declared, so a symbol such as "1234" is not read back as a number
+    return ds.partitioning(pa.schema([("symbol", pa.string())]), flavor="hive")
+
+# Write every stock and its whole history to a Parquet dataset in `directory`
+# (layout above). An earlier export in the same directory is replaced; any
+# other directory must be empty or not exist yet, so an unrelated "history"
+# folder is never deleted. Returns the number of daily rows written.
+def export_stock_parquet(stock_list,directory):
+    import shutil
+    import numpy as np
+    pa, ds, pq = _import_pyarrow()
+    earlier_export = os.path.isfile(os.path.join(directory, PARQUET_STOCKS_FILE))
+    if not earlier_export and os.path.isdir(directory) and os.listdir(directory):
+        raise RuntimeWarning(f"{directory} is not empty and does not hold a Parquet export")
+    with stock_metrics.phase("parquet_export", "total") as total:
+        with stock_metrics.phase("parquet_export", "build") as build:
+            stocks = [stock for stock in stock_list]
+            lengths = [len(stock.DataList) for stock in stocks]
+            dates = np.concatenate([np.frombuffer(stock.DataList.dates, dtype=np.int32) for stock in stocks] or [np.empty(0, np.int32)])
+            closes = np.concatenate([np.frombuffer(stock.DataList.closes) for stock in stocks] or [np.empty(0)])
+            volumes = np.concatenate([np.frombuffer(stock.DataList.volumes) for stock in stocks] or [np.empty(0)])
+            symbols = pa.DictionaryArray.from_arrays(
+                np.repeat(np.arange(len(stocks), dtype=np.int32), lengths),
+                pa.array([stock.symbol for stock in stocks], pa.string()))
+            history = pa.table({
+                "symbol": symbols,
+                "date": pa.array(dates - _EPOCH_ORDINAL, pa.int32()).view(pa.date32()),
+                "close": closes,
+                "volume": volumes,
+            })
+            metadata = pa.table({
+                "symbol": [stock.symbol for stock in stocks],
+                "name": [stock.name for stock in stocks],
+                "shares": pa.array([stock.shares for stock in stocks], pa.float64()),
+            })
+            build.rows = len(history)
+        with stock_metrics.phase("parquet_export", "write") as write:
+            os.makedirs(directory, exist_ok=True)
+            history_dir = os.path.join(directory, PARQUET_HISTORY_DIR)
+            if earlier_export and os.path.isdir(history_dir):
+                shutil.rmtree(history_dir)
+            ds.write_dataset(history, history_dir, format="parquet",
+                             partitioning=_parquet_partitioning(pa, ds),
+                             max_rows_per_group=PARQUET_ROW_GROUP_ROWS,
+                             file_options=ds.ParquetFileFormat().make_write_options(compression="zstd"))
+            os.makedirs(history_dir, exist_ok=True) # even with no rows to write
+            pq.write_table(metadata, os.path.join(directory, PARQUET_STOCKS_FILE))
+            write.rows = len(history)
+        total.rows = len(history)
+    return len(history)
+
+# Import a Parquet dataset written by export_stock_parquet() into stock_list.
+# Only the given symbols (all when None) and the days from start to end
+# (datetimes or day ordinals, inclusive, None for open-ended) are read; the
+# filters are pushed down, so other symbols' files and row groups outside the
+# window are skipped. Stocks not in stock_list yet are added with the name
+# and shares from the export; rows are merged into existing histories and left
+# unsaved (save_stock_data() writes them to the database). Returns an
+# ImportReport whose files count is the number of symbols read.
+def import_stock_parquet(stock_list,directory,symbols=None,start=None,end=None):
+    import numpy as np
+    pa, ds, pq = _import_pyarrow()
+    began = time.perf_counter()
+    if symbols is not None:
+        symbols = [symbol.upper() for symbol in symbols]
+    with stock_metrics.phase("parquet_import", "total") as total:
+        with stock_metrics.phase("parquet_import", "stocks") as listed:
+            filters = [("symbol", "in", symbols)] if symbols is not None else None
+            metadata = pq.read_table(os.path.join(directory, PARQUET_STOCKS_FILE), filters=filters).to_pylist()
+            listed.rows = len(metadata)
+        schema = pa.schema([("date", pa.date32()), ("close", pa.float64()), ("volume", pa.float64()),
+                            ("symbol", pa.string())])
+        dataset = ds.dataset(os.path.join(directory, PARQUET_HISTORY_DIR), format="parquet", schema=schema,
+                             partitioning=_parquet_partitioning(pa, ds))
+        conditions = []
+        if symbols is not None:
+            conditions.append(ds.field("symbol").isin(symbols))
+        if start is not None:
+            conditions.append(ds.field("date") >= pa.scalar(datetime.fromordinal(_ordinal(start)).date(), pa.date32()))
+        if end is not None:
+            conditions.append(ds.field("date") <= pa.scalar(datetime.fromordinal(_ordinal(end)).date(), pa.date32()))
+        row_filter = None
+        for condition in conditions:
+            row_filter = condition if row_filter is None else row_filter & condition
+        with stock_metrics.phase("parquet_import", "scan") as scan:
+            # one multi-threaded scan; the filter skips files and row groups
+            table = dataset.to_table(columns=["symbol", "date", "close", "volume"], filter=row_filter)
+            scan.rows = len(table)
+        with stock_metrics.phase("parquet_import", "merge") as merge:
+            stocks = {stock.symbol: stock for stock in stock_list}
+            new_symbols = []
+            for row in metadata:
+                if row["symbol"] not in stocks:
+                    stock = Stock(row["symbol"], row["name"], row["shares"] or 0)
+                    stocks[stock.symbol] = stock
+                    stock_list.append(stock)
+                    new_symbols.append(stock.symbol)
+            # group the rows by symbol; the sort is stable, so each symbol's
+            # rows stay in date order
+            encoded = table.column("symbol").combine_chunks().dictionary_encode()
+            codes = encoded.indices.to_numpy()
+            order = np.argsort(codes, kind="stable")
+            codes = codes[order]
+            dates = (table.column("date").combine_chunks().view(pa.int32()).to_numpy()[order] + np.int32(_EPOCH_ORDINAL)).astype(np.int32)
+            closes = table.column("close").combine_chunks().to_numpy()[order]
+            volumes = table.column("volume").combine_chunks().to_numpy()[order]
+            bounds = np.flatnonzero(np.diff(codes)) + 1
+            starts = np.concatenate(([0], bounds)) if len(codes) else np.empty(0, dtype=np.intp)
+            ends = np.concatenate((bounds, [len(codes)])) if len(codes) else np.empty(0, dtype=np.intp)
+            names = encoded.dictionary.to_pylist()
+            report = ImportReport(len(starts))
+            for first, last in zip(starts.tolist(), ends.tolist()):
+                symbol = names[codes[first]]
+                stock = stocks.get(symbol)
+                if stock is None: # history without a stocks.parquet entry
+                    stock = Stock(symbol, symbol, 0)
+                    stocks[symbol] = stock
+                    stock_list.append(stock)
+                    new_symbols.append(symbol)
+                stock.DataList.extend_rows(array("i", dates[first:last].tobytes()),
+                                           array("d", closes[first:last].tobytes()),
+                                           array("d", volumes[first:last].tobytes()))
+                report.files += 1
+            report.rows = len(table)
+            report.new_symbols = new_symbols
+            merge.rows = len(table)
+        total.rows = report.rows
+    report.elapsed = time.perf_counter() - began
+    return report
+
+def _ordinal(date):
+    return date if isinstance(date, int) else date.toordinal()
 
 def main():
+    from utilities import clear_screen
     clear_screen()
     print("This module will handle data storage and retrieval.")
 
@@ -0,0 +1,85 @@
+# Summary: This module manages the SQLite connections used by the stock analysis program.
+# Each thread gets one connection per database file, opened on first use and
+# reused after that, with WAL journaling and tuned pragmas. Set STOCKS_DB or call
+# set_database_path() to use a database other than stocks.db.
+
+import atexit
+import os
+import sqlite3
+import threading
+
+# Applied to every new connection
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL;",      # readers do not block the writer
+    "PRAGMA synchronous=NORMAL;",    # safe with WAL, one fsync per checkpoint
+    "PRAGMA mmap_size=268435456;",   # map up to 256 MB of the file
+    "PRAGMA cache_size=-65536;",     # 64 MB page cache
+    "PRAGMA temp_store=MEMORY;",
+)
+
+_database_path = os.environ.get("STOCKS_DB", "stocks.db")
+_local = threading.local()
+_lock = threading.Lock()
+_connections = []  # every open connection, so close_all() can reach all threads
+
+
+# Path of the database used when no path is given
+def get_database_path():
+    return _database_path
+
+
+# Switch to another database file (closes the connections to the old one)
+def set_database_path(path):
+    global _database_path
+    close_all()
+    _database_path = path
+
+
+# Open a new tuned connection that is not shared with anyone else
+def connect(path=None):
+    conn = sqlite3.connect(path or _database_path, check_same_thread=False)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+# Connection for the calling thread, created on first use
+def get_connection(path=None):
+    path = path or _database_path
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        conn = connect(path)
+        connections[path] = conn
+        with _lock:
+            _connections.append(conn)
+    return conn
+
+
+# Close the calling thread's connections (call at the end of a worker thread)
+def close_connection():
+    connections = getattr(_local, "connections", None)
+    if not connections:
+        return
+    with _lock:
+        for conn in connections.values():
+            conn.close()
+            if conn in _connections:
+                _connections.remove(conn)
+    connections.clear()
+
+
+# Close every connection opened through this module, in any thread
+def close_all():
+    with _lock:
+        for conn in _connections:
+            conn.close()
+        _connections.clear()
+    # other threads find their closed connection missing on next use
+    global _local
+    _local = threading.local()
+
+
+atexit.register(close_all)
@@ -0,0 +1,212 @@
+# Summary: This module records where the time goes in the stock_data operations. Each
+# operation (save, load, retrieve, import) is split into phases such as "query", "fetch"
+# or "parse", and every phase keeps running totals of its calls, wall time, rows processed
+# and errors. A phase costs two clock reads and a lock, so recording is on by default
+# (set STOCK_METRICS=0 to turn it off).
+#
+# The totals can be written as a JSON report or as a Prometheus text-format file (for
+# the node_exporter textfile collector). profile() captures a cProfile run for a single
+# command when the phase totals are not detailed enough.
+#
+#   with stock_metrics.phase("load", "query") as record:
+#       rows = ...
+#       record.rows += len(rows)
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRIC_PREFIX = "stock"
+
+_enabled = os.environ.get("STOCK_METRICS", "1") != "0"
+_lock = threading.Lock()
+_phases = {} # (operation, phase) -> PhaseStats
+
+
+# Running totals for one phase of one operation
+class PhaseStats:
+    __slots__ = ("calls", "seconds", "max_seconds", "rows", "errors")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.rows = 0
+        self.errors = 0
+
+    def as_dict(self):
+        return {"calls": self.calls, "seconds": self.seconds, "max_seconds": self.max_seconds,
+                "rows": self.rows, "errors": self.errors}
+
+
+# One timed run of a phase. Add to .rows and .errors inside the with block; an
+# exception leaving the block counts as an error too.
+class _Phase:
+    __slots__ = ("key", "rows", "errors", "_start")
+
+    def __init__(self, key):
+        self.key = key
+        self.rows = 0
+        self.errors = 0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.errors += 1
+        record(self.key[0], self.key[1], time.perf_counter() - self._start, self.rows, self.errors)
+        return False
+
+
+# Stand-in used while recording is off: same interface, records nothing
+class _NoPhase:
+    __slots__ = ("rows", "errors")
+
+    def __enter__(self):
+        self.rows = 0
+        self.errors = 0
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+def enabled():
+    return _enabled
+
+
+def set_enabled(on):
+    global _enabled
+    _enabled = bool(on)
+
+
+# Context manager timing one run of operation/phase, e.g. phase("save", "write")
+def phase(operation, name):
+    if not _enabled:
+        return _NoPhase()
+    return _Phase((operation, name))
+
+
+# Add a run measured elsewhere (for time summed over a loop, or rows and errors
+# without any time)
+def record(operation, name, seconds=0.0, rows=0, errors=0, calls=1):
+    if not _enabled:
+        return
+    key = (operation, name)
+    with _lock:
+        stats = _phases.get(key)
+        if stats is None:
+            stats = _phases[key] = PhaseStats()
+        stats.calls += calls
+        stats.seconds += seconds
+        if seconds > stats.max_seconds:
+            stats.max_seconds = seconds
+        stats.rows += rows
+        stats.errors += errors
+
+
+def reset():
+    with _lock:
+        _phases.clear()
+
+
+# Copy of the totals as {operation: {phase: {calls, seconds, max_seconds, rows, errors}}}
+def snapshot():
+    with _lock:
+        items = [(key, stats.as_dict()) for key, stats in _phases.items()]
+    report = {}
+    for (operation, name), stats in sorted(items):
+        report.setdefault(operation, {})[name] = stats
+    return report
+
+
+def to_json():
+    return json.dumps({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "operations": snapshot()}, indent=2)
+
+
+def _label(text):
+    return str(text).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# The totals in the Prometheus text exposition format
+def to_prometheus(prefix=METRIC_PREFIX):
+    metrics = (
+        ("phase_calls_total", "calls", "counter", "Times each phase ran."),
+        ("phase_seconds_total", "seconds", "counter", "Wall time spent in each phase."),
+        ("phase_max_seconds", "max_seconds", "gauge", "Longest single run of each phase."),
+        ("phase_rows_total", "rows", "counter", "Rows processed by each phase."),
+        ("phase_errors_total", "errors", "counter", "Errors raised or counted in each phase."),
+    )
+    report = snapshot()
+    lines = []
+    for suffix, field, kind, help_text in metrics:
+        name = f"{prefix}_{suffix}"
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for operation, phases in report.items():
+            for phase_name, stats in phases.items():
+                lines.append(f'{name}{{operation="{_label(operation)}",phase="{_label(phase_name)}"}} {stats[field]!r}')
+    return "\n".join(lines) + "\n"
+
+
+# Write the totals to a file, as Prometheus text when the name ends in .prom and
+# as JSON otherwise. The file is replaced in one step, so a collector never
+# reads half of it.
+def write_report(filename):
+    text = to_prometheus() if filename.endswith(".prom") else to_json()
+    temp = filename + ".tmp"
+    with open(temp, "w") as out:
+        out.write(text)
+    os.replace(temp, filename)
+
+
+# Human readable table of the totals
+def summary_lines():
+    lines = []
+    for operation, phases in snapshot().items():
+        for phase_name, stats in phases.items():
+            line = f"{operation + '.' + phase_name:24s}{stats['seconds'] * 1000:10.1f} ms  {stats['calls']:6d} calls"
+            if stats["rows"]:
+                line += f"  {stats['rows']:10,d} rows"
+            if stats["errors"]:
+                line += f"  {stats['errors']} errors"
+            lines.append(line)
+    return lines
+
+
+# Profile everything run inside the block with cProfile. The stats are saved to
+# `filename` (open them with pstats or snakeviz) if given, and the `limit` most
+# expensive functions by cumulative time are printed to `stream` if given.
+@contextmanager
+def profile(filename=None, stream=None, limit=30):
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if filename:
+            profiler.dump_stats(filename)
+        if stream is not None:
+            pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(limit)
+
+
+def main():
+    with phase("example", "sleep") as run:
+        time.sleep(0.01)
+        run.rows += 10
+    record("example", "errors", errors=2)
+    for line in summary_lines():
+        print(line)
+    print(to_prometheus(), end="")
+
+
+if __name__ == "__main__":
+    # execute only if run as a stand-alone script
+    main()
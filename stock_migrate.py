@@ -0,0 +1,25 @@
+# Summary: This module upgrades an existing stocks database to the current schema version.
+# Usage: python stock_migrate.py [path to stocks.db]
+
+import sys
+from os import path
+import stock_data
+import stock_db
+
+
+def main():
+    stockDB = sys.argv[1] if len(sys.argv) > 1 else stock_db.get_database_path()
+    if path.exists(stockDB) == False:
+        print(stockDB + " not found.")
+        return
+    old_version = stock_data.migrate_database(stockDB)
+    if old_version == stock_data.SCHEMA_VERSION:
+        print(f"{stockDB} is already at schema version {old_version}.")
+    else:
+        print(f"{stockDB} migrated from schema version {old_version} to {stock_data.SCHEMA_VERSION}.")
+
+
+# Program Starts Here
+if __name__ == "__main__":
+    # execute only if run as a stand-alone script
+    main()
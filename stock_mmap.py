@@ -0,0 +1,430 @@
+# Summary: This module is an optional storage backend that keeps each stock's history in
+# its own binary file and reads it through a memory map. Nothing is parsed or copied when
+# a history is opened: its dates, closes and volumes are numpy views straight onto the
+# mapped file, and the operating system pages in only the parts that are actually read.
+# Opening a universe of 50,000 symbols reads nothing at all until a symbol is used.
+#
+# Directory layout:
+#   stocks.json           {symbol: {"name": ..., "shares": ..., "history": fingerprint}}
+#   <SYMBOL>.hist         one file per symbol (the symbol is %-encoded in the file name)
+#
+# History file: a 32 byte header followed by fixed-width little-endian records in date order
+#   header   magic "STOCKHST", format version (u16), record size (u16), reserved (u32),
+#            record count (u64), reserved (u64)
+#   record   date ordinal (i4), close (f8), volume (f8) - 20 bytes, unpadded
+#
+# The record count in the header is written last, so a file cut short while appending
+# still reads back as the rows it had before.
+
+import hashlib
+import json
+import os
+import struct
+from collections import OrderedDict
+from urllib.parse import quote, unquote
+import numpy as np
+from stock_class import PriceHistory, Stock
+
+MAGIC = b"STOCKHST"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sHHIQQ")
+HEADER_SIZE = HEADER.size # 32
+RECORD = np.dtype([("date", "<i4"), ("close", "<f8"), ("volume", "<f8")])
+HISTORY_SUFFIX = ".hist"
+STOCKS_FILE = "stocks.json"
+MAX_OPEN_MAPS = 512 # each open map holds a file descriptor
+
+
+def history_filename(directory, symbol):
+    return os.path.join(directory, quote(symbol, safe="") + HISTORY_SUFFIX)
+
+
+def _read_header(f, path):
+    data = f.read(HEADER_SIZE)
+    if len(data) < HEADER_SIZE:
+        raise ValueError(path + " is not a history file (too short)")
+    magic, version, record_size, _, count, _ = HEADER.unpack(data)
+    if magic != MAGIC:
+        raise ValueError(path + " is not a history file")
+    if version > FORMAT_VERSION or record_size != RECORD.itemsize:
+        raise ValueError(f"{path} has history format {version} with {record_size} byte records, "
+                         f"this program reads format {FORMAT_VERSION}")
+    return count
+
+
+def _header(count):
+    return HEADER.pack(MAGIC, FORMAT_VERSION, RECORD.itemsize, 0, count, 0)
+
+
+def _records(dates, closes, volumes):
+    records = np.empty(len(dates), dtype=RECORD)
+    records["date"] = dates
+    records["close"] = closes
+    records["volume"] = volumes
+    return records
+
+
+# Write a whole history file (replaced in one step). Rows must be in date order
+# with one row per date, as a PriceHistory hands them out.
+def write_history(path, dates, closes, volumes):
+    records = _records(dates, closes, volumes)
+    temp = path + ".tmp"
+    with open(temp, "wb") as out:
+        out.write(_header(len(records)))
+        out.write(records.tobytes())
+    os.replace(temp, path)
+    return len(records)
+
+
+# Add rows to the end of a history file, creating it if needed. Rows dated on or
+# before the file's last day cannot simply be appended, so then the file is
+# merged and rewritten (later rows win, as in PriceHistory). Returns the number
+# of rows the file grew by.
+def append_history(path, dates, closes, volumes):
+    if not len(dates):
+        return 0
+    if not os.path.exists(path):
+        history = PriceHistory()
+        history.extend_rows(dates, closes, volumes)
+        return write_history(path, history.dates, history.closes, history.volumes)
+    with open(path, "r+b") as f:
+        count = _read_header(f, path)
+        last = None
+        if count:
+            f.seek(HEADER_SIZE + (count - 1) * RECORD.itemsize)
+            last = int(np.frombuffer(f.read(RECORD.itemsize), dtype=RECORD)["date"][0])
+        records = _records(dates, closes, volumes)
+        in_order = len(records) < 2 or bool((np.diff(records["date"]) > 0).all())
+        if in_order and (last is None or int(records["date"][0]) > last):
+            f.seek(HEADER_SIZE + count * RECORD.itemsize)
+            f.write(records.tobytes())
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+            f.seek(0)
+            f.write(_header(count + len(records)))
+            return len(records)
+    history = MappedHistory(path).to_history()
+    history.extend_rows(dates, closes, volumes)
+    return write_history(path, history.dates, history.closes, history.volumes) - count
+
+
+# Read-only history backed by a memory-mapped file. It offers the read side of
+# PriceHistory (dates, closes, volumes, len(), rows(), date_range(), version),
+# so valuation, indicators and charts work on it directly; the columns are
+# numpy views onto the file rather than arrays. Use to_history() for a
+# PriceHistory copy that can be changed.
+class MappedHistory:
+    __slots__ = ("_path", "_records", "_version")
+
+    def __init__(self, path):
+        self._path = path
+        with open(path, "rb") as f:
+            count = _read_header(f, path)
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER_SIZE + count * RECORD.itemsize:
+                raise ValueError(f"{path} is truncated ({count} rows in the header)")
+            if count:
+                self._records = np.memmap(f, dtype=RECORD, mode="r", offset=HEADER_SIZE, shape=(count,))
+            else:
+                self._records = np.empty(0, dtype=RECORD)
+            stat = os.fstat(f.fileno())
+        # a different file (or the same file grown) gives a different version
+        self._version = (stat.st_mtime_ns, count)
+
+    @property
+    def path(self):
+        return self._path
+
+    # Column views (date ordinals, closes, volumes) onto the mapped records
+    @property
+    def dates(self):
+        return self._records["date"]
+
+    @property
+    def closes(self):
+        return self._records["close"]
+
+    @property
+    def volumes(self):
+        return self._records["volume"]
+
+    # The mapped records as one structured array
+    @property
+    def records(self):
+        return self._records
+
+    @property
+    def version(self):
+        return self._version
+
+    @property
+    def is_sorted(self):
+        return True
+
+    @property
+    def is_dirty(self):
+        return False
+
+    # Bytes of the file mapped (not necessarily read)
+    @property
+    def nbytes(self):
+        return self._records.nbytes
+
+    def __len__(self):
+        return len(self._records)
+
+    def date_range(self):
+        if not len(self._records):
+            return None
+        dates = self._records["date"]
+        return int(dates[0]), int(dates[-1])
+
+    # (date ordinal, close, volume) tuples, like PriceHistory.rows()
+    def rows(self):
+        return zip(self.dates.tolist(), self.closes.tolist(), self.volumes.tolist())
+
+    # Index range [lo, hi) of the rows from start to end (day ordinals, inclusive)
+    def index_range(self, start=None, end=None):
+        dates = self._records["date"]
+        lo = 0 if start is None else int(np.searchsorted(dates, start, side="left"))
+        hi = len(dates) if end is None else int(np.searchsorted(dates, end, side="right"))
+        return lo, hi
+
+    # Records from start to end as a view (only those pages are read)
+    def window(self, start=None, end=None):
+        lo, hi = self.index_range(start, end)
+        return self._records[lo:hi]
+
+    # In-memory PriceHistory copy of the rows
+    def to_history(self):
+        history = PriceHistory()
+        history.extend_rows(self.dates.astype(np.int32).tolist(), self.closes.tolist(), self.volumes.tolist())
+        return history
+
+    def __repr__(self):
+        return f"MappedHistory({self._path!r}, {len(self)} days)"
+
+
+# A stock of a MappedUniverse. DataList maps the history on first use (through
+# the universe, which keeps a bounded number of maps open), so iterating over
+# the whole universe never holds every file open at once. Read only: shares and
+# history are changed through a Portfolio and saved back with save_universe().
+class MappedStock:
+    __slots__ = ("_universe", "_symbol", "_name", "_shares", "__weakref__")
+
+    def __init__(self, universe, symbol, name, shares):
+        self._universe = universe
+        self._symbol = symbol
+        self._name = name
+        self._shares = shares
+
+    @property
+    def symbol(self):
+        return self._symbol
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def shares(self):
+        return self._shares
+
+    @property
+    def DataList(self):
+        return self._universe.history(self._symbol)
+
+    # Stock with an in-memory copy of the history, ready to change and save
+    def to_stock(self):
+        stock = Stock(self._symbol, self._name, self._shares)
+        stock.DataList = self.DataList.to_history()
+        return stock
+
+    def __repr__(self):
+        return f"MappedStock({self._symbol!r})"
+
+
+# A directory of history files. Opening it reads nothing; stocks.json is read
+# the first time the list of symbols or a stock's name and shares are needed,
+# and each history file is mapped the first time it is asked for. At most
+# MAX_OPEN_MAPS maps are kept (least recently used are dropped first).
+class MappedUniverse:
+    def __init__(self, directory, max_open=MAX_OPEN_MAPS):
+        self._directory = directory
+        self._max_open = max_open
+        self._maps = OrderedDict() # symbol -> MappedHistory
+        self._stocks = None # symbol -> {"name", "shares"}, read on first use
+        self._stock_objects = {} # symbol -> MappedStock, so caches keyed by stock keep working
+
+    @property
+    def directory(self):
+        return self._directory
+
+    def _metadata(self):
+        if self._stocks is None:
+            path = os.path.join(self._directory, STOCKS_FILE)
+            if os.path.exists(path):
+                with open(path) as f:
+                    self._stocks = json.load(f)
+            else:
+                # no index: every history file in the directory, with no name or shares
+                self._stocks = {unquote(name[:-len(HISTORY_SUFFIX)]): {"name": "", "shares": 0}
+                                for name in sorted(os.listdir(self._directory)) if name.endswith(HISTORY_SUFFIX)}
+        return self._stocks
+
+    def symbols(self):
+        return list(self._metadata())
+
+    def __len__(self):
+        return len(self._metadata())
+
+    def __contains__(self, symbol):
+        return symbol in self._metadata() or os.path.exists(history_filename(self._directory, symbol))
+
+    # Mapped history of one symbol (an empty history if it has no file)
+    def history(self, symbol):
+        maps = self._maps
+        history = maps.get(symbol)
+        if history is not None:
+            maps.move_to_end(symbol)
+            return history
+        path = history_filename(self._directory, symbol)
+        if os.path.exists(path):
+            history = MappedHistory(path)
+        else:
+            history = PriceHistory()
+        maps[symbol] = history
+        if len(maps) > self._max_open:
+            maps.popitem(last=False)
+        return history
+
+    def stock(self, symbol):
+        stock = self._stock_objects.get(symbol)
+        if stock is None:
+            details = self._metadata().get(symbol, {"name": "", "shares": 0})
+            stock = self._stock_objects[symbol] = MappedStock(self, symbol, details["name"], details["shares"])
+        return stock
+
+    def get(self, symbol, default=None):
+        if symbol not in self:
+            return default
+        return self.stock(symbol)
+
+    def __getitem__(self, symbol):
+        if symbol not in self:
+            raise KeyError(symbol)
+        return self.stock(symbol)
+
+    # MappedStock objects in symbol order
+    def __iter__(self):
+        for symbol in self._metadata():
+            yield self.stock(symbol)
+
+    # Drop every open map (views already handed out stay valid)
+    def close(self):
+        self._maps.clear()
+
+    def __repr__(self):
+        return f"MappedUniverse({self._directory!r})"
+
+
+def open_universe(directory):
+    return MappedUniverse(directory)
+
+
+# Fingerprint of a history's rows, kept in stocks.json to tell which history
+# files are already up to date
+def history_fingerprint(history):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(history.dates.tobytes())
+    digest.update(history.closes.tobytes())
+    digest.update(history.volumes.tobytes())
+    return digest.hexdigest()
+
+
+# Record count in a history file's header, or None if it cannot be read
+def _file_count(path):
+    try:
+        with open(path, "rb") as f:
+            return _read_header(f, path)
+    except (OSError, ValueError):
+        return None
+
+
+# Write the stocks of a portfolio to a universe directory: stocks.json with
+# every stock's name, shares and history fingerprint, and a history file for
+# each stock whose rows differ from what the directory holds (its file is
+# missing, has another row count, or its fingerprint changed since the last
+# save). With only_changed=False every history file is written. Returns the
+# number of history files written.
+def save_universe(stock_list, directory, only_changed=True):
+    os.makedirs(directory, exist_ok=True)
+    saved = {}
+    index = os.path.join(directory, STOCKS_FILE)
+    if only_changed and os.path.exists(index):
+        try:
+            with open(index) as f:
+                saved = json.load(f)
+        except ValueError:
+            saved = {}
+    written = 0
+    stocks = {}
+    for stock in stock_list:
+        history = stock.DataList
+        fingerprint = history_fingerprint(history)
+        stocks[stock.symbol] = {"name": stock.name, "shares": stock.shares, "history": fingerprint}
+        path = history_filename(directory, stock.symbol)
+        if (not only_changed or saved.get(stock.symbol, {}).get("history") != fingerprint
+                or _file_count(path) != len(history)):
+            write_history(path, history.dates, history.closes, history.volumes)
+            written += 1
+    temp = index + ".tmp"
+    with open(temp, "w") as out:
+        json.dump(stocks, out)
+    os.replace(temp, index)
+    return written
+
+
+# Load some (or all) symbols of a universe into stock_list as ordinary Stock
+# objects with in-memory histories, for editing in the console or GUI. Only
+# the days from start to end (day ordinals or datetimes, inclusive) are read
+# when given. The stocks count as unsaved, so save_stock_data() writes them
+# to the database.
+def load_universe(stock_list, directory, symbols=None, start=None, end=None):
+    universe = MappedUniverse(directory)
+    start = start.toordinal() if hasattr(start, "toordinal") else start
+    end = end.toordinal() if hasattr(end, "toordinal") else end
+    for symbol in (universe.symbols() if symbols is None else symbols):
+        if symbol not in universe:
+            continue
+        mapped = universe.stock(symbol)
+        stock = Stock(symbol, mapped.name, mapped.shares)
+        history = mapped.DataList
+        if len(history):
+            records = history.window(start, end)
+            stock.DataList.extend_rows(records["date"].tolist(), records["close"].tolist(), records["volume"].tolist())
+        stock_list.append(stock)
+    universe.close()
+    return stock_list
+
+
+def main():
+    import tempfile
+    from datetime import datetime
+    with tempfile.TemporaryDirectory() as directory:
+        stock = Stock("TEST", "Test Inc", 10)
+        first = datetime(2024, 1, 2).toordinal()
+        stock.DataList.extend_rows(range(first, first + 5), [10.0, 11.0, 12.0, 11.5, 12.5], [100.0] * 5)
+        save_universe([stock], directory)
+        append_history(history_filename(directory, "TEST"), [first + 5], [13.0], [200.0])
+        universe = open_universe(directory)
+        history = universe.history("TEST")
+        print(universe, universe.symbols(), history)
+        print("Last close:", float(history.closes[-1]), "on", datetime.fromordinal(int(history.dates[-1])).date())
+        print("Window:", history.window(first + 1, first + 2).tolist())
+
+
+if __name__ == "__main__":
+    # execute only if run as a stand-alone script
+    main()
@@ -0,0 +1,196 @@
+# Summary: This module contains streaming accumulators for rolling statistics over a
+# stock's daily history. An accumulator keeps only the last `window` days and updates
+# its result in O(1) (amortized) time per new day, so adding one day to thousands of
+# stocks does not rescan any history.
+#
+# Attach accumulators with Stock.add_accumulator(). Stock.add_data() feeds them each
+# new day, and rebuilds them from the history when a day arrives out of order.
+
+from collections import deque
+from math import sqrt
+
+
+# Base class: keeps the (date ordinal, close, volume) rows of the current window
+# and calls _add()/_drop() as rows enter and leave it.
+class Accumulator:
+    kind = "accumulator"
+
+    def __init__(self, window):
+        if window < 1:
+            raise ValueError("Window must be at least 1 day")
+        self._window = window
+        self.reset()
+
+    @property
+    def window(self):
+        return self._window
+
+    # Name used by Stock.accumulator(), e.g. "mean_20"
+    @property
+    def name(self):
+        return f"{self.kind}_{self._window}"
+
+    # Number of days currently in the window
+    @property
+    def count(self):
+        return len(self._rows)
+
+    # True once the window is full
+    @property
+    def ready(self):
+        return len(self._rows) == self._window
+
+    # Date ordinal of the last day added, or None
+    @property
+    def last_date(self):
+        return self._rows[-1][0] if self._rows else None
+
+    def reset(self):
+        self._rows = deque()
+        self._reset()
+
+    # Add the next day. Days must arrive in date order.
+    def update(self, date_ordinal, close, volume):
+        rows = self._rows
+        if len(rows) == self._window:
+            self._drop(rows.popleft())
+        row = (date_ordinal, close, volume)
+        rows.append(row)
+        self._add(row)
+
+    # Refill from the last `window` rows of a PriceHistory
+    def rebuild(self, history):
+        self.reset()
+        start = max(len(history) - self._window, 0)
+        dates = history.dates
+        for date_ordinal, close, volume in zip(dates[start:], history.closes[start:], history.volumes[start:]):
+            self.update(date_ordinal, close, volume)
+
+    # Result over the window, or None until the window is full
+    @property
+    def value(self):
+        return self._value() if self.ready else None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self._window}): {self.value}"
+
+
+# Mean close over the window
+class RollingMean(Accumulator):
+    kind = "mean"
+
+    def _reset(self):
+        self._sum = 0.0
+
+    def _add(self, row):
+        self._sum += row[1]
+
+    def _drop(self, row):
+        self._sum -= row[1]
+
+    def _value(self):
+        return self._sum / self._window
+
+
+# Sample variance of the close over the window. The mean and the sum of squared
+# deviations are updated together (Welford's method), which stays accurate where
+# a running sum of squares would lose the small differences between large prices.
+class RollingVariance(Accumulator):
+    kind = "variance"
+
+    def _reset(self):
+        self._mean = 0.0
+        self._m2 = 0.0
+
+    def _add(self, row):
+        x = row[1]
+        n = len(self._rows)
+        delta = x - self._mean
+        self._mean += delta / n
+        self._m2 += delta * (x - self._mean)
+
+    def _drop(self, row):
+        x = row[1]
+        n = len(self._rows) # count after the row left
+        if n == 0:
+            self._reset()
+            return
+        delta = x - self._mean
+        self._mean -= delta / n
+        self._m2 = max(self._m2 - delta * (x - self._mean), 0.0)
+
+    def _value(self):
+        if self._window < 2:
+            return 0.0
+        return self._m2 / (self._window - 1)
+
+    # Standard deviation over the window, or None until the window is full
+    @property
+    def std(self):
+        value = self.value
+        return None if value is None else sqrt(value)
+
+
+# Lowest and highest close over the window. Each deque holds the closes that can
+# still become the minimum (or maximum), in window order; a new close pushes out
+# every entry it beats, so each row enters and leaves a deque once.
+class RollingMinMax(Accumulator):
+    kind = "minmax"
+
+    def _reset(self):
+        self._seq = 0
+        self._min = deque() # (seq, close), closes increasing
+        self._max = deque() # (seq, close), closes decreasing
+
+    def _add(self, row):
+        close = row[1]
+        low = self._min
+        while low and low[-1][1] >= close:
+            low.pop()
+        low.append((self._seq, close))
+        high = self._max
+        while high and high[-1][1] <= close:
+            high.pop()
+        high.append((self._seq, close))
+        self._seq += 1
+
+    def _drop(self, row):
+        # the row leaving is the oldest one in the window
+        oldest = self._seq - len(self._rows) - 1
+        if self._min[0][0] == oldest:
+            self._min.popleft()
+        if self._max[0][0] == oldest:
+            self._max.popleft()
+
+    def _value(self):
+        return self._min[0][1], self._max[0][1]
+
+    @property
+    def low(self):
+        return self._min[0][1] if self.ready else None
+
+    @property
+    def high(self):
+        return self._max[0][1] if self.ready else None
+
+
+# Volume-weighted average close over the window
+class RollingVWAP(Accumulator):
+    kind = "vwap"
+
+    def _reset(self):
+        self._value_traded = 0.0
+        self._volume = 0.0
+
+    def _add(self, row):
+        self._value_traded += row[1] * row[2]
+        self._volume += row[2]
+
+    def _drop(self, row):
+        self._value_traded -= row[1] * row[2]
+        self._volume -= row[2]
+
+    def _value(self):
+        if self._volume <= 0:
+            return None
+        return self._value_traded / self._volume
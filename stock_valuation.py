@@ -0,0 +1,201 @@
+# Summary: This module computes the total value of the portfolio (current shares x close)
+# for every trading day. The stocks' histories are aligned on the union of all their
+# dates. A stock that did not trade on a day carries its last close forward (before its
+# first day it counts as 0).
+#
+# The whole portfolio is valued in one pass. Each stock's rows become changes in value
+# (shares x the change in close), placed on the shared calendar, and a running sum of
+# the changes gives the daily totals. "Value as of date D" is then a binary search in
+# the calendar.
+
+from bisect import bisect_right
+from datetime import datetime
+import numpy as np
+
+_last_valuation = None # (key, PortfolioValuation) for the last portfolio valued
+
+
+# Daily total values of a portfolio over the union of its stocks' trading days
+class PortfolioValuation:
+    def __init__(self, stock_list):
+        stocks = [stock for stock in stock_list if len(stock.DataList)]
+        self._symbols = [stock.symbol for stock in stock_list]
+        if not stocks:
+            self._dates = np.empty(0, dtype=np.int32)
+            self._totals = np.empty(0)
+            return
+        lengths = np.array([len(stock.DataList) for stock in stocks])
+        dates = np.concatenate([np.asarray(stock.DataList.dates, dtype=np.int32) for stock in stocks])
+        closes = np.concatenate([np.asarray(stock.DataList.closes, dtype=np.float64) for stock in stocks])
+        shares = np.repeat(np.array([float(stock.shares) for stock in stocks]), lengths)
+
+        # calendar = every day on which at least one stock traded
+        first = int(dates.min())
+        traded = np.zeros(int(dates.max()) - first + 1, dtype=bool)
+        traded[dates - first] = True
+        self._dates = (np.flatnonzero(traded) + first).astype(np.int32)
+        position = np.cumsum(traded) - 1 # day offset -> index in the calendar
+
+        # change in value on each row: the whole value on a stock's first row,
+        # shares x (close - previous close) after that
+        changes = np.diff(closes, prepend=0.0)
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        changes[starts] = closes[starts]
+        changes *= shares
+        self._totals = np.cumsum(np.bincount(position[dates - first], weights=changes, minlength=len(self._dates)))
+
+    # Date ordinals of the calendar
+    @property
+    def dates(self):
+        return self._dates
+
+    # Total value on each calendar day
+    @property
+    def totals(self):
+        return self._totals
+
+    @property
+    def symbols(self):
+        return self._symbols
+
+    def __len__(self):
+        return len(self._dates)
+
+    # First and last date ordinal valued, or None when no stock has history
+    def date_range(self):
+        if not len(self._dates):
+            return None
+        return int(self._dates[0]), int(self._dates[-1])
+
+    # (date ordinals, totals) for the days between start and end (datetimes or
+    # ordinals, inclusive; None means open-ended)
+    def values(self, start=None, end=None):
+        lo = 0 if start is None else np.searchsorted(self._dates, _ordinal(start), side="left")
+        hi = len(self._dates) if end is None else np.searchsorted(self._dates, _ordinal(end), side="right")
+        return self._dates[lo:hi], self._totals[lo:hi]
+
+    # (date ordinal, total) on the last trading day on or before `date`, or
+    # None if the portfolio has no history that early
+    def as_of(self, date):
+        i = int(np.searchsorted(self._dates, _ordinal(date), side="right")) - 1
+        if i < 0:
+            return None
+        return int(self._dates[i]), float(self._totals[i])
+
+    # Total value on the last trading day on or before `date` (0 before any history)
+    def value_as_of(self, date):
+        found = self.as_of(date)
+        return 0.0 if found is None else found[1]
+
+    # Total value on the last trading day
+    def latest(self):
+        if not len(self._totals):
+            return None
+        return int(self._dates[-1]), float(self._totals[-1])
+
+    def __repr__(self):
+        return f"PortfolioValuation({len(self._symbols)} stocks, {len(self)} days)"
+
+
+def _ordinal(date):
+    return date if isinstance(date, int) else date.toordinal()
+
+
+# (date ordinal, close) of the last row on or before `date` in a PriceHistory, or None
+def price_as_of(history, date):
+    dates = history.dates
+    i = bisect_right(dates, _ordinal(date)) - 1
+    if i < 0:
+        return None
+    return dates[i], history.closes[i]
+
+
+def _valuation_key(stock_list):
+    return [(stock.symbol, stock.shares, stock.DataList, stock.DataList.version) for stock in stock_list]
+
+
+# Valuation of the portfolio, reused while no stock's shares or history changed
+def portfolio_valuation(stock_list):
+    global _last_valuation
+    key = _valuation_key(stock_list)
+    if _last_valuation is not None and _last_valuation[0] == key:
+        return _last_valuation[1]
+    valuation = PortfolioValuation(stock_list)
+    _last_valuation = (key, valuation)
+    return valuation
+
+
+# Copy of one stock's history columns, for PortfolioSnapshot
+class _HistoryCopy:
+    __slots__ = ("dates", "closes")
+
+    def __init__(self, history):
+        self.dates = history.dates[:]
+        self.closes = history.closes[:]
+
+    def __len__(self):
+        return len(self.dates)
+
+
+# Copy of one stock's symbol, shares and history, for PortfolioSnapshot
+class _StockCopy:
+    __slots__ = ("symbol", "shares", "DataList")
+
+    def __init__(self, stock):
+        self.symbol = stock.symbol
+        self.shares = stock.shares
+        self.DataList = _HistoryCopy(stock.DataList)
+
+
+# What valuing a portfolio reads, copied, so value_snapshot() can run on a
+# worker thread while the portfolio's histories keep changing (numpy would
+# otherwise hold views on the history arrays, and growing an array that is
+# viewed raises BufferError). Take the snapshot on the thread that owns the
+# portfolio.
+class PortfolioSnapshot:
+    def __init__(self, stock_list):
+        self.key = _valuation_key(stock_list)
+        self.stocks = [_StockCopy(stock) for stock in stock_list]
+
+
+# Value a PortfolioSnapshot (on any thread). The result is what
+# portfolio_valuation() and cached_valuation() then reuse for the portfolio the
+# snapshot was taken from, until it changes.
+def value_snapshot(snapshot):
+    global _last_valuation
+    valuation = PortfolioValuation(snapshot.stocks)
+    _last_valuation = (snapshot.key, valuation)
+    return valuation
+
+
+# The valuation portfolio_valuation() would reuse for stock_list, or None if it
+# has to be computed again (this never computes it)
+def cached_valuation(stock_list):
+    last = _last_valuation
+    if last is not None and last[0] == _valuation_key(stock_list):
+        return last[1]
+    return None
+
+
+# Report lines for the portfolio as of a date (None = the last trading day):
+# one line per stock with its close on or before that date, then the total
+def valuation_report(stock_list, date=None):
+    valuation = portfolio_valuation(stock_list)
+    if date is None:
+        found = valuation.latest()
+    else:
+        found = valuation.as_of(date)
+    if found is None:
+        return ["No price history on or before that date."]
+    as_of_date, total = found
+    heading = datetime.fromordinal(as_of_date).strftime("%m/%d/%y")
+    lines = []
+    for stock in stock_list:
+        line = f"{stock.symbol} - {stock.name} - {stock.shares} shares"
+        price = price_as_of(stock.DataList, as_of_date) if len(stock.DataList) else None
+        if price is not None:
+            line += f" | Price: ${price[1]:0.2f} | Value: ${stock.shares * price[1]:0,.2f}"
+        lines.append(line)
+    lines.append("")
+    lines.append(f"Portfolio value as of {heading}: ${total:0,.2f}")
+    return lines
@@ -0,0 +1,507 @@
+# Summary: This module contains the web retrieval engine used by stock_data.retrieve_stock_web().
+# History pages are downloaded by a pluggable Fetcher, several symbols at a time, and the price
+# history table in each page is parsed into rows. Three fetchers are available:
+#   "async"    - asyncio, many requests in flight over pooled keep-alive connections (default)
+#   "http"     - plain HTTP on a thread pool, one keep-alive connection per thread
+#   "selenium" - a pool of Chrome drivers, for when the plain HTML is not enough
+
+import asyncio
+import gzip
+import http.client
+import queue
+import ssl
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from urllib.parse import urljoin, urlsplit
+
+# History page address; point this at another server (e.g. a local stub) if needed
+HISTORY_URL = "https://finance.yahoo.com/quote/{symbol}/history?period1={period1}&period2={period2}&interval=1d&filter=history&frequency=1d"
+
+DEFAULT_FETCHER = "async"
+
+REQUEST_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml",
+    "Accept-Encoding": "gzip, deflate",
+}
+REQUEST_TIMEOUT = 30
+MAX_REDIRECTS = 5
+
+
+# Address of the daily history page for one symbol (period is in epoch seconds)
+def history_url(symbol, period1, period2):
+    return HISTORY_URL.format(symbol=symbol, period1=period1, period2=period2)
+
+
+class FetchError(Exception):
+    pass
+
+
+# Base class for page fetchers. A fetcher downloads pages with fetch(url) and
+# fetch_all(urls), which yields (url, html, error) tuples as pages finish, in
+# whatever order they finish; error is None on success. Subclasses only have to
+# provide fetch(); the default fetch_all() runs it on a pool of `workers`
+# threads. Use a fetcher in a with block so close() releases its connections.
+class Fetcher:
+    def __init__(self, workers=4):
+        self.workers = max(1, workers)
+
+    def fetch(self, url):
+        raise NotImplementedError
+
+    def fetch_all(self, urls):
+        executor = ThreadPoolExecutor(max_workers=min(self.workers, max(1, len(urls))))
+        try:
+            futures = {executor.submit(self.fetch, url): url for url in urls}
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:
+                    yield futures[future], None, e
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+# Start a Chrome driver set up for fetching static history pages.
+# Note this code assumes the use of the Chrome browser.
+# You will have to modify if you are using a different browser.
+def new_chrome_driver():
+    from selenium import webdriver
+    options = webdriver.ChromeOptions()
+    options.add_experimental_option('excludeSwitches',['enable-logging'])
+    options.add_experimental_option("prefs",{'profile.managed_default_content_settings.javascript': 2})
+    try:
+        driver = webdriver.Chrome(options=options)
+    except Exception:
+        raise RuntimeWarning("Chrome Driver Not Found")
+    driver.set_page_load_timeout(30)
+    return driver
+
+
+# A bounded pool of browser drivers. Drivers are started on demand (up to
+# size of them), handed back after each page and reused for the next symbol.
+# close() quits every driver; use the pool in a with block so that happens
+# even when retrieval fails.
+class DriverPool:
+    def __init__(self, size, factory=new_chrome_driver):
+        self._size = size
+        self._factory = factory
+        self._idle = queue.LifoQueue()
+        self._drivers = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @property
+    def size(self):
+        return self._size
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Driver pool is closed")
+            start_new = len(self._drivers) < self._size
+            if start_new:
+                self._drivers.append(None) # reserve the slot while the driver starts
+        if not start_new:
+            return self._idle.get()
+        try:
+            driver = self._factory()
+        except BaseException:
+            with self._lock:
+                self._drivers.remove(None)
+            raise
+        with self._lock:
+            self._drivers[self._drivers.index(None)] = driver
+        return driver
+
+    def _discard(self, driver):
+        with self._lock:
+            if driver in self._drivers:
+                self._drivers.remove(driver)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    # Borrow a driver for one page. A driver that raised is quit and replaced
+    # next time rather than handed to another symbol.
+    @contextmanager
+    def driver(self):
+        driver = self._acquire()
+        try:
+            yield driver
+        except BaseException:
+            self._discard(driver)
+            raise
+        else:
+            self._idle.put(driver)
+
+    # Fetch one page with a pooled driver and return its HTML
+    def fetch(self, url):
+        with self.driver() as driver:
+            driver.get(url)
+            return driver.page_source
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            drivers = [driver for driver in self._drivers if driver is not None]
+            self._drivers = []
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+# Fetcher that renders pages in pooled Chrome drivers
+class SeleniumFetcher(Fetcher):
+    def __init__(self, workers=4):
+        super().__init__(workers)
+        self._pool = DriverPool(self.workers)
+
+    def fetch(self, url):
+        return self._pool.fetch(url)
+
+    def close(self):
+        self._pool.close()
+
+
+# Turn a raw HTTP response body into text
+def _decode_body(headers, body):
+    encoding = headers.get("content-encoding", "").lower()
+    if encoding == "gzip":
+        body = gzip.decompress(body)
+    elif encoding == "deflate":
+        body = zlib.decompress(body)
+    charset = "utf-8"
+    for part in headers.get("content-type", "").split(";"):
+        part = part.strip()
+        if part.lower().startswith("charset="):
+            charset = part[8:].strip('"')
+    return body.decode(charset, errors="replace")
+
+
+def _target(url):
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+    return (parts.scheme, parts.hostname, port), path
+
+
+# Fetcher that downloads the static HTML with http.client. Each worker thread
+# keeps one keep-alive connection per host.
+class HttpFetcher(Fetcher):
+    def __init__(self, workers=4):
+        super().__init__(workers)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def _connection(self, key):
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+        conn = connections.get(key)
+        if conn is None:
+            scheme, host, port = key
+            if scheme == "https":
+                conn = http.client.HTTPSConnection(host, port, timeout=REQUEST_TIMEOUT, context=ssl.create_default_context())
+            else:
+                conn = http.client.HTTPConnection(host, port, timeout=REQUEST_TIMEOUT)
+            connections[key] = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    # Close a connection a request failed on and forget it, so the thread's
+    # next request to that host opens a fresh one
+    def _discard(self, key, conn):
+        conn.close()
+        self._local.connections.pop(key, None)
+        with self._lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+
+    def _get(self, url):
+        key, path = _target(url)
+        for attempt in (1, 2):
+            conn = self._connection(key)
+            try:
+                conn.request("GET", path, headers=REQUEST_HEADERS)
+                response = conn.getresponse()
+                body = response.read()
+            except (http.client.RemoteDisconnected, ConnectionError, http.client.BadStatusLine):
+                # the server dropped an idle keep-alive connection; reconnect once
+                self._discard(key, conn)
+                if attempt == 2:
+                    raise
+                continue
+            except BaseException:
+                # a timeout or any other failure leaves the connection in the
+                # middle of a request, where it cannot send another one
+                self._discard(key, conn)
+                raise
+            headers = {name.lower(): value for name, value in response.getheaders()}
+            if response.will_close:
+                conn.close()
+            return response.status, headers, body
+
+    def fetch(self, url):
+        for _ in range(MAX_REDIRECTS + 1):
+            status, headers, body = self._get(url)
+            if status in (301, 302, 303, 307, 308) and "location" in headers:
+                url = urljoin(url, headers["location"])
+                continue
+            if status >= 400:
+                raise FetchError(f"HTTP {status}")
+            return _decode_body(headers, body)
+        raise FetchError("Too many redirects")
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+
+
+# Fetcher that runs every request on one asyncio event loop. Up to `workers`
+# requests are in flight at once and connections are kept alive and reused
+# between requests to the same host. The loop runs on a background thread so
+# fetch_all() can hand pages back while later ones are still downloading.
+class AsyncHttpFetcher(Fetcher):
+    def fetch(self, url):
+        for _, html, error in self.fetch_all([url]):
+            if error is not None:
+                raise error
+            return html
+
+    def fetch_all(self, urls):
+        results = queue.Queue()
+        stop = threading.Event()
+        done = object()
+
+        def run():
+            try:
+                asyncio.run(self._fetch_all(urls, results, stop))
+            finally:
+                results.put(done)
+
+        thread = threading.Thread(target=run, name="AsyncHttpFetcher", daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = results.get()
+                if item is done:
+                    break
+                yield item
+        finally:
+            stop.set()
+            thread.join()
+
+    async def _fetch_all(self, urls, results, stop):
+        pool = _AsyncConnectionPool()
+        limit = asyncio.Semaphore(self.workers)
+
+        async def fetch_one(url):
+            async with limit:
+                if stop.is_set():
+                    return
+                try:
+                    html = await asyncio.wait_for(self._fetch(pool, url), REQUEST_TIMEOUT)
+                except Exception as e:
+                    if isinstance(e, asyncio.TimeoutError):
+                        e = FetchError("Timed out")
+                    results.put((url, None, e))
+                else:
+                    results.put((url, html, None))
+
+        try:
+            await asyncio.gather(*(fetch_one(url) for url in urls))
+        finally:
+            pool.close()
+
+    async def _fetch(self, pool, url):
+        for _ in range(MAX_REDIRECTS + 1):
+            status, headers, body = await pool.get(url)
+            if status in (301, 302, 303, 307, 308) and "location" in headers:
+                url = urljoin(url, headers["location"])
+                continue
+            if status >= 400:
+                raise FetchError(f"HTTP {status}")
+            return _decode_body(headers, body)
+        raise FetchError("Too many redirects")
+
+
+# Idle keep-alive connections for the asyncio fetcher, by (scheme, host, port)
+class _AsyncConnectionPool:
+    def __init__(self):
+        self._idle = {}
+
+    async def _open(self, key):
+        scheme, host, port = key
+        if scheme == "https":
+            return await asyncio.open_connection(host, port, ssl=ssl.create_default_context(), server_hostname=host)
+        return await asyncio.open_connection(host, port)
+
+    async def get(self, url):
+        key, path = _target(url)
+        idle = self._idle.setdefault(key, [])
+        while True:
+            reused = bool(idle)
+            reader, writer = idle.pop() if reused else await self._open(key)
+            try:
+                status, headers, body, keep_alive = await _http_get(reader, writer, key[1], path)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if reused:
+                    continue # the server closed an idle connection; try another
+                raise
+            except BaseException:
+                # cancelled by a timeout or failed mid-response: the connection
+                # is in an unknown state, so close it rather than reuse it
+                writer.close()
+                raise
+            if keep_alive:
+                idle.append((reader, writer))
+            else:
+                writer.close()
+            return status, headers, body
+
+    def close(self):
+        for connections in self._idle.values():
+            for _, writer in connections:
+                writer.close()
+        self._idle = {}
+
+
+# Send one GET on an open connection and read the response.
+# Returns (status, headers, body, connection can be reused).
+async def _http_get(reader, writer, host, path):
+    request = f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n"
+    for name, value in REQUEST_HEADERS.items():
+        request += f"{name}: {value}\r\n"
+    writer.write((request + "\r\n").encode("latin-1"))
+    await writer.drain()
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError("Connection closed by server")
+    parts = status_line.decode("latin-1").split(None, 2)
+    version, status = parts[0], int(parts[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+        body = b"".join(chunks)
+    elif "content-length" in headers:
+        body = await reader.readexactly(int(headers["content-length"]))
+    else:
+        body = await reader.read()
+        keep_alive = False
+    return status, headers, body, keep_alive
+
+
+FETCHERS = {
+    "async": AsyncHttpFetcher,
+    "http": HttpFetcher,
+    "selenium": SeleniumFetcher,
+}
+
+
+# Context manager giving a ready fetcher. `fetcher` is a name from FETCHERS,
+# None for DEFAULT_FETCHER, or a Fetcher the caller owns (left open).
+def open_fetcher(fetcher=None, workers=4):
+    if fetcher is None:
+        fetcher = DEFAULT_FETCHER
+    if isinstance(fetcher, str):
+        if fetcher not in FETCHERS:
+            raise ValueError("Unknown fetcher: " + fetcher)
+        return FETCHERS[fetcher](workers)
+    return nullcontext(fetcher)
+
+
+# Parse the rows of a Yahoo! Finance history page into
+# (date ordinal, close, volume) tuples, in the order they appear on the page.
+def parse_history_page(html):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html,"html.parser")
+    rows = []
+    for row in soup.find_all('tr'):
+        rowList = [td.text for td in row.find_all('td')]
+        if len(rowList) == 7: # This row is a standard data row (otherwise it's a special case such as dividend which will be ignored)
+            try:
+                rows.append((datetime.strptime(rowList[0],"%b %d, %Y").toordinal(),
+                             float(rowList[5].replace(',','')),
+                             float(rowList[6].replace(',',''))))
+            except ValueError:
+                continue # placeholder values such as "-" on days without trading
+    return rows
+
+
+# Outcome of a retrieval run: rows retrieved per symbol and the symbols that failed
+class RetrievalReport:
+    def __init__(self, total):
+        self.total = total
+        self.record_counts = {} # symbol -> rows retrieved
+        self.failures = {}      # symbol -> error message
+        self.up_to_date = []    # symbols skipped because nothing was missing
+
+    @property
+    def record_count(self):
+        return sum(self.record_counts.values())
+
+    # Symbols finished so far (a symbol fetched in several pieces counts once)
+    @property
+    def completed(self):
+        return len(self.record_counts.keys() | self.failures.keys()) + len(self.up_to_date)
+
+    def summary(self):
+        text = f"{self.record_count} records retrieved for {len(self.record_counts)} of {self.total} symbols."
+        if self.up_to_date:
+            text += f" {len(self.up_to_date)} already up to date."
+        for symbol, message in self.failures.items():
+            text += f"\n  {symbol}: {message}"
+        return text
+
+    def __repr__(self):
+        return f"RetrievalReport({self.record_count} records, {len(self.failures)} failures)"
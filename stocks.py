@@ -1,17 +1,23 @@
 # Summary: This module is just a shorter name for the program that can start either the Console or GUI version of the program.
+# With arguments it runs the batch command line instead (see stock_cli), e.g. `python stocks.py report`.
 
-import stock_console
-import stock_GUI
+import sys
 
 def main():
+    if len(sys.argv) > 1:
+        import stock_cli
+        return stock_cli.main(sys.argv[1:])
+
     #For Console Version
+    #import stock_console
     #stock_console.main()
 
     #For GUI Version
+    import stock_GUI
     stock_GUI.main()
-    return
+    return 0
 
 # Program Starts Here
 if __name__ == "__main__":
     # execute only if run as a script
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
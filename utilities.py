@@ -1,5 +1,5 @@
 from os import system, name
-import matplotlib.pyplot as plt
+from stock_class import find_stock
 
 
 # Function to Clear the Screen
@@ -11,61 +11,37 @@ def clear_screen():
 
 
 # Function to sort the stock list (alphabetical by symbol)
+# list.sort() is stable and linear on a list that is already in order.
 def sortStocks(stock_list):
-    n = len(stock_list)
-    for i in range(n):
-        for j in range(0, n - i - 1):
-            if stock_list[j].symbol > stock_list[j + 1].symbol:
-                temp = stock_list[j]
-                stock_list[j] = stock_list[j + 1]
-                stock_list[j + 1] = temp
+    stock_list.sort(key=_stock_symbol)
+
+
+def _stock_symbol(stock):
+    return stock.symbol
 
 
 # Function to sort each stock's daily data by date (oldest first)
+# Histories keep themselves in date order, so this only does work for a
+# history that has out-of-order rows pending.
 def sortDailyData(stock_list):
     for stock in stock_list:
-        n = len(stock.DataList)
-        for i in range(n):
-            for j in range(0, n - i - 1):
-                if stock.DataList[j].date > stock.DataList[j + 1].date:
-                    temp = stock.DataList[j]
-                    stock.DataList[j] = stock.DataList[j + 1]
-                    stock.DataList[j + 1] = temp
+        stock.DataList.sort()
 
 
 # Function to create stock price chart
 def display_stock_chart(stock_list, symbol):
     # find the stock object
-    chosen_stock = None
-    for stock in stock_list:
-        if stock.symbol.upper() == symbol.upper():
-            chosen_stock = stock
-            break
+    chosen_stock = find_stock(stock_list, symbol.upper())
 
     if chosen_stock is None:
         print("Symbol not found.")
         return
 
-    # sort daily data by date
-    sortDailyData(stock_list)
-
     if len(chosen_stock.DataList) == 0:
         print("No data available to chart.")
         return
 
-    # Build dates list 
-    dates = []
-    closes = []
-    for daily in chosen_stock.DataList:
-        dates.append(daily.date)
-        closes.append(daily.close)
-
-    # Plot
-    plt.figure(figsize=(10, 5))
-    plt.plot(dates, closes, marker="o")
-    plt.title(chosen_stock.symbol + " Closing Price History")
-    plt.xlabel("Date")
-    plt.ylabel("Closing Price")
-    plt.grid(True)
-    plt.tight_layout()
-    plt.show()
+    # Plot (downsampled to the window's resolution, see stock_chart). matplotlib
+    # is only imported once a chart is actually wanted.
+    import stock_chart
+    stock_chart.show_stock_chart(chosen_stock)